@@ -0,0 +1,430 @@
+"""Async (ASGI) serving mode: non-blocking translate/batch routes, Flask app for the rest.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/api/translate, /api/translate/stream and /api/batch await the upstream with
+openai.AsyncOpenAI, so one process can hold many in-flight translations
+without a thread each. Every other route (TTS, health, context, pages) is
+served by the Flask app from main.py on a thread pool, which keeps CPU-bound
+TTS off the event loop. State (contexts, caches, TTS models) is shared.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+import openai
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import main
+from main import (
+    OPENAI_MODEL, OPENAI_HTTP_OPTIONS, FUNCTIONS, BATCH_ITEM_TIMEOUT, BATCH_MAX_WORKERS, BATCH_PACKED_DEFAULT,
+    stored_reply, prompt_token_stats, upstream_retry, upstream_breaker, upstream_error_response,
+    prepare_translation, finish_translation, append_tool_result, merge_tool_call_deltas, sse_event, batch_item_request, finish_batch_item,
+    batch_languages, log_fields, add_usage, prefetch_reply_audio, audio_prefetch_fields, TTS_PREFETCH,
+    packed_group_messages, parse_packed_reply, plan_packed_batch, apply_packed_chunk
+)
+from metrics import REQUEST_SECONDS, BATCH_SIZE
+from structured_logging import StageTimer
+from upstream import create_openai_client, DeadlineExceeded
+
+async_client = create_openai_client(
+    os.getenv("OPENAI_ENDPOINT", ""),
+    os.getenv("OPENAI_API_KEY", ""),
+    async_client=True,
+    **OPENAI_HTTP_OPTIONS
+)
+
+# Threads serving the Flask (WSGI) routes, including TTS synthesis
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+
+# Bounds concurrent upstream batch calls per process, like main.batch_executor
+batch_semaphore = asyncio.Semaphore(BATCH_MAX_WORKERS)
+
+
+class RequestMetricsMiddleware:
+    """Observe async route latency until the last byte, like main.py's request hooks"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                route=scope["path"],
+                method=scope["method"],
+                status=status,
+                lang_pair=scope.get("state", {}).get("lang_pair", "none")
+            )
+
+
+route_middleware = [
+    Middleware(RequestMetricsMiddleware),
+    Middleware(CORSMiddleware, allow_origins=main.CORS_ORIGINS, allow_methods=["POST"], allow_headers=["*"])
+]
+
+
+async def read_json(request):
+    """Parse the request body as JSON regardless of Content-Type, or None if invalid"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def translate_stream_response(request, data, req_id, start_time):
+    ctx, error = await run_in_threadpool(prepare_translation, data)
+    if error:
+        return JSONResponse({"error": error[0]}, status_code=error[1])
+    request.state.lang_pair = f"{ctx['detected_lang']}->{ctx['target_lang']}"
+    return StreamingResponse(
+        stream_translation(ctx, req_id, start_time, request.url.path),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def stream_translation(ctx, req_id, start_time, route):
+    """Async counterpart of main.stream_translation (same SSE events)"""
+    timer = StageTimer()
+    yield sse_event("meta", {
+        "detected_lang": ctx["detected_lang"],
+        "target_lang": ctx["target_lang"],
+        "request_id": req_id
+    })
+
+    try:
+        with timer.stage("cache"):
+            reply = await run_in_threadpool(stored_reply, ctx)
+        cache_hit = reply is not None
+
+        if cache_hit:
+            yield sse_event("delta", {"content": reply})
+        else:
+            prompt_token_stats.record(ctx["prompt_tokens"])
+            openai_messages = ctx["openai_messages"]
+            tools = [{"type": "function", "function": func} for func in FUNCTIONS]
+            parts = []
+            for turn in range(2):
+                # Opening the stream is retried; a stream that fails midway is not
+                stream_kwargs = {"tools": tools, "tool_choice": "auto"} if turn == 0 else {}
+                stream = await upstream_retry.acall(
+                    async_client.chat.completions.create,
+                    label="translate_stream" if turn == 0 else "translate_followup",
+                    model=OPENAI_MODEL,
+                    messages=openai_messages,
+                    stream=True,
+                    timeout=15,
+                    temperature=0.3,
+                    **stream_kwargs
+                )
+
+                tool_calls = {}
+                turn_content = []
+                sent = 0  # leading turn_content entries already relayed to the client
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        merge_tool_call_deltas(tool_calls, delta.tool_calls)
+                    if delta.content:
+                        turn_content.append(delta.content)
+                        if not tool_calls:
+                            if "first_delta" not in timer.stages:
+                                timer.add("first_delta", time.perf_counter() - timer.started)
+                            yield sse_event("delta", {"content": delta.content})
+                            sent = len(turn_content)
+
+                if not tool_calls:
+                    parts.extend(turn_content)
+                    break
+                # Text relayed before the tool call started is already on screen, so it
+                # stays part of the reply (and the saved history) the client ends up with
+                parts.extend(turn_content[:sent])
+                append_tool_result(openai_messages, "".join(turn_content) or None,
+                                   [tool_calls[index] for index in sorted(tool_calls)])
+            reply = "".join(parts)
+
+        with timer.stage("save"):
+            await run_in_threadpool(finish_translation, ctx, reply, cache_hit)
+        audio_keys = prefetch_reply_audio(reply, ctx["target_lang"]) if TTS_PREFETCH else None
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.info(f"{req_id} {start_time.isoformat()} 200 stream {latency_ms}ms lang:{ctx['detected_lang']}->{ctx['target_lang']} prompt_tokens:{ctx['prompt_tokens']}",
+                     extra=log_fields(req_id, route, status=200, stream=True, source_lang=ctx["detected_lang"],
+                                      target_lang=ctx["target_lang"], prompt_tokens=ctx["prompt_tokens"],
+                                      cached=cache_hit, translation_memory=ctx["memory_result"],
+                                      audio_prefetch=audio_keys is not None,
+                                      latency_ms=latency_ms, stages_ms=timer.as_dict()))
+        done = {
+            "reply": reply,
+            "detected_lang": ctx["detected_lang"],
+            "target_lang": ctx["target_lang"],
+            "request_id": req_id,
+            "latency_ms": latency_ms,
+            "cached": cache_hit
+        }
+        if ctx["memory_exact"] is not None:
+            done["translation_memory"] = True
+        done.update(audio_prefetch_fields(audio_keys))
+        yield sse_event("done", done)
+
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} {start_time.isoformat()} STREAM ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, route, status=200, stream=True, error=type(ex).__name__, latency_ms=latency_ms))
+        error = upstream_error_response(req_id, ex)
+        yield sse_event("error", {"error": error[0] if error else "Lỗi máy chủ nội bộ.", "request_id": req_id})
+
+
+async def translate_stream(request):
+    """Translate a message, streaming the reply as Server-Sent Events"""
+    req_id = str(uuid.uuid4())
+    start_time = datetime.utcnow()
+
+    try:
+        data = await read_json(request)
+        if data is None:
+            return JSONResponse({"error": "JSON không hợp lệ."}, status_code=400)
+        return await translate_stream_response(request, data, req_id, start_time)
+
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} {start_time.isoformat()} ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, request.url.path, status=500, error=type(ex).__name__, latency_ms=latency_ms))
+        return JSONResponse({"error": "Lỗi máy chủ nội bộ."}, status_code=500)
+
+
+async def translate(request):
+    req_id = str(uuid.uuid4())
+    start_time = datetime.utcnow()
+    timer = StageTimer()
+
+    try:
+        data = await read_json(request)
+        if data is None:
+            return JSONResponse({"error": "JSON không hợp lệ."}, status_code=400)
+        if isinstance(data, dict) and data.get("stream") is True:
+            return await translate_stream_response(request, data, req_id, start_time)
+
+        with timer.stage("prepare"):
+            ctx, error = await run_in_threadpool(prepare_translation, data)
+        if error:
+            return JSONResponse({"error": error[0]}, status_code=error[1])
+        request.state.lang_pair = f"{ctx['detected_lang']}->{ctx['target_lang']}"
+        openai_messages = ctx["openai_messages"]
+        detected_lang = ctx["detected_lang"]
+        target_lang = ctx["target_lang"]
+
+        with timer.stage("cache"):
+            reply = await run_in_threadpool(stored_reply, ctx)
+        cache_hit = reply is not None
+        usage = {}
+
+        if not cache_hit:
+            prompt_token_stats.record(ctx["prompt_tokens"])
+            # Each call is retried by upstream_retry (429/5xx, backoff + jitter)
+            try:
+                with timer.stage("upstream"):
+                    response = await upstream_retry.acall(
+                        async_client.chat.completions.create,
+                        label="translate",
+                        model=OPENAI_MODEL,
+                        messages=openai_messages,
+                        tools=[{"type": "function", "function": func} for func in FUNCTIONS],
+                        tool_choice="auto",
+                        timeout=15,
+                        temperature=0.3
+                    )
+                add_usage(usage, response)
+
+                message_obj = response.choices[0].message
+
+                # Handle function calling
+                if message_obj.tool_calls:
+                    tool_calls = [tool_call.model_dump() for tool_call in message_obj.tool_calls]
+                    append_tool_result(openai_messages, message_obj.content, tool_calls)
+
+                    with timer.stage("upstream"):
+                        final_response = await upstream_retry.acall(
+                            async_client.chat.completions.create,
+                            label="translate_followup",
+                            model=OPENAI_MODEL,
+                            messages=openai_messages,
+                            timeout=15,
+                            temperature=0.3
+                        )
+                    add_usage(usage, final_response)
+                    reply = final_response.choices[0].message.content
+                else:
+                    reply = message_obj.content
+
+            except Exception as e:
+                error = upstream_error_response(req_id, e)
+                if error is None:
+                    raise
+                return JSONResponse({"error": error[0]}, status_code=error[1])
+
+        with timer.stage("save"):
+            await run_in_threadpool(finish_translation, ctx, reply, cache_hit)
+        audio_keys = prefetch_reply_audio(str(reply), target_lang) if TTS_PREFETCH else None
+
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.info(f"{req_id} {start_time.isoformat()} 200 {latency_ms}ms lang:{detected_lang}->{target_lang} prompt_tokens:{ctx['prompt_tokens']}",
+                     extra=log_fields(req_id, request.url.path, status=200, source_lang=detected_lang,
+                                      target_lang=target_lang, prompt_tokens=ctx["prompt_tokens"], cached=cache_hit,
+                                      latency_ms=latency_ms, stages_ms=timer.as_dict(),
+                                      translation_memory=ctx["memory_result"],
+                                      audio_prefetch=audio_keys is not None, **usage))
+
+        result = {
+            "reply": str(reply),
+            "detected_lang": detected_lang,
+            "target_lang": target_lang,
+            "request_id": req_id,
+            "latency_ms": latency_ms,
+            "cached": cache_hit
+        }
+        if ctx["detect_confidence"] is not None:
+            result["detect_confidence"] = ctx["detect_confidence"]
+        if ctx["memory_exact"] is not None:
+            result["translation_memory"] = True
+        result.update(audio_prefetch_fields(audio_keys))
+        return JSONResponse(result)
+
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} {start_time.isoformat()} ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, request.url.path, status=500, error=type(ex).__name__, latency_ms=latency_ms))
+        return JSONResponse({"error": "Lỗi máy chủ nội bộ."}, status_code=500)
+
+
+async def translate_batch_item(item, detected_lang=None):
+    """Async counterpart of main.translate_batch_item"""
+    try:
+        result, job = await run_in_threadpool(batch_item_request, item, detected_lang)
+        if job is None:
+            return result
+
+        # The deadline starts once a slot is held, so time queued behind other items does not count
+        async with batch_semaphore:
+            response = await asyncio.wait_for(upstream_retry.acall(
+                async_client.chat.completions.create,
+                label="batch",
+                deadline=time.monotonic() + BATCH_ITEM_TIMEOUT,
+                model=OPENAI_MODEL,
+                messages=job["messages"],
+                temperature=0.3
+            ), BATCH_ITEM_TIMEOUT)
+        return await run_in_threadpool(finish_batch_item, job, response.choices[0].message.content)
+
+    except (asyncio.TimeoutError, DeadlineExceeded, openai.APITimeoutError):
+        return {"id": item.get("id"), "error": "Quá thời gian xử lý"}
+    except Exception as e:
+        return {"id": item.get("id"), "error": str(e)}
+
+
+async def run_batch_items(items):
+    """Translate items concurrently, collecting results in input order"""
+    return list(await asyncio.gather(*(translate_batch_item(item, language)
+                                       for item, language in zip(items, batch_languages(items)))))
+
+
+async def translate_packed_group(source_lang, target_lang, texts, hints=""):
+    BATCH_SIZE.observe(len(texts), kind="translate_packed")
+    async with batch_semaphore:
+        response = await asyncio.wait_for(upstream_retry.acall(
+            async_client.chat.completions.create,
+            label="batch_packed",
+            deadline=time.monotonic() + BATCH_ITEM_TIMEOUT,
+            model=OPENAI_MODEL,
+            messages=packed_group_messages(source_lang, target_lang, texts, hints),
+            temperature=0.3
+        ), BATCH_ITEM_TIMEOUT)
+    return parse_packed_reply(response.choices[0].message.content or "", len(texts))
+
+
+async def run_packed_batch(items):
+    """Async counterpart of main.run_packed_batch (same fallback rules)"""
+    results, chunks, fallback = await run_in_threadpool(plan_packed_batch, items)
+
+    replies = await asyncio.gather(*(
+        translate_packed_group(detected_lang, target_lang, [items[i]["text"] for i in indices], hints)
+        for detected_lang, target_lang, indices, _, hints in chunks
+    ), return_exceptions=True)
+
+    for chunk, translations in zip(chunks, replies):
+        if isinstance(translations, BaseException):
+            logging.warning(f"packed batch chunk failed, falling back per item: {type(translations).__name__}")
+            translations = None
+        if translations is None:
+            fallback.extend(chunk[2])
+            continue
+        await run_in_threadpool(apply_packed_chunk, items, results, chunk, translations)
+
+    if fallback:
+        fallback.sort()
+        for i, result in zip(fallback, await run_batch_items([items[i] for i in fallback])):
+            results[i] = result
+    return results
+
+
+async def batch_translate(request):
+    req_id = str(uuid.uuid4())
+    start_time = datetime.utcnow()
+
+    try:
+        data = await read_json(request)
+
+        if not isinstance(data, list) or len(data) > 50:
+            return JSONResponse({"error": "Batch tối đa 50 items."}, status_code=400)
+        if upstream_breaker.is_open():
+            return JSONResponse({"error": "Dịch vụ dịch đang quá tải, vui lòng thử lại sau."}, status_code=503)
+
+        mode = request.query_params.get("mode", "packed" if BATCH_PACKED_DEFAULT else "parallel")
+        BATCH_SIZE.observe(len(data), kind="translate_batch")
+        if mode == "packed":
+            results = await run_packed_batch(data)
+        else:
+            results = await run_batch_items(data)
+
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.info(f"{req_id} batch {len(results)} items mode:{mode} {latency_ms}ms",
+                     extra=log_fields(req_id, request.url.path, status=200, items=len(results), mode=mode,
+                                      latency_ms=latency_ms, cached=sum(1 for r in results if r.get("cached")),
+                                      errors=sum(1 for r in results if "error" in r)))
+        return JSONResponse({"results": results, "request_id": req_id, "mode": mode})
+
+    except Exception as ex:
+        logging.error(f"{req_id} batch ERROR {type(ex).__name__}",
+                      extra=log_fields(req_id, request.url.path, status=500, error=type(ex).__name__))
+        return JSONResponse({"error": "Lỗi xử lý batch."}, status_code=500)
+
+
+app = Starlette(routes=[
+    Route("/api/translate", translate, methods=["POST"], middleware=route_middleware),
+    Route("/api/translate/stream", translate_stream, methods=["POST"], middleware=route_middleware),
+    Route("/api/batch", batch_translate, methods=["POST"], middleware=route_middleware),
+    # Everything else (and CORS preflight for the routes above) goes to Flask
+    Mount("/", app=WSGIMiddleware(main.app, workers=ASGI_WSGI_THREADS))
+])
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of WAV post-processing: the previous scipy/BytesIO path vs
+the in-place encoder in audio_encoding.py.
+
+The waveform is synthetic (about the length a 500-character utterance
+produces at 16 kHz), so no model is needed. Reports the median time and the
+peak extra memory (tracemalloc) of waveform -> WAV bytes, alone and followed
+by the base64 step of the JSON response shape.
+
+Run: python audio_benchmark.py --seconds 35 --runs 50 --output audio_bench.json
+"""
+
+import argparse
+import base64
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+from audio_encoding import waveform_to_wav_bytes
+
+
+def legacy_wav_bytes(audio_data, sample_rate):
+    """The encoder this repo used before audio_encoding.py"""
+    import scipy.io.wavfile
+
+    audio_int16 = (audio_data * 32767).astype(numpy.int16)
+    buffer = io.BytesIO()
+    scipy.io.wavfile.write(buffer, sample_rate, audio_int16)
+    return buffer.getvalue()
+
+
+def make_waveform(seconds, sample_rate, seed=0):
+    """Speech-like test signal in [-1, 1] with a few out-of-range peaks"""
+    rng = numpy.random.default_rng(seed)
+    t = numpy.arange(int(seconds * sample_rate), dtype=numpy.float32) / sample_rate
+    waveform = 0.6 * numpy.sin(2 * numpy.pi * 180 * t) * numpy.sin(2 * numpy.pi * 3 * t)
+    waveform += 0.1 * rng.standard_normal(t.size).astype(numpy.float32)
+    waveform[::4000] = 1.2
+    return waveform.astype(numpy.float32)
+
+
+def measure(encoder, waveform, sample_rate, runs, with_base64=False):
+    """Median latency and tracemalloc peak of one encode (optionally + base64 for the JSON shape)"""
+    def run(data):
+        wav_bytes = encoder(data, sample_rate)
+        return base64.b64encode(wav_bytes) if with_base64 else wav_bytes
+
+    latencies = []
+    for _ in range(runs):
+        data = waveform.copy()  # the in-place encoder overwrites its input
+        t0 = time.perf_counter()
+        run(data)
+        latencies.append(time.perf_counter() - t0)
+
+    data = waveform.copy()
+    tracemalloc.start()
+    run(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "latency_ms_p50": round(statistics.median(latencies) * 1000, 3),
+        "latency_ms_min": round(min(latencies) * 1000, 3),
+        "peak_alloc_kb": round(peak / 1024, 1)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare WAV encoding paths (time and peak memory)")
+    parser.add_argument("--seconds", type=float, default=35.0, help="waveform length (35 s ~ 500 characters)")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--output", default=None, help="write the JSON result here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    waveform = make_waveform(args.seconds, args.sample_rate)
+
+    legacy = legacy_wav_bytes(waveform.copy(), args.sample_rate)
+    current = waveform_to_wav_bytes(waveform.copy(), args.sample_rate)
+    # Same bytes except where the old path wrapped clipped samples around
+    matching = numpy.mean(numpy.frombuffer(legacy, dtype=numpy.uint8)[:len(current)] ==
+                          numpy.frombuffer(bytes(current), dtype=numpy.uint8))
+
+    encoders = {"legacy": legacy_wav_bytes, "in_place": waveform_to_wav_bytes}
+    results = {
+        step: {name: measure(encoder, waveform, args.sample_rate, args.runs, with_base64=step == "encode_base64")
+               for name, encoder in encoders.items()}
+        for step in ("encode", "encode_base64")
+    }
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "machine": platform.machine(),
+            "samples": int(waveform.size),
+            "sample_rate": args.sample_rate,
+            "wav_bytes": len(current),
+            "runs": args.runs,
+            "matching_byte_share": round(float(matching), 5)
+        },
+        "results": results,
+        "speedup": {step: round(r["legacy"]["latency_ms_p50"] / r["in_place"]["latency_ms_p50"], 2)
+                    for step, r in results.items()},
+        "peak_alloc_ratio": {step: round(r["in_place"]["peak_alloc_kb"] / r["legacy"]["peak_alloc_kb"], 3)
+                             for step, r in results.items()}
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
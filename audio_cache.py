@@ -0,0 +1,153 @@
+"""Content-addressed cache of synthesized audio (memory LRU tier + WAV files on disk)"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+AUDIO_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def make_audio_key(text, language, model_name, sample_rate):
+    """Hash of everything that determines the synthesized waveform"""
+    raw = "\x1f".join([language, model_name, str(sample_rate), text])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Two-tier audio cache keyed by make_audio_key.
+
+    The memory tier is an LRU bounded by total bytes; the disk tier stores
+    one WAV file per key under `directory` and is pruned when it grows past
+    `max_disk_bytes`, least recently used first: a disk hit refreshes the
+    file's mtime (memory hits do not touch the disk). Disk hits are promoted
+    to memory.
+    """
+    PRUNE_EVERY = 50
+
+    def __init__(self, directory="cache/audio", max_memory_bytes=64 * 1024 * 1024,
+                 max_disk_bytes=1024 * 1024 * 1024, disk_enabled=True):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_enabled = disk_enabled
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.wav")
+
+    def get(self, key):
+        """Return cached WAV bytes for a key, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        data = None
+        if self.disk_enabled:
+            path = self.path_for(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                # Pruning goes by mtime, so mark the file as recently used
+                os.utime(path)
+            except OSError:
+                pass
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, data)
+        return data
+
+    def contains(self, key):
+        """Whether audio for a key is cached (does not count as a lookup)"""
+        with self._lock:
+            if key in self._memory:
+                return True
+        return self.disk_enabled and os.path.exists(self.path_for(key))
+
+    def put(self, key, data):
+        """Store WAV bytes in both tiers"""
+        self._remember(key, data)
+        if not self.disk_enabled:
+            return
+        path = self.path_for(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see partial audio; the
+            # name is unique per process and thread (workers share the directory)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Audio cache disk write failed for {key}: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune_disk()
+
+    def _remember(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _prune_disk(self):
+        """Delete the least recently used WAV files until the disk tier fits max_disk_bytes"""
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".wav"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
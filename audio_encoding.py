@@ -0,0 +1,146 @@
+"""Waveform post-processing and audio encoding for the TTS endpoints.
+
+WAV encoding scales and clips the float waveform in place and writes the
+16-bit samples straight into a preallocated bytearray behind a hand-written
+44-byte header, so one buffer holds the finished file (no scipy, no BytesIO
+copy). Resampling and compressed formats (OGG Opus/Vorbis, FLAC) are built
+on top of that PCM data.
+"""
+import io
+import math
+import struct
+
+import numpy
+
+from metrics import TTS_STAGE_SECONDS
+
+WAV_HEADER_SIZE = 44
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+OUTPUT_SAMPLE_RATES = (8000, 16000, 22050, 24000, 44100, 48000)
+AUDIO_CONTENT_TYPES = {"wav": "audio/wav", "ogg": "audio/ogg", "flac": "audio/flac"}
+
+
+def write_wav_header(buffer, num_samples, sample_rate, channels=1, bits_per_sample=16):
+    """Write a canonical PCM WAV header into the first 44 bytes of `buffer`"""
+    block_align = channels * bits_per_sample // 8
+    data_size = num_samples * block_align
+    struct.pack_into(
+        "<4sI4s4sIHHIIHH4sI", buffer, 0,
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits_per_sample,
+        b"data", data_size
+    )
+
+
+def float_to_pcm16_into(waveform, out):
+    """Scale a float waveform to int16 into `out`, clipping instead of wrapping.
+
+    Works in place on `waveform` when it is a writable float32 array (it is
+    overwritten); other inputs are converted once first.
+    """
+    samples = numpy.asarray(waveform)
+    if samples.dtype != numpy.float32 or not samples.flags.writeable:
+        samples = samples.astype(numpy.float32)
+    numpy.multiply(samples, 32767.0, out=samples)
+    numpy.clip(samples, -32768.0, 32767.0, out=samples)
+    numpy.copyto(out, samples, casting="unsafe")
+    return out
+
+
+def waveform_to_wav_bytes(audio_data, sample_rate, language="unknown"):
+    """Encode a mono float waveform as a 16-bit PCM WAV file in a single bytearray.
+
+    The waveform is scaled in place, so pass a copy if it is still needed.
+    """
+    with TTS_STAGE_SECONDS.time(stage="encode", language=language):
+        samples = numpy.asarray(audio_data).reshape(-1)
+        buffer = bytearray(WAV_HEADER_SIZE + 2 * samples.size)
+        write_wav_header(buffer, samples.size, int(sample_rate))
+        pcm = numpy.frombuffer(buffer, dtype="<i2", offset=WAV_HEADER_SIZE, count=samples.size)
+        float_to_pcm16_into(samples, pcm)
+        return buffer
+
+
+def read_wav(wav_bytes):
+    """Return (sample_rate, int16 samples) of a 16-bit PCM WAV without copying the samples"""
+    view = memoryview(wav_bytes)
+    if bytes(view[0:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("not a WAV file")
+    offset = 12
+    sample_rate = None
+    while offset + 8 <= len(view):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", view, offset)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate = struct.unpack_from("<HHI", view, body)
+            bits_per_sample = struct.unpack_from("<H", view, body + 14)[0]
+            if audio_format != 1 or channels != 1 or bits_per_sample != 16:
+                raise ValueError("only mono 16-bit PCM WAV is supported")
+        elif chunk_id == b"data":
+            if sample_rate is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            count = min(chunk_size, len(view) - body) // 2
+            return sample_rate, numpy.frombuffer(wav_bytes, dtype="<i2", offset=body, count=count)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def resample(samples, from_rate, to_rate):
+    """Resample int16 or float samples (polyphase filter with scipy, linear interpolation without)"""
+    if from_rate == to_rate:
+        return samples
+    try:
+        from scipy.signal import resample_poly
+    except ImportError:
+        resample_poly = None
+    if resample_poly is not None:
+        divisor = math.gcd(from_rate, to_rate)
+        resampled = resample_poly(samples.astype(numpy.float32), to_rate // divisor, from_rate // divisor)
+    else:
+        count = int(round(len(samples) * to_rate / from_rate))
+        positions = numpy.arange(count, dtype=numpy.float64) * (from_rate / to_rate)
+        resampled = numpy.interp(positions, numpy.arange(len(samples)), samples.astype(numpy.float32))
+    if samples.dtype == numpy.int16:
+        out = numpy.empty(len(resampled), dtype=numpy.int16)
+        numpy.clip(resampled, -32768, 32767, out=resampled)
+        numpy.copyto(out, resampled, casting="unsafe")
+        return out
+    return resampled.astype(samples.dtype, copy=False)
+
+
+def resample_wav(wav_bytes, to_rate):
+    """Return WAV bytes at another sample rate (the input unchanged if it already matches)"""
+    sample_rate, samples = read_wav(wav_bytes)
+    if sample_rate == to_rate:
+        return wav_bytes
+    resampled = resample(samples, sample_rate, to_rate)
+    buffer = bytearray(WAV_HEADER_SIZE + 2 * resampled.size)
+    write_wav_header(buffer, resampled.size, to_rate)
+    numpy.frombuffer(buffer, dtype="<i2", offset=WAV_HEADER_SIZE)[:] = resampled
+    return buffer
+
+
+def encode_audio(wav_bytes, audio_format="wav", sample_rate=None, language="unknown"):
+    """Convert cached WAV bytes to the requested format and (optionally) sample rate.
+
+    ogg uses Opus when the rate allows it, else Vorbis; ogg/flac need soundfile.
+    """
+    if sample_rate:
+        with TTS_STAGE_SECONDS.time(stage="resample", language=language):
+            wav_bytes = resample_wav(wav_bytes, sample_rate)
+    if audio_format == "wav":
+        return wav_bytes
+
+    import soundfile
+
+    with TTS_STAGE_SECONDS.time(stage=f"encode_{audio_format}", language=language):
+        rate, samples = read_wav(wav_bytes)
+        if audio_format == "ogg":
+            subtype = "OPUS" if rate in OPUS_SAMPLE_RATES else "VORBIS"
+            file_format = "OGG"
+        else:
+            subtype = "PCM_16"
+            file_format = "FLAC"
+        output = io.BytesIO()
+        soundfile.write(output, samples, rate, format=file_format, subtype=subtype)
+        return output.getvalue()
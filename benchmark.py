@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Load test / benchmark for the Vietnamese-Japanese Translation Chatbot
+
+Starts a local mock OpenAI server (mock_openai.py) and the app pointed at it,
+drives /api/translate, /api/batch and /api/tts at fixed concurrency levels and
+reports throughput, p50/p95/p99 latency and error rates as JSON. A previous
+result file can be passed with --compare to flag regressions.
+
+Run: python benchmark.py --scenarios translate,batch --concurrency 1,8,32 --duration 20 --output bench.json
+     python benchmark.py --output new.json --compare bench.json
+     python benchmark.py --base-url http://localhost:5000   (existing server, no mock)
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import requests
+
+from mock_openai import start_mock_server, MockSettings
+
+VI_TEXTS = [
+    "Xin chào, bạn khỏe không?",
+    "Hôm nay trời đẹp quá, chúng ta đi dạo nhé.",
+    "Cuộc họp sẽ bắt đầu lúc ba giờ chiều tại phòng số hai.",
+    "Tôi muốn đặt một bàn cho bốn người vào tối thứ sáu."
+]
+JA_TEXTS = [
+    "こんにちは、お元気ですか。",
+    "今日は会議が長引いてしまいました。",
+    "駅までの道を教えていただけますか。",
+    "来週の出張の準備はできていますか。"
+]
+SCENARIOS = ("translate", "batch", "tts")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, elapsed):
+    """Aggregate (latency_s, status) samples into the reported metrics"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = Counter(str(status) for _, status in samples)
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    total = len(samples)
+    return {
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "error_rate": round((total - ok) / total, 4) if total else 0.0,
+        "status_counts": dict(sorted(statuses.items())),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1) if latencies else None,
+            "p95": round(percentile(latencies, 95), 1) if latencies else None,
+            "p99": round(percentile(latencies, 99), 1) if latencies else None,
+            "mean": round(sum(latencies) / total, 1) if total else None,
+            "max": round(latencies[-1], 1) if latencies else None
+        }
+    }
+
+
+def sample_text(n, warm):
+    """Alternate vi/ja sentences; unique per request unless warm (cache hits)"""
+    texts = VI_TEXTS if n % 2 == 0 else JA_TEXTS
+    text = texts[(n // 2) % len(texts)]
+    return text if warm else f"{text} ({n})"
+
+
+def make_request(scenario, session, base_url, n, args):
+    """Send one request for the scenario; returns the HTTP status"""
+    if scenario == "translate":
+        body = {"messages": [{"role": "user", "content": sample_text(n, args.warm)}],
+                "source_lang": "auto", "user_id": f"bench-{uuid.uuid4().hex[:12]}"}
+        response = session.post(f"{base_url}/api/translate", json=body, timeout=args.timeout)
+    elif scenario == "batch":
+        items = [{"id": i, "text": sample_text(n * args.batch_size + i, args.warm)} for i in range(args.batch_size)]
+        response = session.post(f"{base_url}/api/batch", json=items, timeout=args.timeout)
+    else:
+        language = "vi" if n % 2 == 0 else "ja"
+        body = {"text": sample_text(n, args.warm), "language": language, "response": "binary"}
+        response = session.post(f"{base_url}/api/tts", json=body, timeout=args.timeout)
+    response.content  # read the whole body, as a client would
+    return response.status_code
+
+
+def run_level(scenario, concurrency, base_url, args):
+    """Closed loop: `concurrency` clients send back-to-back requests for the duration"""
+    samples = []
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    stop_at = measure_from + args.duration
+
+    def client_loop():
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            with lock:
+                n = next(counter)
+            if args.requests and n >= args.requests:
+                break
+            t0 = time.perf_counter()
+            try:
+                status = make_request(scenario, session, base_url, n, args)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            t1 = time.perf_counter()
+            if t0 >= measure_from:
+                with lock:
+                    samples.append((t1 - t0, status))
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = max(time.perf_counter() - measure_from, 1e-9)
+    result = summarize(samples, elapsed)
+    result.update({"scenario": scenario, "concurrency": concurrency})
+    return result
+
+
+def start_app(args, openai_endpoint, log_dir):
+    """Start the app as a subprocess and wait until /api/health answers"""
+    host, port = "127.0.0.1", args.port
+    env = dict(os.environ,
+               OPENAI_ENDPOINT=openai_endpoint,
+               OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "bench"),
+               LOG_FILE=os.path.join(log_dir, "chatbot.log"),
+               TRANSLATION_CACHE_BACKEND="memory",
+               CONTEXT_STORE="memory",
+               TTS_AUDIO_CACHE_DIR=os.path.join(log_dir, "audio"))
+    load_tts = "tts" in args.scenarios
+    if not load_tts:
+        # Text-only app: torch is never imported, startup takes about a second
+        env["TTS_ENABLED"] = "false"
+
+    if args.server == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", host, "--port", str(port),
+                   "--log-level", "warning"]
+    else:
+        command = [sys.executable, "serve.py", "--bind", f"{host}:{port}", "--workers", str(args.workers)]
+        if not load_tts:
+            command.append("--text-only")
+
+    output = open(os.path.join(log_dir, "server.log"), "wb")
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=output, stderr=subprocess.STDOUT)
+    base_url = f"http://{host}:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}, see {output.name}")
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"server did not become healthy within {args.startup_timeout}s, see {output.name}")
+
+
+def compare_results(current, baseline, tolerance):
+    """List regressions of current vs baseline for matching scenario/concurrency"""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        key = (result["scenario"], result["concurrency"])
+        before = previous.get(key)
+        if before is None:
+            continue
+        name = f"{key[0]}@{key[1]}"
+        for pct in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"].get(pct), result["latency_ms"].get(pct)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{name} {pct} latency {old}ms -> {new}ms")
+        old, new = before["throughput_rps"], result["throughput_rps"]
+        if old and new < old * (1 - tolerance):
+            regressions.append(f"{name} throughput {old} -> {new} req/s")
+        if result["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name} error rate {before['error_rate']} -> {result['error_rate']}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_header():
+    print(f"{'scenario':<10} {'conc':>5} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6}",
+          file=sys.stderr)
+
+
+def print_row(r):
+    latency = r["latency_ms"]
+    cells = [f"{latency[p]:.0f}" if latency[p] is not None else "-" for p in ("p50", "p95", "p99")]
+    print(f"{r['scenario']:<10} {r['concurrency']:>5} {r['requests']:>7} {r['throughput_rps']:>8.1f} "
+          f"{cells[0]:>8} {cells[1]:>8} {cells[2]:>8} {r['error_rate'] * 100:>6.1f}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the translation chatbot against a mock OpenAI server")
+    parser.add_argument("--scenarios", default="translate,batch",
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each level")
+    parser.add_argument("--requests", type=int, default=0, help="stop a level after this many requests (0 = no limit)")
+    parser.add_argument("--batch-size", type=int, default=10, help="items per /api/batch request")
+    parser.add_argument("--warm", action="store_true", help="repeat the same texts (measures cache hits)")
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request (s)")
+    parser.add_argument("--base-url", default=None, help="benchmark an already running server instead")
+    parser.add_argument("--server", choices=["serve", "asgi"], default="serve",
+                        help="how to start the app: serve.py (gunicorn) or uvicorn asgi:app")
+    parser.add_argument("--workers", type=int, default=1, help="serve.py worker processes")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--mock-latency-ms", type=float, default=300)
+    parser.add_argument("--mock-jitter-ms", type=float, default=100)
+    parser.add_argument("--mock-distribution", choices=["uniform", "lognormal"], default="uniform")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-error-status", default="500,429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="write the JSON result here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="baseline JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mock = None
+    process = None
+    log_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    mock_settings = MockSettings(
+        latency_ms=args.mock_latency_ms,
+        jitter_ms=args.mock_jitter_ms,
+        distribution=args.mock_distribution,
+        error_rate=args.mock_error_rate,
+        error_statuses=[int(s) for s in args.mock_error_status.split(",") if s.strip()],
+        seed=args.seed
+    )
+
+    try:
+        if args.base_url:
+            base_url = args.base_url.rstrip("/")
+        else:
+            mock = start_mock_server(mock_settings)
+            process, base_url = start_app(args, f"http://127.0.0.1:{mock.server_port}/v1", log_dir)
+            print(f"App ({args.server}) on {base_url}, mock OpenAI on port {mock.server_port}, logs in {log_dir}",
+                  file=sys.stderr)
+
+        results = []
+        print_header()
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = run_level(scenario, concurrency, base_url, args)
+                results.append(result)
+                print_row(result)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if mock is not None:
+            mock.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "server": "external" if args.base_url else args.server,
+            "workers": None if args.base_url else args.workers,
+            "duration_s": args.duration,
+            "warm_cache": args.warm,
+            "batch_size": args.batch_size,
+            "mock": None if args.base_url else {
+                "latency_ms": args.mock_latency_ms,
+                "jitter_ms": args.mock_jitter_ms,
+                "distribution": args.mock_distribution,
+                "error_rate": args.mock_error_rate,
+                "error_status": args.mock_error_status,
+                "upstream_calls": dict(mock_settings.counts)
+            }
+        },
+        "results": results
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("server", "workers", "batch_size", "warm_cache"):
+            if baseline.get("meta", {}).get(key) != report["meta"][key]:
+                print(f"Warning: {key} differs from the baseline run, results may not be comparable", file=sys.stderr)
+        regressions = compare_results(report, baseline, args.tolerance)
+        report["regressions"] = regressions
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if not regressions:
+            print(f"No regressions vs {args.compare} (tolerance {args.tolerance:.0%})", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
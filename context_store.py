@@ -0,0 +1,245 @@
+"""Conversation context stores (bounded in-memory LRU, SQLite file, Redis protocol)"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _message_bytes(messages):
+    """Approximate memory footprint of a message list (UTF-8 content size)"""
+    return sum(len(str(m.get("content") or "").encode("utf-8")) + 32 for m in messages)
+
+
+class ContextStore:
+    """Interface behind get_conversation_history/save_conversation_history"""
+    backend = "base"
+
+    def get(self, user_id):
+        """Return the user's messages (empty list if none or expired)"""
+        raise NotImplementedError
+
+    def save(self, user_id, messages):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def count(self):
+        """Number of live (non-expired) contexts"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {"backend": self.backend, "entries": self.count()}
+
+
+class MemoryContextStore(ContextStore):
+    """Per-process store with idle TTL and global entry/byte caps (LRU eviction)"""
+    backend = "memory"
+
+    def __init__(self, idle_ttl=1800, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return []
+            messages, size, last_used = entry
+            if time.monotonic() - last_used > self.idle_ttl:
+                self._drop(user_id)
+                return []
+            self._entries[user_id] = (messages, size, time.monotonic())
+            self._entries.move_to_end(user_id)
+            return list(messages)
+
+    def save(self, user_id, messages):
+        size = _message_bytes(messages)
+        with self._lock:
+            self._drop(user_id)
+            self._entries[user_id] = (list(messages), size, time.monotonic())
+            self._bytes += size
+            self._evict()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._drop(user_id)
+
+    def count(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "entries": self.count(),
+            "bytes": self._bytes,
+            "evictions": self.evictions
+        }
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _expire(self):
+        """Remove idle entries (oldest first, stop at the first live one)"""
+        now = time.monotonic()
+        while self._entries:
+            user_id, (_, _, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            self._drop(user_id)
+
+    def _evict(self):
+        self._expire()
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            user_id = next(iter(self._entries))
+            self._drop(user_id)
+            self.evictions += 1
+
+
+class SQLiteContextStore(ContextStore):
+    """Store shared by every worker process on the host via a SQLite file (WAL mode)"""
+    backend = "sqlite"
+    PRUNE_EVERY = 200
+
+    def __init__(self, path, idle_ttl=1800, max_entries=100000):
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._writes = 0
+        self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS contexts ("
+            "user_id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_contexts_updated ON contexts(updated_at)")
+        self._conn.commit()
+        # A SQLite connection must not be used across fork(); prefork servers
+        # (serve.py) import the app once and fork workers, so reopen in each child
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages, updated_at FROM contexts WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return []
+            if now - row[1] > self.idle_ttl:
+                self._conn.execute("DELETE FROM contexts WHERE user_id = ?", (user_id,))
+                self._conn.commit()
+                return []
+            self._conn.execute("UPDATE contexts SET updated_at = ? WHERE user_id = ?", (now, user_id))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def save(self, user_id, messages):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contexts (user_id, messages, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(messages, ensure_ascii=False), now)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            self._conn.commit()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM contexts WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM contexts WHERE updated_at >= ?", (time.time() - self.idle_ttl,)
+            ).fetchone()[0]
+
+    def _prune(self, now):
+        """Drop idle contexts, then least recently used ones beyond max_entries"""
+        self._conn.execute("DELETE FROM contexts WHERE updated_at < ?", (now - self.idle_ttl,))
+        self._conn.execute(
+            "DELETE FROM contexts WHERE user_id IN ("
+            "SELECT user_id FROM contexts ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+
+class RedisContextStore(ContextStore):
+    """Store backed by any Redis-protocol client (redis.Redis or a compatible fake).
+
+    Idle TTL is enforced by key expiry, refreshed on every read and write.
+    A sorted set of user ids scored by last use backs count(), so health
+    checks and metric scrapes never SCAN the (possibly shared) keyspace.
+    """
+    backend = "redis"
+
+    def __init__(self, client, idle_ttl=1800, prefix="chatbot:context:"):
+        self.client = client
+        self.idle_ttl = idle_ttl
+        self.prefix = prefix
+        self.index_key = prefix + "_active"
+
+    def get(self, user_id):
+        key = self.prefix + user_id
+        raw = self.client.get(key)
+        if raw is None:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        pipe.expire(key, self.idle_ttl)
+        pipe.zadd(self.index_key, {user_id: time.time()})
+        pipe.execute()
+        return json.loads(raw)
+
+    def save(self, user_id, messages):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self.prefix + user_id, json.dumps(messages, ensure_ascii=False), ex=self.idle_ttl)
+        pipe.zadd(self.index_key, {user_id: time.time()})
+        pipe.execute()
+
+    def delete(self, user_id):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(self.prefix + user_id)
+        pipe.zrem(self.index_key, user_id)
+        pipe.execute()
+
+    def count(self):
+        """Live contexts: drop index entries idle past the TTL, then count the rest"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.index_key, "-inf", time.time() - self.idle_ttl)
+        pipe.zcard(self.index_key)
+        return pipe.execute()[-1]
+
+
+def create_context_store(backend="memory", idle_ttl=1800, max_entries=10000, max_bytes=64 * 1024 * 1024,
+                         path="cache/contexts.db", redis_url="redis://localhost:6379/0"):
+    """Create the configured store ("memory", "sqlite" or "redis")"""
+    if backend == "sqlite":
+        return SQLiteContextStore(path, idle_ttl=idle_ttl, max_entries=max_entries)
+    if backend == "redis":
+        # Optional dependency, only needed for this backend
+        import redis
+        return RedisContextStore(redis.Redis.from_url(redis_url), idle_ttl=idle_ttl)
+    return MemoryContextStore(idle_ttl=idle_ttl, max_entries=max_entries, max_bytes=max_bytes)
@@ -0,0 +1,128 @@
+"""Token-budgeted conversation history windowing and prompt token accounting"""
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character-based estimate
+    tiktoken = None
+
+# History token budget per model family (longest matching prefix wins)
+MODEL_HISTORY_BUDGETS = {
+    "gpt-3.5-turbo": 1500,
+    "gpt-4": 3000,
+    "gpt-4o": 3000,
+    "gpt-4o-mini": 3000
+}
+DEFAULT_HISTORY_BUDGET = 1500
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Marks the rolling summary note kept at the start of a history
+SUMMARY_PREFIX = "Tóm tắt hội thoại trước: "
+
+_CJK_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF\uFF00-\uFFEF]')
+_encodings = {}
+
+
+def _encoding_for(model):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            try:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encodings[model] = None
+    return _encodings[model]
+
+
+def estimate_tokens(text, model="gpt-3.5-turbo"):
+    """Count tokens with tiktoken when installed, otherwise estimate locally.
+
+    The estimate counts each Japanese/CJK character as one token and every
+    three other characters (Vietnamese diacritics split poorly) as one.
+    """
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 2) // 3
+
+
+def message_tokens(message, model="gpt-3.5-turbo"):
+    return estimate_tokens(str(message.get("content") or ""), model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_budget_for_model(model, override=None):
+    """Token budget for stored history; `override` (if set) wins"""
+    if override:
+        return override
+    best = None
+    for prefix in MODEL_HISTORY_BUDGETS:
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_HISTORY_BUDGETS[best] if best else DEFAULT_HISTORY_BUDGET
+
+
+def is_summary(message):
+    return message.get("role") == "system" and str(message.get("content") or "").startswith(SUMMARY_PREFIX)
+
+
+def window_history(messages, budget, max_messages=20, model="gpt-3.5-turbo"):
+    """Keep the newest messages that fit the token budget and message cap.
+
+    A leading summary note is kept (and counted) when present. The kept
+    window never starts with an assistant reply. Returns (kept, dropped),
+    where `dropped` excludes the summary note.
+    """
+    summary = messages[0] if messages and is_summary(messages[0]) else None
+    turns = messages[1:] if summary else list(messages)
+
+    used = message_tokens(summary, model) if summary else 0
+    limit = max_messages - (1 if summary else 0)
+    start = len(turns)
+    while start > 0 and len(turns) - start < limit:
+        cost = message_tokens(turns[start - 1], model)
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+
+    # Do not open the window on an orphaned assistant reply
+    while start < len(turns) and turns[start].get("role") == "assistant":
+        start += 1
+
+    kept = ([summary] if summary else []) + turns[start:]
+    return kept, turns[:start]
+
+
+class PromptTokenStats:
+    """Running totals of prompt tokens sent upstream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+    def record(self, tokens):
+        with self._lock:
+            self.requests += 1
+            self.total += tokens
+            self.max = max(self.max, tokens)
+            self.last = tokens
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "avg": round(self.total / self.requests, 1) if self.requests else 0.0,
+            "max": self.max,
+            "last": self.last
+        }
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of language detection: the previous regex findall check vs
+language_detection.py, per call at 1k and 50k characters, plus a 50-item
+/api/batch-sized list detected one by one vs in one vectorized pass.
+
+Run: python language_benchmark.py --runs 200 --output lang_bench.json
+"""
+
+import argparse
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+
+import numpy
+
+from language_detection import detect_language_confidence, detect_languages
+
+LEGACY_PATTERN = r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]'
+
+SAMPLES = {
+    "vi": "Cuộc họp sẽ bắt đầu lúc ba giờ chiều tại phòng số hai, xin mọi người chuẩn bị tài liệu. ",
+    "ja": "来週の出張の準備はできていますか。資料は金曜日までに共有してください。",
+    "mixed": "Tôi muốn đặt bàn ở nhà hàng 寿司 gần ga 東京 vào tối nay. "
+}
+
+
+def legacy_detect(text):
+    """The detect_language this repo used before language_detection.py"""
+    japanese_chars = re.findall(LEGACY_PATTERN, text)
+    if len(japanese_chars) > len(text) * 0.3:
+        return "ja"
+    return "vi"
+
+
+def make_text(kind, chars):
+    sample = SAMPLES[kind]
+    return (sample * (chars // len(sample) + 1))[:chars]
+
+
+def time_call(fn, arg, runs):
+    """Median and minimum microseconds per call"""
+    fn(arg)
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - t0)
+    return {"us_p50": round(statistics.median(timings) * 1e6, 2), "us_min": round(min(timings) * 1e6, 2)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare language detection paths (per-call cost)")
+    parser.add_argument("--sizes", default="1000,50000", help="comma-separated text lengths in characters")
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--batch-items", type=int, default=50)
+    parser.add_argument("--output", default=None, help="write the JSON result here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    single = []
+    for chars in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        for kind in SAMPLES:
+            text = make_text(kind, chars)
+            legacy = time_call(legacy_detect, text, args.runs)
+            current = time_call(detect_language_confidence, text, args.runs)
+            single.append({
+                "chars": chars,
+                "text": kind,
+                "legacy": legacy,
+                "current": current,
+                "speedup": round(legacy["us_p50"] / current["us_p50"], 2),
+                "same_answer": legacy_detect(text) == detect_language_confidence(text)[0]
+            })
+
+    kinds = list(SAMPLES)
+    items = [make_text(kinds[i % len(kinds)], 40 + (i * 37) % 300) for i in range(args.batch_items)]
+    per_item = time_call(lambda texts: [detect_language_confidence(text) for text in texts], items, args.runs)
+    legacy_items = time_call(lambda texts: [legacy_detect(text) for text in texts], items, args.runs)
+    vectorized = time_call(detect_languages, items, args.runs)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "machine": platform.machine(),
+            "runs": args.runs
+        },
+        "single": single,
+        "batch": {
+            "items": len(items),
+            "chars": sum(len(text) for text in items),
+            "legacy_loop": legacy_items,
+            "per_item": per_item,
+            "vectorized": vectorized,
+            "speedup_vs_legacy": round(legacy_items["us_p50"] / vectorized["us_p50"], 2)
+        }
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
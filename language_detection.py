@@ -0,0 +1,128 @@
+"""Vietnamese / Japanese language detection by codepoint class counting.
+
+Every character is put in one class (Japanese kana/kanji, Vietnamese-only
+Latin letter or combining tone mark, other Latin letter, anything else) by a
+numpy lookup in a 64K-entry class table, and the classes are counted with
+`bincount`, so no per-character Python work or match list is built. Long
+texts are decided from their first block when that already settles the
+answer. `detect_languages` classifies a whole batch in one pass.
+"""
+import unicodedata
+
+import numpy
+
+OTHER, JAPANESE, VIETNAMESE, LATIN = 0, 1, 2, 3
+
+# Japanese if kana/kanji make up more than this share of the letters
+JA_THRESHOLD = 0.3
+# Vietnamese confidence saturates when this share of Latin letters is Vietnamese-only
+VI_DIACRITIC_SATURATION = 0.1
+# Texts longer than BLOCK_CHARS are decided from the first block alone when it
+# has EARLY_EXIT_LETTERS letters and a Japanese share this far from the threshold
+BLOCK_CHARS = 4096
+EARLY_EXIT_LETTERS = 512
+EARLY_EXIT_MARGIN = 0.25
+
+JAPANESE_RANGES = (
+    (0x3040, 0x30FF),  # hiragana, katakana
+    (0x31F0, 0x31FF),  # katakana phonetic extensions
+    (0x3400, 0x4DBF),  # CJK extension A
+    (0x4E00, 0x9FFF),  # CJK unified ideographs
+    (0xFF66, 0xFF9F),  # half-width katakana
+)
+LATIN_RANGES = ((0x41, 0x5A), (0x61, 0x7A), (0xC0, 0x24F))
+
+
+def _vietnamese_codepoints():
+    """Precomposed Vietnamese letters plus the combining marks of decomposed (NFD) input"""
+    tone_marks = ("", "̀", "́", "̃", "̉", "̣")
+    letters = set("đĐ")
+    for vowel in "aăâeêioôơuưy":
+        for mark in tone_marks:
+            for case in (vowel, vowel.upper()):
+                letters.add(unicodedata.normalize("NFC", case + mark))
+    codepoints = {ord(letter) for letter in letters if len(letter) == 1}
+    # Plain a/e/i/o/u/y are ordinary Latin letters
+    codepoints -= {ord(c) for c in "aeiouyAEIOUY"}
+    codepoints |= {ord(mark) for mark in tone_marks if mark} | {0x0306, 0x0302, 0x031B}
+    return sorted(codepoints)
+
+
+def _build_table():
+    """Class of every BMP codepoint (astral codepoints are clipped to U+FFFF, class OTHER)"""
+    table = numpy.zeros(0x10000, dtype=numpy.uint8)
+    for start, end in LATIN_RANGES:
+        table[start:end + 1] = LATIN
+    table[_vietnamese_codepoints()] = VIETNAMESE
+    for start, end in JAPANESE_RANGES:
+        table[start:end + 1] = JAPANESE
+    return table
+
+
+CLASS_TABLE = _build_table()
+
+
+def _codepoints(text):
+    return numpy.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=numpy.uint32)
+
+
+def _classify(codepoints):
+    """Class of each codepoint"""
+    return CLASS_TABLE.take(codepoints, mode="clip")
+
+
+def count_classes(text):
+    """Return counts [other, japanese, vietnamese, latin] for a text"""
+    return numpy.bincount(_classify(_codepoints(text)), minlength=4).tolist()
+
+
+def decide(counts):
+    """(language, confidence) from class counts; confidence 0.0 means no evidence (defaults to vi)"""
+    japanese, vietnamese, latin = counts[JAPANESE], counts[VIETNAMESE], counts[LATIN]
+    letters = japanese + vietnamese + latin
+    if letters == 0:
+        return "vi", 0.0
+    ja_share = japanese / letters
+    if ja_share > JA_THRESHOLD:
+        return "ja", round(0.5 + 0.5 * min(1.0, (ja_share - JA_THRESHOLD) / JA_THRESHOLD), 3)
+    # Latin text without any Vietnamese-only letter could be another language
+    diacritic_share = vietnamese / (vietnamese + latin)
+    evidence = min(1.0, diacritic_share / VI_DIACRITIC_SATURATION)
+    return "vi", round(0.5 + 0.5 * evidence * (JA_THRESHOLD - ja_share) / JA_THRESHOLD, 3)
+
+
+def _settled(counts):
+    letters = counts[JAPANESE] + counts[VIETNAMESE] + counts[LATIN]
+    if letters < EARLY_EXIT_LETTERS:
+        return False
+    return abs(counts[JAPANESE] / letters - JA_THRESHOLD) >= EARLY_EXIT_MARGIN
+
+
+def detect_language_confidence(text):
+    """Return (language, confidence) for one text: "ja" or "vi" and a score in [0, 1]"""
+    if text.isascii():
+        # No kana/kanji and no Vietnamese letters: vi by default, without evidence
+        return "vi", (0.5 if any(c.isalpha() for c in text) else 0.0)
+    if len(text) <= BLOCK_CHARS:
+        return decide(count_classes(text))
+    counts = count_classes(text[:BLOCK_CHARS])
+    if not _settled(counts):
+        counts = [head + rest for head, rest in zip(counts, count_classes(text[BLOCK_CHARS:]))]
+    return decide(counts)
+
+
+def detect_language(text):
+    """Detect if text is Vietnamese or Japanese"""
+    return detect_language_confidence(text)[0]
+
+
+def detect_languages(texts):
+    """Vectorized detect_language_confidence for a list of texts (one classification pass)"""
+    if not texts:
+        return []
+    encoded = [text.encode("utf-32-le", "surrogatepass") for text in texts]
+    lengths = numpy.fromiter((len(data) // 4 for data in encoded), dtype=numpy.intp, count=len(texts))
+    classes = _classify(numpy.frombuffer(b"".join(encoded), dtype=numpy.uint32))
+    owner = numpy.repeat(numpy.arange(len(texts)), lengths)
+    counts = numpy.bincount(owner * 4 + classes, minlength=4 * len(texts)).reshape(len(texts), 4)
+    return [decide(row) for row in counts.tolist()]
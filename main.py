@@ -1,86 +1,207 @@
-from flask import Flask, request, jsonify, render_template
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g, has_request_context
 import openai
 import os
 import logging
 import uuid
 import json
-import re
+import sys
 from datetime import datetime, timedelta
 from flask_cors import CORS
 from dotenv import load_dotenv
 import requests
-from transformers import VitsModel, AutoTokenizer
-import torch
-import scipy.io.wavfile
-import io
 import base64
+import hmac
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from translation_cache import create_translation_cache, make_cache_key
+from translation_memory import TranslationMemory
+from context_store import create_context_store
+from history_window import (window_history, history_budget_for_model, message_tokens, is_summary,
+                            PromptTokenStats, SUMMARY_PREFIX)
+from language_detection import detect_language, detect_language_confidence, detect_languages
+from tts_registry import TTSModelRegistry, TTSModelUnavailable
+from tts_synthesis import synthesize_batch, split_sentences, model_sample_rate
+from audio_encoding import waveform_to_wav_bytes, encode_audio, AUDIO_CONTENT_TYPES, OUTPUT_SAMPLE_RATES
+from tts_batcher import TTSMicroBatcher
+from tts_prefetch import TTSPrefetcher
+from audio_cache import AudioCache, make_audio_key, AUDIO_KEY_RE
+from structured_logging import setup_logging, StageTimer
+from metrics import REGISTRY, REQUEST_SECONDS, BATCH_SIZE, CallbackMetric
+from upstream import (create_openai_client, RetryPolicy, UpstreamStats, CircuitBreaker, AdaptiveLimiter,
+                      UpstreamUnavailable, DeadlineExceeded)
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost", "http://127.0.0.1"]}})
+CORS_ORIGINS = ["http://localhost", "http://127.0.0.1"]
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
 
-# Logging setup
-logging.basicConfig(
-    filename='chatbot.log',
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(message)s'
+# Logging setup: JSON lines written by a background thread, with rotation
+setup_logging(
+    path=os.getenv("LOG_FILE", "chatbot.log"),
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    json_format=os.getenv("LOG_FORMAT", "json").lower() == "json",
+    max_bytes=int(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024,
+    backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+    when=os.getenv("LOG_ROTATE_WHEN", ""),
+    multiprocess=os.getenv("LOG_MULTIPROCESS", "false").lower() == "true"
 )
 
-# In-memory context storage
-context_storage = {}
+# Conversation context storage (memory | sqlite | redis); sqlite/redis are
+# shared by all worker processes so context survives requests landing anywhere
+context_store = create_context_store(
+    backend=os.getenv("CONTEXT_STORE", "memory"),
+    idle_ttl=int(os.getenv("CONTEXT_TTL_SECONDS", "1800")),
+    max_entries=int(os.getenv("CONTEXT_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.getenv("CONTEXT_MAX_MB", "64")) * 1024 * 1024,
+    path=os.getenv("CONTEXT_STORE_PATH", "cache/contexts.db"),
+    redis_url=os.getenv("CONTEXT_REDIS_URL", "redis://localhost:6379/0")
+)
 
-# OpenAI client setup
-client = openai.OpenAI(
-    base_url=os.getenv("OPENAI_ENDPOINT", ""),
-    api_key=os.getenv("OPENAI_API_KEY", "")
+# OpenAI client setup: explicitly sized httpx pool (shared with asgi.py's async client)
+OPENAI_HTTP_OPTIONS = {
+    "max_connections": int(os.getenv("OPENAI_MAX_CONNECTIONS", "64")),
+    "max_keepalive": int(os.getenv("OPENAI_MAX_KEEPALIVE", "32")),
+    "keepalive_expiry": float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60")),
+    "connect_timeout": float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+    "http2": os.getenv("OPENAI_HTTP2", "false").lower() == "true"
+}
+client = create_openai_client(
+    os.getenv("OPENAI_ENDPOINT", ""),
+    os.getenv("OPENAI_API_KEY", ""),
+    **OPENAI_HTTP_OPTIONS
 )
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
+# One retry policy for every upstream call (429/5xx, exponential backoff + jitter, Retry-After),
+# guarded by a circuit breaker and an adaptive (AIMD) concurrency limit; refused calls become 503s
+upstream_stats = UpstreamStats()
+upstream_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("OPENAI_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30"))
+)
+upstream_limiter = AdaptiveLimiter(
+    initial=int(os.getenv("OPENAI_CONCURRENCY_INITIAL", "32")),
+    min_limit=int(os.getenv("OPENAI_CONCURRENCY_MIN", "4")),
+    max_limit=int(os.getenv("OPENAI_CONCURRENCY_MAX", "64")),
+    latency_target_ms=float(os.getenv("OPENAI_LATENCY_TARGET_MS", "8000")),
+    queue_timeout=float(os.getenv("OPENAI_QUEUE_TIMEOUT", "2"))
+)
+upstream_retry = RetryPolicy(
+    max_attempts=int(os.getenv("OPENAI_MAX_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8")),
+    stats=upstream_stats,
+    breaker=upstream_breaker,
+    limiter=upstream_limiter
+)
+
+# History is trimmed to a per-model token budget (HISTORY_TOKEN_BUDGET overrides),
+# still capped at 20 messages; HISTORY_SUMMARY folds dropped turns into a note
+HISTORY_TOKEN_BUDGET = history_budget_for_model(OPENAI_MODEL, int(os.getenv("HISTORY_TOKEN_BUDGET", "0")))
+HISTORY_SUMMARY = os.getenv("HISTORY_SUMMARY", "false").lower() == "true"
+summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+prompt_token_stats = PromptTokenStats()
+
+# Batch concurrency configuration
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+# Budget per item (or packed chunk) once a worker picks it up, retries included
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "15"))
+# Packed mode: many sentences per chat completion (enable per request with ?mode=packed)
+BATCH_PACKED_DEFAULT = os.getenv("BATCH_PACKED", "false").lower() == "true"
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", "20"))
+
+# Shared worker pool bounds upstream concurrency across all batch requests
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="batch")
+
+# Translation result cache (memory | sqlite | none)
+# Bump the prompt versions whenever the corresponding system prompt changes
+CHAT_PROMPT_VERSION = "chat-v1"
+BATCH_PROMPT_VERSION = "batch-v1"
+translation_cache = create_translation_cache(
+    backend=os.getenv("TRANSLATION_CACHE_BACKEND", "memory"),
+    max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "2000")),
+    ttl=int(os.getenv("TRANSLATION_CACHE_TTL", "86400")),
+    path=os.getenv("TRANSLATION_CACHE_PATH", "cache/translations.db")
+)
+
+# Translation memory: approved vi<->ja segment pairs and glossary terms in SQLite.
+# Exact matches are answered without OpenAI; close matches and terms found in
+# the text are added to the prompt. Writes need TRANSLATION_MEMORY_TOKEN.
+TRANSLATION_MEMORY = os.getenv("TRANSLATION_MEMORY", "true").lower() == "true"
+TRANSLATION_MEMORY_MIN_SCORE = float(os.getenv("TRANSLATION_MEMORY_MIN_SCORE", "0.7"))
+TRANSLATION_MEMORY_MAX_HINTS = int(os.getenv("TRANSLATION_MEMORY_MAX_HINTS", "3"))
+TRANSLATION_MEMORY_TOKEN = os.getenv("TRANSLATION_MEMORY_TOKEN", "")
+translation_memory = TranslationMemory(
+    path=os.getenv("TRANSLATION_MEMORY_PATH", "cache/translation_memory.db"),
+    refresh_interval=float(os.getenv("TRANSLATION_MEMORY_REFRESH", "5"))
+) if TRANSLATION_MEMORY else None
+
 # Hugging Face TTS configuration
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
 
-# Global TTS model variables
-tts_model_vi = None
-tts_tokenizer_vi = None
-tts_model_ja = None
-tts_tokenizer_ja = None
+# Local TTS models: "eager" starts loading all languages at import time (also
+# under WSGI servers), "lazy" loads each language on its first request.
+# TTS_ENABLED=false runs a text-only worker: torch/transformers are never
+# imported and the /api/tts routes answer 503.
+TTS_ENABLED = os.getenv("TTS_ENABLED", "true").lower() == "true"
+TTS_LOAD_MODE = os.getenv("TTS_LOAD_MODE", "eager").lower()
+# Inference backend (eager | quantized | torchscript | onnx), per language via TTS_BACKEND_VI / TTS_BACKEND_JA
+TTS_BACKEND = os.getenv("TTS_BACKEND", "eager").lower()
+tts_registry = TTSModelRegistry(
+    backends={
+        language: os.getenv(f"TTS_BACKEND_{language.upper()}").lower()
+        for language in ("vi", "ja") if os.getenv(f"TTS_BACKEND_{language.upper()}")
+    },
+    default_backend=TTS_BACKEND,
+    artifact_dir=os.getenv("TTS_ARTIFACT_DIR", "cache/tts_artifacts")
+)
 
 def initialize_tts_models():
     """Initialize TTS models on startup"""
-    global tts_model_vi, tts_tokenizer_vi, tts_model_ja, tts_tokenizer_ja
-    
-    try:
-        # Vietnamese TTS model
-        model_name_vi = "facebook/mms-tts-vie"
-        print(f"Loading Vietnamese model: {model_name_vi}")
-        tts_model_vi = VitsModel.from_pretrained(model_name_vi)
-        tts_tokenizer_vi = AutoTokenizer.from_pretrained(model_name_vi)
-        print("Vietnamese model and tokenizer loaded successfully.")
-        
-        # Japanese TTS model
-        model_name_ja = "facebook/mms-tts-jpn"
-        print(f"Loading Japanese model: {model_name_ja}")
-        try:
-            tts_model_ja = VitsModel.from_pretrained(model_name_ja)
-            tts_tokenizer_ja = AutoTokenizer.from_pretrained(model_name_ja)
-            print("Japanese model and tokenizer loaded successfully.")
-        except Exception as ja_error:
-            print(f"Japanese model failed: {ja_error}, trying alternative...")
-            # Try alternative Japanese model
-            model_name_ja = "espnet/kan-bayashi_ljspeech_vits"
-            try:
-                tts_model_ja = VitsModel.from_pretrained(model_name_ja)
-                tts_tokenizer_ja = AutoTokenizer.from_pretrained(model_name_ja)
-                print("Alternative Japanese model loaded successfully.")
-            except Exception as alt_error:
-                print(f"Alternative Japanese model also failed: {alt_error}")
-                tts_model_ja = None
-                tts_tokenizer_ja = None
-        
-    except Exception as e:
-        print(f"Error loading TTS models: {e}")
-        print("TTS functionality will use fallback method.")
+    if TTS_ENABLED:
+        tts_registry.preload()
+
+if TTS_ENABLED and TTS_LOAD_MODE == "eager":
+    tts_registry.preload_in_background()
+
+# Batched TTS: max items per request and max texts per forward pass
+TTS_BATCH_MAX_ITEMS = int(os.getenv("TTS_BATCH_MAX_ITEMS", "50"))
+TTS_BATCH_SIZE = int(os.getenv("TTS_BATCH_SIZE", "8"))
+
+# Coalesce concurrent /api/tts requests into batched forward passes
+TTS_MICROBATCH = os.getenv("TTS_MICROBATCH", "true").lower() == "true"
+TTS_REQUEST_TIMEOUT = float(os.getenv("TTS_REQUEST_TIMEOUT", "60"))
+tts_batcher = TTSMicroBatcher(
+    tts_registry,
+    max_batch_size=int(os.getenv("TTS_MICROBATCH_MAX_SIZE", "8")),
+    max_wait_ms=int(os.getenv("TTS_MICROBATCH_MAX_WAIT_MS", "10"))
+)
+
+# Synthesized audio cache (memory LRU + WAV files), served by /api/tts/audio/<key>
+audio_cache = AudioCache(
+    directory=os.getenv("TTS_AUDIO_CACHE_DIR", "cache/audio"),
+    max_memory_bytes=int(os.getenv("TTS_AUDIO_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+    max_disk_bytes=int(os.getenv("TTS_AUDIO_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+    disk_enabled=os.getenv("TTS_AUDIO_CACHE_DISK", "true").lower() == "true"
+)
+
+# Speculative TTS (opt-in): both translate routes queue the reply's sentence
+# chunks for synthesis in the target language and return their audio keys,
+# so playing it through /api/tts/stream is a cache hit. Jobs are dropped when the queue is full or they waited too long.
+TTS_PREFETCH = TTS_ENABLED and os.getenv("TTS_PREFETCH", "false").lower() == "true"
+TTS_PREFETCH_QUEUE = int(os.getenv("TTS_PREFETCH_QUEUE", "16"))
+TTS_PREFETCH_WORKERS = int(os.getenv("TTS_PREFETCH_WORKERS", "1"))
+TTS_PREFETCH_MAX_AGE = float(os.getenv("TTS_PREFETCH_MAX_AGE", "30"))
+
+# Binary audio responses are streamed in chunks of this size
+TTS_STREAM_CHUNK_BYTES = int(os.getenv("TTS_STREAM_CHUNK_BYTES", "16384"))
+
+# Sentence-chunked TTS (/api/tts/stream): max input length and chunk size
+TTS_STREAM_MAX_CHARS = int(os.getenv("TTS_STREAM_MAX_CHARS", "1000"))
+TTS_SENTENCE_MAX_CHARS = int(os.getenv("TTS_SENTENCE_MAX_CHARS", "120"))
 
 # Function definitions for Function Calling
 FUNCTIONS = [
@@ -99,21 +220,46 @@ FUNCTIONS = [
 ]
 
 # Helper functions
-def detect_language(text):
-    """Detect if text is Vietnamese or Japanese"""
-    japanese_chars = re.findall(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]', text)
-    if len(japanese_chars) > len(text) * 0.3:
-        return "ja"
-    return "vi"
-
 def get_conversation_history(user_id):
-    """Get conversation history from memory"""
-    return context_storage.get(user_id, [])
+    """Get conversation history from the context store"""
+    return context_store.get(user_id)
 
 def save_conversation_history(user_id, messages):
-    """Save conversation history to memory (keep last 10 exchanges = 20 messages)"""
+    """Save conversation history to the context store, trimmed to the history token budget"""
     # Limit to 10 exchanges (20 messages) as per SRS F6 requirement
-    context_storage[user_id] = messages[-20:]
+    kept, dropped = window_history(messages, HISTORY_TOKEN_BUDGET, max_messages=20, model=OPENAI_MODEL)
+    context_store.save(user_id, kept)
+    if dropped and HISTORY_SUMMARY:
+        previous_summary = kept[0] if kept and is_summary(kept[0]) else None
+        summary_executor.submit(summarize_history, user_id, previous_summary, dropped)
+
+def summarize_history(user_id, previous_summary, dropped):
+    """Fold dropped turns (and any previous summary) into a compact system note"""
+    try:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+        if previous_summary:
+            transcript = previous_summary["content"][len(SUMMARY_PREFIX):] + "\n" + transcript
+        response = upstream_retry.call(
+            client.chat.completions.create,
+            label="summary",
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": "Tóm tắt ngắn gọn (tối đa 3 câu) đoạn hội thoại phiên dịch sau, giữ lại tên riêng, số liệu và thuật ngữ quan trọng."},
+                {"role": "user", "content": transcript}
+            ],
+            timeout=15,
+            temperature=0.2
+        )
+        note = {"role": "system", "content": SUMMARY_PREFIX + (response.choices[0].message.content or "").strip()}
+        
+        # Replace the old note on the latest stored history
+        history = context_store.get(user_id)
+        if history and is_summary(history[0]):
+            history = history[1:]
+        kept, _ = window_history([note] + history, HISTORY_TOKEN_BUDGET, max_messages=20, model=OPENAI_MODEL)
+        context_store.save(user_id, kept)
+    except Exception as e:
+        logging.warning(f"History summary failed for {user_id}: {type(e).__name__}: {e}")
 
 def calculate_reimbursement(amount, days):
     """Function to calculate business trip reimbursement"""
@@ -136,6 +282,86 @@ def execute_function_call(function_name, arguments):
         return calculate_reimbursement(**arguments)
     return {"error": f"Unknown function: {function_name}"}
 
+# Metrics computed at scrape time from the existing stats objects
+REGISTRY.register(CallbackMetric(
+    "chatbot_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"],
+    lambda: [
+        ({"cache": "translation", "result": "hit"}, translation_cache.stats()["hits"]),
+        ({"cache": "translation", "result": "miss"}, translation_cache.stats()["misses"]),
+        ({"cache": "audio", "result": "memory_hit"}, audio_cache.memory_hits),
+        ({"cache": "audio", "result": "disk_hit"}, audio_cache.disk_hits),
+        ({"cache": "audio", "result": "miss"}, audio_cache.misses)
+    ],
+    kind="counter"
+))
+REGISTRY.register(CallbackMetric(
+    "chatbot_cache_hit_ratio", "Cache hit ratio since start", ["cache"],
+    lambda: [
+        ({"cache": "translation"}, translation_cache.stats()["hit_ratio"]),
+        ({"cache": "audio"}, audio_cache.stats()["hit_ratio"])
+    ]
+))
+REGISTRY.register(CallbackMetric(
+    "chatbot_tts_prefetch_jobs_total", "Speculative TTS jobs by outcome", ["outcome"],
+    lambda: [({"outcome": outcome}, count) for outcome, count in tts_prefetcher.stats().items()
+             if outcome in tts_prefetcher.counts],
+    kind="counter"
+))
+REGISTRY.register(CallbackMetric(
+    "chatbot_translation_memory_lookups_total", "Translation memory lookups by result", ["result"],
+    lambda: [
+        ({"result": "exact"}, translation_memory.exact_hits),
+        ({"result": "fuzzy"}, translation_memory.fuzzy_hits),
+        ({"result": "miss"}, translation_memory.misses)
+    ] if translation_memory is not None else [],
+    kind="counter"
+))
+REGISTRY.register(CallbackMetric(
+    "chatbot_active_contexts", "Live conversation contexts", [], lambda: [({}, context_store.count())]
+))
+REGISTRY.register(CallbackMetric(
+    "chatbot_upstream_breaker_open", "1 while the upstream circuit breaker refuses calls", [],
+    lambda: [({}, 1 if upstream_breaker.is_open() else 0)]
+))
+REGISTRY.register(CallbackMetric(
+    "chatbot_upstream_concurrency_limit", "Current adaptive upstream concurrency limit", [],
+    lambda: [({}, int(upstream_limiter.limit))]
+))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def reject_tts_when_disabled():
+    """Text-only workers refuse synthesis (cached audio is still served)"""
+    if not TTS_ENABLED and request.path.startswith("/api/tts") and request.endpoint != "get_tts_audio":
+        return jsonify({"error": "TTS không được bật trên máy chủ này."}), 503
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_latency(exc):
+    """Observe request latency; for stream_with_context responses this runs when the stream ends"""
+    started = g.get("request_started")
+    if started is None:
+        return
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        route=request.url_rule.rule if request.url_rule else "unmatched",
+        method=request.method,
+        status=g.get("response_status", 500),
+        lang_pair=g.get("lang_pair", "none")
+    )
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -161,8 +387,23 @@ def health_check():
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "version": "1.0",
-        "active_contexts": len(context_storage),
-        "model": OPENAI_MODEL
+        "active_contexts": context_store.count(),
+        "context_store": context_store.stats(),
+        "model": OPENAI_MODEL,
+        "translation_cache": translation_cache.stats(),
+        "translation_memory": translation_memory.stats() if translation_memory is not None else None,
+        "prompt_tokens": prompt_token_stats.stats(),
+        "upstream": upstream_stats.stats(),
+        "upstream_breaker": upstream_breaker.stats(),
+        "upstream_limiter": upstream_limiter.stats(),
+        "history_token_budget": HISTORY_TOKEN_BUDGET,
+        "startup": startup_report(),
+        "tts_enabled": TTS_ENABLED,
+        "tts_models": tts_registry.status(),
+        "tts_backends": dict(tts_registry.backend_in_use),
+        "tts_microbatch": tts_batcher.stats() if TTS_MICROBATCH else None,
+        "tts_prefetch": tts_prefetcher.stats() if TTS_PREFETCH else None,
+        "tts_audio_cache": audio_cache.stats()
     })
 
 # Context management endpoint
@@ -177,10 +418,66 @@ def manage_context(user_id):
             "messages": history
         })
     elif request.method == "DELETE":
-        if user_id in context_storage:
-            del context_storage[user_id]
+        context_store.delete(user_id)
         return jsonify({"message": f"Context cleared for user {user_id}"})
 
+# Translation memory: add approved pairs (needs the X-Admin-Token header) and inspect lookups
+@app.route("/api/memory", methods=["POST"])
+def add_memory_entries():
+    """Store approved pairs: {"segments": [{"vi": ..., "ja": ...}], "terms": [{"vi": ..., "ja": ...}]}"""
+    if translation_memory is None:
+        return jsonify({"error": "Bộ nhớ dịch chưa được bật."}), 404
+    token = request.headers.get("X-Admin-Token", "")
+    if not TRANSLATION_MEMORY_TOKEN or not hmac.compare_digest(token.encode(), TRANSLATION_MEMORY_TOKEN.encode()):
+        return jsonify({"error": "Không có quyền ghi bộ nhớ dịch."}), 403
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON không hợp lệ."}), 400
+    segments = data.get("segments", [])
+    terms = data.get("terms", [])
+    if not isinstance(segments, list) or not isinstance(terms, list) or \
+            not all(isinstance(pair, dict) for pair in segments + terms):
+        return jsonify({"error": 'segments và terms phải là danh sách {"vi": ..., "ja": ...}.'}), 400
+    if len(segments) + len(terms) > 1000:
+        return jsonify({"error": "Tối đa 1000 mục mỗi lần."}), 400
+    added_segments = translation_memory.add_segments(segments)
+    added_terms = translation_memory.add_terms(terms)
+    logging.info(f"Translation memory: added {added_segments} segments, {added_terms} terms")
+    return jsonify({
+        "added_segments": added_segments,
+        "added_terms": added_terms,
+        "translation_memory": translation_memory.stats()
+    })
+
+@app.route("/api/memory/search", methods=["GET"])
+def search_memory():
+    """Look a text up in the translation memory: exact match, close matches and glossary terms"""
+    if translation_memory is None:
+        return jsonify({"error": "Bộ nhớ dịch chưa được bật."}), 404
+    text = request.args.get("text", "")
+    if not text or len(text) > 1000:
+        return jsonify({"error": "Tin nhắn không hợp lệ."}), 400
+    source_lang = request.args.get("source_lang", "auto")
+    if source_lang == "auto":
+        source_lang = detect_language(text)
+    elif source_lang not in ("vi", "ja"):
+        return jsonify({"error": "source_lang phải là auto, vi hoặc ja."}), 400
+    try:
+        min_score = float(request.args.get("min_score", TRANSLATION_MEMORY_MIN_SCORE))
+    except ValueError:
+        min_score = -1.0
+    if not 0 < min_score <= 1:
+        return jsonify({"error": "min_score phải nằm trong khoảng (0, 1]."}), 400
+    target_lang = "ja" if source_lang == "vi" else "vi"
+    started = time.perf_counter()
+    result = translation_memory.lookup(text, source_lang, target_lang, min_score, TRANSLATION_MEMORY_MAX_HINTS)
+    return jsonify({
+        **result,
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "lookup_us": round((time.perf_counter() - started) * 1e6, 1)
+    })
+
 # Batch mock endpoint for testing
 @app.route("/api/batch-mock", methods=["GET"])
 def batch_mock():
@@ -194,74 +491,171 @@ def batch_mock():
     ]
     return jsonify(batch_data)
 
+def synthesize_cached(tts_language, texts, model, tokenizer, model_name, wait_prefetch=True):
+    """Yield (wav_bytes, audio_key, cached) per text in order, reusing the audio cache.
+    
+    With micro-batching enabled every uncached text is submitted up front so
+    they can share forward passes while earlier results are being consumed.
+    Audio a prefetch job is queued or running for is awaited instead of redone.
+    """
+    sample_rate = model_sample_rate(model)
+    keys = [make_audio_key(text, tts_language, model_name, sample_rate) for text in texts]
+    cached = [audio_cache.get(key) for key in keys]
+    prefetches = [
+        tts_prefetcher.pending(key) if wait_prefetch and wav_bytes is None else None
+        for key, wav_bytes in zip(keys, cached)
+    ]
+    futures = [
+        tts_batcher.submit(tts_language, text) if TTS_MICROBATCH and wav_bytes is None and prefetch is None else None
+        for text, wav_bytes, prefetch in zip(texts, cached, prefetches)
+    ]
+    
+    for text, audio_key, wav_bytes, prefetch, future in zip(texts, keys, cached, prefetches, futures):
+        if wav_bytes is None and prefetch is not None:
+            try:
+                wav_bytes = prefetch.result(timeout=TTS_REQUEST_TIMEOUT)
+            except Exception:
+                wav_bytes = None  # synthesize it here instead
+        if wav_bytes is not None:
+            yield wav_bytes, audio_key, True
+            continue
+        if future is not None:
+            try:
+                audio_data, _ = future.result(timeout=TTS_REQUEST_TIMEOUT)
+            except FuturesTimeoutError:
+                future.cancel()
+                raise
+        else:
+            audio_data = synthesize_batch(model, tokenizer, [text], tts_language)[0]
+        
+        # Convert to WAV format in memory
+        wav_bytes = waveform_to_wav_bytes(audio_data, sample_rate, language=tts_language)
+        audio_cache.put(audio_key, wav_bytes)
+        yield wav_bytes, audio_key, False
+
+def prefetch_synthesize(tts_language, text):
+    """Prefetch worker body: synthesize into the audio cache (a no-op if already cached)"""
+    model, tokenizer, model_name = tts_registry.get(tts_language)
+    wav_bytes, _, _ = next(synthesize_cached(tts_language, [text], model, tokenizer, model_name, wait_prefetch=False))
+    return wav_bytes
+
+tts_prefetcher = TTSPrefetcher(prefetch_synthesize, max_pending=TTS_PREFETCH_QUEUE,
+                               workers=TTS_PREFETCH_WORKERS, max_age=TTS_PREFETCH_MAX_AGE)
+
+def prefetch_reply_audio(text, language):
+    """Queue speculative synthesis of a translation reply; returns its audio keys or None if skipped.
+    
+    The reply is split into the same sentence chunks /api/tts/stream plays,
+    so each key is what that endpoint (or GET /api/tts/audio/<key>) will
+    look up. Only models that are already loaded are used, so a translation
+    never triggers a model load; texts /api/tts/stream would reject are
+    skipped too.
+    """
+    tts_language = "ja" if language == "ja" else "vi"
+    entry = tts_registry.peek(tts_language)
+    if entry is None or not text.strip() or len(text) > TTS_STREAM_MAX_CHARS:
+        return None
+    model, _, model_name = entry
+    sample_rate = model_sample_rate(model)
+    audio_keys = []
+    for sentence in split_sentences(text, TTS_SENTENCE_MAX_CHARS):
+        audio_key = make_audio_key(sentence, tts_language, model_name, sample_rate)
+        if not (audio_cache.contains(audio_key) or tts_prefetcher.submit(audio_key, tts_language, sentence)):
+            return None
+        audio_keys.append(audio_key)
+    return audio_keys
+
+def audio_prefetch_fields(audio_keys):
+    """Response fields pointing at prefetched reply audio, in playback order"""
+    if not audio_keys:
+        return {}
+    return {"audio_keys": audio_keys, "audio_urls": [f"/api/tts/audio/{key}" for key in audio_keys]}
+
+def wants_binary_audio(data):
+    """Binary audio is used when requested in the body or preferred via Accept"""
+    if data.get("response") in ("binary", "json"):
+        return data["response"] == "binary"
+    best = request.accept_mimetypes.best_match(["application/json", "audio/wav", "audio/ogg", "audio/flac"])
+    return best is not None and best.startswith("audio/")
+
+def requested_sample_rate(value):
+    """Validate an optional output sample rate; returns (rate or None, error message or None)"""
+    if value in (None, ""):
+        return None, None
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        rate = None
+    if rate not in OUTPUT_SAMPLE_RATES:
+        return None, f"Sample rate không hỗ trợ ({', '.join(str(r) for r in OUTPUT_SAMPLE_RATES)})."
+    return rate, None
+
+def audio_response(wav_bytes, audio_format="wav", stream=False, headers=None, language="unknown", sample_rate=None):
+    """Return audio bytes directly (optionally chunked) instead of base64-in-JSON"""
+    audio_bytes = encode_audio(wav_bytes, audio_format, sample_rate, language)
+    if stream:
+        view = memoryview(audio_bytes)
+        body = (bytes(view[i:i + TTS_STREAM_CHUNK_BYTES]) for i in range(0, len(view), TTS_STREAM_CHUNK_BYTES))
+    else:
+        body = audio_bytes
+    response = Response(body, mimetype=AUDIO_CONTENT_TYPES[audio_format], headers=headers or {})
+    if not stream:
+        response.headers["Content-Length"] = str(len(audio_bytes))
+    return response
+
 @app.route("/api/tts", methods=["POST"])
 def text_to_speech():
     """Convert text to speech using local Hugging Face TTS models"""
     req_id = str(uuid.uuid4())
     start_time = datetime.utcnow()
+    timer = StageTimer()
     
     try:
         data = request.get_json(force=True)
         text = data.get("text", "")
         language = data.get("language", "vi")  # vi or ja
+        audio_format = data.get("format", "wav")  # wav, ogg or flac (binary responses)
+        sample_rate, rate_error = requested_sample_rate(data.get("sample_rate"))
         
         if not text or len(text) > 500:
             return jsonify({"error": "Text không hợp lệ (max 500 ký tự)."}), 400
+        if audio_format not in AUDIO_CONTENT_TYPES:
+            return jsonify({"error": "Định dạng âm thanh không hỗ trợ (wav, ogg, flac)."}), 400
+        if rate_error:
+            return jsonify({"error": rate_error}), 400
         
-        # Select model based on language
-        if language == "ja":
-            model = tts_model_ja
-            tokenizer = tts_tokenizer_ja
-            model_name = "facebook/mms-tts-jpn"  # Or alternative if available
-        else:  # Vietnamese
-            model = tts_model_vi
-            tokenizer = tts_tokenizer_vi
-            model_name = "facebook/mms-tts-vie"
-        
-        # Check if models are loaded
-        if model is None or tokenizer is None:
-            # Fallback: try to load model on-demand
-            try:
-                print(f"Loading model on-demand: {model_name}")
-                if language == "ja":
-                    model = VitsModel.from_pretrained(model_name)
-                    tokenizer = AutoTokenizer.from_pretrained(model_name)
-                else:
-                    model = VitsModel.from_pretrained(model_name)
-                    tokenizer = AutoTokenizer.from_pretrained(model_name)
-                print("Model and tokenizer loaded successfully.")
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                return jsonify({"error": "TTS model không khả dụng."}), 503
+        # Models are loaded once and shared; concurrent first requests wait for one load
+        tts_language = "ja" if language == "ja" else "vi"
+        g.lang_pair = tts_language
+        try:
+            with timer.stage("model"):
+                model, tokenizer, model_name = tts_registry.get(tts_language)
+        except TTSModelUnavailable as e:
+            logging.error(f"{req_id} TTS model unavailable: {e}", extra=log_fields(req_id, status=503, language=tts_language))
+            return jsonify({"error": "TTS model không khả dụng."}), 503
         
-        # Generate speech
+        # Generate speech (or reuse previously synthesized audio)
         try:
-            # Tokenize text
-            inputs = tokenizer(text, return_tensors="pt")
-            
-            # Generate audio
-            with torch.no_grad():
-                output = model(**inputs).waveform
-            
-            # Convert to numpy array
-            audio_data = output.squeeze().cpu().numpy()
+            with timer.stage("synthesize"):
+                wav_bytes, audio_key, cache_hit = next(synthesize_cached(tts_language, [text], model, tokenizer, model_name))
             
-            # Convert to WAV format in memory
-            sample_rate = 22050  # Standard sample rate for MMS models
-            audio_buffer = io.BytesIO()
-            
-            # Normalize audio data to 16-bit range
-            audio_data_int16 = (audio_data * 32767).astype('int16')
-            
-            # Write WAV data to buffer
-            scipy.io.wavfile.write(audio_buffer, sample_rate, audio_data_int16)
-            audio_buffer.seek(0)
+            latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+            logging.info(f"{req_id} TTS success {language} {latency_ms}ms cached:{cache_hit}",
+                         extra=log_fields(req_id, status=200, language=tts_language, chars=len(text), cached=cache_hit,
+                                          latency_ms=latency_ms, stages_ms=timer.as_dict()))
             
-            # Encode to base64
-            audio_base64 = base64.b64encode(audio_buffer.getvalue()).decode('utf-8')
+            if wants_binary_audio(data):
+                return audio_response(wav_bytes, audio_format, stream=data.get("stream") is True, headers={
+                    "X-Request-ID": req_id,
+                    "X-Latency-Ms": str(latency_ms),
+                    "X-TTS-Model": model_name,
+                    "X-Audio-Key": audio_key,
+                    "X-Audio-Url": f"/api/tts/audio/{audio_key}",
+                    "X-Audio-Cached": "true" if cache_hit else "false"
+                }, language=tts_language, sample_rate=sample_rate)
             
-            latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
-            logging.info(f"{req_id} TTS success {language} {latency_ms}ms")
+            # Compatibility shape: base64 WAV wrapped in JSON
+            audio_base64 = base64.b64encode(encode_audio(wav_bytes, "wav", sample_rate, tts_language)).decode('utf-8')
             
             return jsonify({
                 "audio_base64": audio_base64,
@@ -269,159 +663,893 @@ def text_to_speech():
                 "language": language,
                 "model": model_name,
                 "request_id": req_id,
-                "latency_ms": latency_ms
+                "latency_ms": latency_ms,
+                "audio_key": audio_key,
+                "audio_url": f"/api/tts/audio/{audio_key}",
+                "cached": cache_hit
             })
             
         except Exception as e:
-            logging.error(f"{req_id} TTS generation error: {e}")
+            logging.error(f"{req_id} TTS generation error: {e}", extra=log_fields(req_id, status=500, error=type(e).__name__))
             return jsonify({"error": "Lỗi sinh âm thanh."}), 500
         
     except Exception as ex:
         latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
-        logging.error(f"{req_id} TTS ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms")
+        logging.error(f"{req_id} TTS ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, status=500, error=type(ex).__name__, latency_ms=latency_ms))
         return jsonify({"error": "Lỗi máy chủ TTS."}), 500
 
-@app.route("/api/translate", methods=["POST"])
-def translate():
+@app.route("/api/tts/stream", methods=["POST"])
+def text_to_speech_stream():
+    """Synthesize text sentence by sentence, streaming each chunk as an SSE event"""
     req_id = str(uuid.uuid4())
     start_time = datetime.utcnow()
     
     try:
         data = request.get_json(force=True)
-        messages = data.get("messages", [])
-        source_lang = data.get("source_lang", "auto")
-        user_id = data.get("user_id", "anonymous")
-        
-        # Validate input - support both old format (message) and new format (messages)
-        if "message" in data:
-            # Backward compatibility
-            message = data.get("message", "")
-            if not isinstance(message, str) or len(message) == 0 or len(message) > 1000:
-                return jsonify({"error": "Tin nhắn không hợp lệ."}), 400
-            messages = [{"role": "user", "content": message}]
-        elif messages:
-            if not isinstance(messages, list) or len(messages) == 0:
-                return jsonify({"error": "Messages không hợp lệ."}), 400
-            current_message = messages[-1].get("content", "")
-            if len(current_message) > 1000:
-                return jsonify({"error": "Tin nhắn quá dài (>1000 ký tự)."}), 400
-        else:
-            return jsonify({"error": "Thiếu messages hoặc message."}), 400
-            
-        # Get current message for processing
-        current_message = messages[-1].get("content", "") if messages else ""
+        text = data.get("text", "")
+        language = data.get("language", "vi")
+        inline = data.get("inline") is True
         
-        # Escape XSS
-        safe_message = current_message.replace("<", "&lt;").replace(">", "&gt;")
+        if not isinstance(text, str) or not text.strip() or len(text) > TTS_STREAM_MAX_CHARS:
+            return jsonify({"error": f"Text không hợp lệ (max {TTS_STREAM_MAX_CHARS} ký tự)."}), 400
         
-        # Detect language if auto
-        if source_lang == "auto":
-            detected_lang = detect_language(safe_message)
-            target_lang = "ja" if detected_lang == "vi" else "vi"
-        else:
-            detected_lang = source_lang
-            target_lang = "ja" if source_lang == "vi" else "vi"
+        tts_language = "ja" if language == "ja" else "vi"
+        g.lang_pair = tts_language
+        try:
+            model, tokenizer, model_name = tts_registry.get(tts_language)
+        except TTSModelUnavailable as e:
+            logging.error(f"{req_id} TTS model unavailable: {e}", extra=log_fields(req_id, status=503, language=tts_language))
+            return jsonify({"error": "TTS model không khả dụng."}), 503
+        
+        sentences = split_sentences(text, TTS_SENTENCE_MAX_CHARS)
+        
+        def generate():
+            yield sse_event("meta", {
+                "request_id": req_id,
+                "language": tts_language,
+                "model": model_name,
+                "chunks": len(sentences)
+            })
+            try:
+                # The first sentence is synthesized alone so playback can start early;
+                # the rest are submitted together while the client plays it
+                index = 0
+                for group in (sentences[:1], sentences[1:]):
+                    for wav_bytes, audio_key, cache_hit in synthesize_cached(tts_language, group, model, tokenizer, model_name):
+                        chunk = {
+                            "index": index,
+                            "text": sentences[index],
+                            "audio_key": audio_key,
+                            "audio_url": f"/api/tts/audio/{audio_key}",
+                            "cached": cache_hit
+                        }
+                        if inline:
+                            chunk["audio_base64"] = base64.b64encode(wav_bytes).decode('utf-8')
+                        if index == 0:
+                            first_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+                        yield sse_event("chunk", chunk)
+                        index += 1
+                
+                latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+                logging.info(f"{req_id} TTS stream {tts_language} {len(sentences)} chunks first:{first_ms}ms total:{latency_ms}ms",
+                             extra=log_fields(req_id, status=200, stream=True, language=tts_language, chars=len(text),
+                                              chunks=len(sentences), latency_ms=latency_ms,
+                                              stages_ms={"first_chunk": first_ms, "total": latency_ms}))
+                yield sse_event("done", {"request_id": req_id, "latency_ms": latency_ms, "first_chunk_ms": first_ms})
+            except Exception as e:
+                logging.error(f"{req_id} TTS stream generation error: {e}",
+                              extra=log_fields(req_id, status=200, stream=True, error=type(e).__name__))
+                yield sse_event("error", {"error": "Lỗi sinh âm thanh.", "request_id": req_id})
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} TTS stream ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, status=500, error=type(ex).__name__, latency_ms=latency_ms))
+        return jsonify({"error": "Lỗi máy chủ TTS."}), 500
+
+@app.route("/api/tts/audio/<audio_key>", methods=["GET"])
+def get_tts_audio(audio_key):
+    """Serve previously synthesized audio by its content key (ETag = key)"""
+    audio_format = request.args.get("format", "wav")
+    sample_rate, rate_error = requested_sample_rate(request.args.get("sample_rate"))
+    if not AUDIO_KEY_RE.match(audio_key) or audio_format not in AUDIO_CONTENT_TYPES:
+        return jsonify({"error": "Audio key không hợp lệ."}), 400
+    if rate_error:
+        return jsonify({"error": rate_error}), 400
+    etag = audio_key if audio_format == "wav" else f"{audio_key}.{audio_format}"
+    if sample_rate:
+        etag = f"{etag}.{sample_rate}"
+    
+    # Content-addressed: a matching ETag never goes stale
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        wav_bytes = audio_cache.get(audio_key)
+        prefetch = tts_prefetcher.pending(audio_key) if wav_bytes is None else None
+        if prefetch is not None:
+            # Speculative synthesis of this key is queued or running
+            try:
+                wav_bytes = prefetch.result(timeout=TTS_REQUEST_TIMEOUT)
+            except Exception:
+                wav_bytes = None
+        if wav_bytes is None:
+            return jsonify({"error": "Không tìm thấy âm thanh."}), 404
+        response = audio_response(wav_bytes, audio_format, sample_rate=sample_rate)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+def tts_batch_result(item_id, wav_bytes, language, model_name, audio_key, cached=False):
+    """Build a successful per-item TTS batch result"""
+    result = {
+        "id": item_id,
+        "audio_base64": base64.b64encode(wav_bytes).decode('utf-8'),
+        "content_type": "audio/wav",
+        "language": language,
+        "model": model_name,
+        "audio_key": audio_key,
+        "audio_url": f"/api/tts/audio/{audio_key}"
+    }
+    if cached:
+        result["cached"] = True
+    return result
+
+@app.route("/api/tts/batch", methods=["POST"])
+def text_to_speech_batch():
+    """Synthesize several texts with batched forward passes per language"""
+    req_id = str(uuid.uuid4())
+    start_time = datetime.utcnow()
+    timer = StageTimer()
+    
+    try:
+        data = request.get_json(force=True)
+        items = data.get("items") if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items or len(items) > TTS_BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Batch TTS tối đa {TTS_BATCH_MAX_ITEMS} items."}), 400
+        BATCH_SIZE.observe(len(items), kind="tts_batch")
+        default_language = data.get("language", "vi")
+        
+        # Validate items and group them by language
+        results = [None] * len(items)
+        groups = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {"id": None, "error": "Item không hợp lệ."}
+                continue
+            text = item.get("text", "")
+            if not isinstance(text, str) or not text or len(text) > 500:
+                results[index] = {"id": item.get("id"), "error": "Text không hợp lệ (max 500 ký tự)."}
+                continue
+            language = "ja" if item.get("language", default_language) == "ja" else "vi"
+            groups.setdefault(language, []).append(index)
+        
+        for language, indices in groups.items():
+            try:
+                model, tokenizer, model_name = tts_registry.get(language)
+            except TTSModelUnavailable as e:
+                logging.error(f"{req_id} TTS model unavailable: {e}", extra=log_fields(req_id, language=language))
+                for i in indices:
+                    results[i] = {"id": items[i].get("id"), "error": "TTS model không khả dụng."}
+                continue
             
-        # Get conversation history (10 exchanges = 20 messages max)
-        history = get_conversation_history(user_id)
+            # Serve cached audio directly, synthesize the rest
+            sample_rate = model_sample_rate(model)
+            keys = {i: make_audio_key(items[i]["text"], language, model_name, sample_rate) for i in indices}
+            pending = []
+            for i in indices:
+                wav_bytes = audio_cache.get(keys[i])
+                if wav_bytes is None:
+                    pending.append(i)
+                else:
+                    results[i] = tts_batch_result(items[i].get("id"), wav_bytes, language, model_name, keys[i], cached=True)
+            
+            # Sort by length so each forward pass pads texts of similar size
+            pending.sort(key=lambda i: len(items[i]["text"]))
+            for start in range(0, len(pending), TTS_BATCH_SIZE):
+                chunk = pending[start:start + TTS_BATCH_SIZE]
+                try:
+                    with timer.stage("inference"):
+                        waveforms = synthesize_batch(model, tokenizer, [items[i]["text"] for i in chunk], language)
+                except Exception as e:
+                    logging.error(f"{req_id} TTS batch generation error: {e}", extra=log_fields(req_id, error=type(e).__name__))
+                    for i in chunk:
+                        results[i] = {"id": items[i].get("id"), "error": "Lỗi sinh âm thanh."}
+                    continue
+                with timer.stage("encode"):
+                    for i, audio_data in zip(chunk, waveforms):
+                        wav_bytes = waveform_to_wav_bytes(audio_data, sample_rate, language=language)
+                        audio_cache.put(keys[i], wav_bytes)
+                        results[i] = tts_batch_result(items[i].get("id"), wav_bytes, language, model_name, keys[i])
+        
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.info(f"{req_id} TTS batch {len(items)} items {latency_ms}ms",
+                     extra=log_fields(req_id, status=200, items=len(items), languages=sorted(groups),
+                                      cached=sum(1 for r in results if r.get("cached")), latency_ms=latency_ms,
+                                      stages_ms=timer.as_dict()))
+        return jsonify({"results": results, "request_id": req_id, "latency_ms": latency_ms})
         
-        # Prepare system prompt for translation
-        system_prompt = f"""Bạn là trợ lý phiên dịch chuyên nghiệp Việt-Nhật. 
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} TTS batch ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, status=500, error=type(ex).__name__, latency_ms=latency_ms))
+        return jsonify({"error": "Lỗi máy chủ TTS."}), 500
+
+def memory_lookup(text, source_lang, target_lang):
+    """Translation memory result for a text (no match when the memory is disabled or fails)"""
+    if translation_memory is not None:
+        try:
+            return translation_memory.lookup(text, source_lang, target_lang, TRANSLATION_MEMORY_MIN_SCORE,
+                                             TRANSLATION_MEMORY_MAX_HINTS)
+        except Exception as e:
+            logging.warning(f"Translation memory lookup failed: {e}")
+    return {"exact": None, "matches": [], "terms": []}
+
+def memory_hints(matches):
+    """Prompt lines with the approved close translations and glossary terms of memory lookups"""
+    similar = {}
+    terms = {}
+    for match in matches:
+        for entry in match["matches"]:
+            similar.setdefault((entry["source"], entry["target"]), None)
+        for entry in match["terms"]:
+            terms.setdefault((entry["source"], entry["target"]), None)
+    lines = []
+    if similar:
+        lines.append("Bản dịch đã duyệt của các câu tương tự (tham khảo):")
+        lines.extend(f"- {source} => {target}" for source, target in similar)
+    if terms:
+        lines.append("Thuật ngữ bắt buộc dùng đúng bản dịch:")
+        lines.extend(f"- {source} => {target}" for source, target in terms)
+    return "\n".join(lines)
+
+def memory_prompt_version(prompt_version, hints):
+    """Cache-key prompt version: replies generated with memory hints are cached per hint text"""
+    return f"{prompt_version}\x1f{hints}" if hints else prompt_version
+
+def memory_result(match):
+    """Log label of a memory lookup: exact, hints or miss"""
+    if match["exact"] is not None:
+        return "exact"
+    return "hints" if match["matches"] or match["terms"] else "miss"
+
+def prepare_translation(data):
+    """Validate a translate payload and build the OpenAI prompt.
+    
+    Returns (context, None) on success or (None, (error_message, status)) for invalid input.
+    """
+    messages = data.get("messages", [])
+    source_lang = data.get("source_lang", "auto")
+    user_id = data.get("user_id", "anonymous")
+    
+    # Validate input - support both old format (message) and new format (messages)
+    if "message" in data:
+        # Backward compatibility
+        message = data.get("message", "")
+        if not isinstance(message, str) or len(message) == 0 or len(message) > 1000:
+            return None, ("Tin nhắn không hợp lệ.", 400)
+        messages = [{"role": "user", "content": message}]
+    elif messages:
+        if not isinstance(messages, list) or len(messages) == 0:
+            return None, ("Messages không hợp lệ.", 400)
+        current_message = messages[-1].get("content", "")
+        if not isinstance(current_message, str) or len(current_message) == 0:
+            return None, ("Tin nhắn không hợp lệ.", 400)
+        if len(current_message) > 1000:
+            return None, ("Tin nhắn quá dài (>1000 ký tự).", 400)
+    else:
+        return None, ("Thiếu messages hoặc message.", 400)
+        
+    # Get current message for processing
+    current_message = messages[-1].get("content", "") if messages else ""
+    
+    # Escape XSS
+    safe_message = current_message.replace("<", "&lt;").replace(">", "&gt;")
+    
+    # Detect language if auto
+    detect_confidence = None
+    if source_lang == "auto":
+        detected_lang, detect_confidence = detect_language_confidence(safe_message)
+        target_lang = "ja" if detected_lang == "vi" else "vi"
+    else:
+        detected_lang = source_lang
+        target_lang = "ja" if source_lang == "vi" else "vi"
+    
+    # Approved translations: an exact match is the reply, close matches and terms guide the model
+    memory_match = memory_lookup(current_message, detected_lang, target_lang)
+    hints = memory_hints([memory_match])
+        
+    # Get conversation history (10 exchanges = 20 messages max)
+    history = get_conversation_history(user_id)
+    
+    # Prepare system prompt for translation
+    system_prompt = f"""Bạn là trợ lý phiên dịch chuyên nghiệp Việt-Nhật. 
 Nhiệm vụ: Dịch từ {detected_lang} sang {target_lang}.
 Quy tắc:
 - Giữ định dạng, ngữ điệu gốc
 - Thuật ngữ kỹ thuật: giữ nguyên hoặc ghi chú
 - Trả lời ngắn gọn, chỉ bản dịch
 - Nếu được yêu cầu tính chi phí công tác, sử dụng function calculate_reimbursement"""
+    if hints:
+        system_prompt += "\n" + hints
 
-        # Prepare messages for OpenAI
-        openai_messages = [{"role": "system", "content": system_prompt}]
-        openai_messages.extend(history)
-        openai_messages.append({"role": "user", "content": safe_message})
+    # Prepare messages for OpenAI
+    openai_messages = [{"role": "system", "content": system_prompt}]
+    openai_messages.extend(history)
+    openai_messages.append({"role": "user", "content": safe_message})
+    
+    # Stateless requests (no history) can be served from the translation cache
+    cache_key = None
+    if not history:
+        cache_key = make_cache_key(safe_message, detected_lang, target_lang, OPENAI_MODEL,
+                                   memory_prompt_version(CHAT_PROMPT_VERSION, hints))
+    
+    return {
+        "user_id": user_id,
+        "safe_message": safe_message,
+        "detected_lang": detected_lang,
+        "detect_confidence": detect_confidence,
+        "target_lang": target_lang,
+        "history": history,
+        "openai_messages": openai_messages,
+        "prompt_tokens": sum(message_tokens(m, OPENAI_MODEL) for m in openai_messages),
+        "cache_key": cache_key,
+        "memory_exact": memory_match["exact"],
+        "memory_result": memory_result(memory_match) if translation_memory is not None else None
+    }, None
+
+def stored_reply(ctx):
+    """Approved translation-memory match or cached reply for a prepared translation, else None"""
+    if ctx["memory_exact"] is not None:
+        return ctx["memory_exact"]
+    return translation_cache.get(ctx["cache_key"]) if ctx["cache_key"] is not None else None
+
+def finish_translation(ctx, reply, cache_hit=False):
+    """Store the reply in the translation cache and the user's conversation history"""
+    if ctx["cache_key"] is not None and not cache_hit:
+        translation_cache.set(ctx["cache_key"], reply)
         
-        # Call OpenAI with retry logic (retry 2 times = 3 total attempts)
-        for attempt in range(3):
-            try:
-                response = client.chat.completions.create(
+    # Update conversation history (keep last 10 exchanges = 20 messages)
+    new_history = ctx["history"] + [
+        {"role": "user", "content": ctx["safe_message"]},
+        {"role": "assistant", "content": reply}
+    ]
+    save_conversation_history(ctx["user_id"], new_history)
+
+def append_tool_result(openai_messages, assistant_content, tool_calls):
+    """Execute the first requested tool call and append the exchange to the prompt"""
+    tool_call = tool_calls[0]
+    function_args = json.loads(tool_call["function"]["arguments"])
+    function_result = execute_function_call(tool_call["function"]["name"], function_args)
+    
+    # Send function result back to OpenAI
+    openai_messages.append({
+        "role": "assistant",
+        "content": assistant_content,
+        "tool_calls": tool_calls
+    })
+    openai_messages.append({
+        "role": "tool",
+        "tool_call_id": tool_call["id"],
+        "content": json.dumps(function_result)
+    })
+
+def upstream_error_response(req_id, e):
+    """Map a failed upstream call to (error_message, status), or None for unexpected errors"""
+    if isinstance(e, UpstreamUnavailable):
+        logging.warning(f"{req_id} shed: {e}", extra=log_fields(req_id, status=503, error=type(e).__name__))
+        return "Dịch vụ dịch đang quá tải, vui lòng thử lại sau.", 503
+    status = getattr(e, "status_code", None)
+    if status is not None and 400 <= status < 500:
+        logging.error(f"{req_id} OpenAI client error: {e}", extra=log_fields(req_id, status=400, error=type(e).__name__))
+        return "Lỗi cấu hình API hoặc quota vượt giới hạn.", 400
+    if isinstance(e, openai.APIError):
+        logging.error(f"{req_id} OpenAI unavailable after {upstream_retry.max_attempts} attempts: {e}",
+                      extra=log_fields(req_id, status=502, error=type(e).__name__))
+        return f"Không thể kết nối OpenAI sau {upstream_retry.max_attempts} lần thử.", 502
+    return None
+
+def merge_tool_call_deltas(tool_calls, fragments):
+    """Buffer streamed tool-call fragments into complete calls, keyed by their index"""
+    for fragment in fragments:
+        call = tool_calls.setdefault(fragment.index, {
+            "id": "", "type": "function", "function": {"name": "", "arguments": ""}
+        })
+        if fragment.id:
+            call["id"] = fragment.id
+        if fragment.function and fragment.function.name:
+            call["function"]["name"] += fragment.function.name
+        if fragment.function and fragment.function.arguments:
+            call["function"]["arguments"] += fragment.function.arguments
+
+def log_fields(req_id, route=None, **fields):
+    """Structured fields for a request's log line (see structured_logging)"""
+    if route is None and has_request_context():
+        route = request.path
+    return {"request_id": req_id, "route": route, **fields}
+
+def add_usage(totals, response):
+    """Accumulate the token usage reported by a completion, if any"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        totals["usage_prompt_tokens"] = totals.get("usage_prompt_tokens", 0) + (usage.prompt_tokens or 0)
+        totals["completion_tokens"] = totals.get("completion_tokens", 0) + (usage.completion_tokens or 0)
+
+def sse_event(event, payload):
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def stream_translation(ctx, req_id, start_time):
+    """Generate SSE frames relaying OpenAI deltas for a prepared translation.
+    
+    Content deltas are forwarded as they arrive; tool-call deltas are buffered
+    until the turn completes, then the function result is sent back and the
+    follow-up completion is streamed the same way.
+    """
+    timer = StageTimer()
+    yield sse_event("meta", {
+        "detected_lang": ctx["detected_lang"],
+        "target_lang": ctx["target_lang"],
+        "request_id": req_id
+    })
+    
+    try:
+        with timer.stage("cache"):
+            reply = stored_reply(ctx)
+        cache_hit = reply is not None
+        
+        if cache_hit:
+            yield sse_event("delta", {"content": reply})
+        else:
+            prompt_token_stats.record(ctx["prompt_tokens"])
+            openai_messages = ctx["openai_messages"]
+            tools = [{"type": "function", "function": func} for func in FUNCTIONS]
+            parts = []
+            for turn in range(2):
+                # Opening the stream is retried; a stream that fails midway is not
+                stream_kwargs = {"tools": tools, "tool_choice": "auto"} if turn == 0 else {}
+                stream = upstream_retry.call(
+                    client.chat.completions.create,
+                    label="translate_stream" if turn == 0 else "translate_followup",
                     model=OPENAI_MODEL,
                     messages=openai_messages,
-                    tools=[{"type": "function", "function": func} for func in FUNCTIONS],
-                    tool_choice="auto",
+                    stream=True,
                     timeout=15,
-                    temperature=0.3
+                    temperature=0.3,
+                    **stream_kwargs
                 )
                 
-                message_obj = response.choices[0].message
+                tool_calls = {}
+                turn_content = []
+                sent = 0  # leading turn_content entries already relayed to the client
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        merge_tool_call_deltas(tool_calls, delta.tool_calls)
+                    if delta.content:
+                        turn_content.append(delta.content)
+                        if not tool_calls:
+                            if "first_delta" not in timer.stages:
+                                timer.add("first_delta", time.perf_counter() - timer.started)
+                            yield sse_event("delta", {"content": delta.content})
+                            sent = len(turn_content)
                 
-                # Handle function calling
-                if message_obj.tool_calls:
-                    # Execute function
-                    tool_call = message_obj.tool_calls[0]
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    function_result = execute_function_call(function_name, function_args)
-                    
-                    # Send function result back to OpenAI
-                    openai_messages.append({
-                        "role": "assistant",
-                        "content": message_obj.content,
-                        "tool_calls": message_obj.tool_calls
-                    })
-                    openai_messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": json.dumps(function_result)
-                    })
-                    
-                    # Get final response
-                    final_response = client.chat.completions.create(
+                if not tool_calls:
+                    parts.extend(turn_content)
+                    break
+                # Text relayed before the tool call started is already on screen, so it
+                # stays part of the reply (and the saved history) the client ends up with
+                parts.extend(turn_content[:sent])
+                append_tool_result(openai_messages, "".join(turn_content) or None,
+                                   [tool_calls[index] for index in sorted(tool_calls)])
+            reply = "".join(parts)
+        
+        with timer.stage("save"):
+            finish_translation(ctx, reply, cache_hit)
+        audio_keys = prefetch_reply_audio(reply, ctx["target_lang"]) if TTS_PREFETCH else None
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.info(f"{req_id} {start_time.isoformat()} 200 stream {latency_ms}ms lang:{ctx['detected_lang']}->{ctx['target_lang']} prompt_tokens:{ctx['prompt_tokens']}",
+                     extra=log_fields(req_id, status=200, stream=True, source_lang=ctx["detected_lang"],
+                                      target_lang=ctx["target_lang"], prompt_tokens=ctx["prompt_tokens"],
+                                      cached=cache_hit, translation_memory=ctx["memory_result"],
+                                      audio_prefetch=audio_keys is not None,
+                                      latency_ms=latency_ms, stages_ms=timer.as_dict()))
+        done = {
+            "reply": reply,
+            "detected_lang": ctx["detected_lang"],
+            "target_lang": ctx["target_lang"],
+            "request_id": req_id,
+            "latency_ms": latency_ms,
+            "cached": cache_hit
+        }
+        if ctx["memory_exact"] is not None:
+            done["translation_memory"] = True
+        done.update(audio_prefetch_fields(audio_keys))
+        yield sse_event("done", done)
+        
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} {start_time.isoformat()} STREAM ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, status=200, stream=True, error=type(ex).__name__, latency_ms=latency_ms))
+        error = upstream_error_response(req_id, ex)
+        yield sse_event("error", {"error": error[0] if error else "Lỗi máy chủ nội bộ.", "request_id": req_id})
+
+@app.route("/api/translate/stream", methods=["POST"])
+def translate_stream():
+    """Translate a message, streaming the reply as Server-Sent Events"""
+    req_id = str(uuid.uuid4())
+    start_time = datetime.utcnow()
+    
+    try:
+        data = request.get_json(force=True, silent=True)
+        if data is None:
+            return jsonify({"error": "JSON không hợp lệ."}), 400
+        ctx, error = prepare_translation(data)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+        g.lang_pair = f"{ctx['detected_lang']}->{ctx['target_lang']}"
+        
+        return Response(
+            stream_with_context(stream_translation(ctx, req_id, start_time)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        
+    except Exception as ex:
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.error(f"{req_id} {start_time.isoformat()} ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, status=500, error=type(ex).__name__, latency_ms=latency_ms))
+        return jsonify({"error": "Lỗi máy chủ nội bộ."}), 500
+
+@app.route("/api/translate", methods=["POST"])
+def translate():
+    req_id = str(uuid.uuid4())
+    start_time = datetime.utcnow()
+    timer = StageTimer()
+    
+    try:
+        data = request.get_json(force=True, silent=True)
+        if data is None:
+            return jsonify({"error": "JSON không hợp lệ."}), 400
+        if isinstance(data, dict) and data.get("stream") is True:
+            return translate_stream()
+        
+        with timer.stage("prepare"):
+            ctx, error = prepare_translation(data)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+        g.lang_pair = f"{ctx['detected_lang']}->{ctx['target_lang']}"
+        openai_messages = ctx["openai_messages"]
+        detected_lang = ctx["detected_lang"]
+        target_lang = ctx["target_lang"]
+        
+        with timer.stage("cache"):
+            reply = stored_reply(ctx)
+        cache_hit = reply is not None
+        usage = {}
+        
+        if not cache_hit:
+            prompt_token_stats.record(ctx["prompt_tokens"])
+            # Each call is retried by upstream_retry (429/5xx, backoff + jitter)
+            try:
+                with timer.stage("upstream"):
+                    response = upstream_retry.call(
+                        client.chat.completions.create,
+                        label="translate",
                         model=OPENAI_MODEL,
                         messages=openai_messages,
+                        tools=[{"type": "function", "function": func} for func in FUNCTIONS],
+                        tool_choice="auto",
                         timeout=15,
                         temperature=0.3
                     )
+                add_usage(usage, response)
+                
+                message_obj = response.choices[0].message
+                
+                # Handle function calling
+                if message_obj.tool_calls:
+                    tool_calls = [tool_call.model_dump() for tool_call in message_obj.tool_calls]
+                    append_tool_result(openai_messages, message_obj.content, tool_calls)
+                    
+                    # Get final response
+                    with timer.stage("upstream"):
+                        final_response = upstream_retry.call(
+                            client.chat.completions.create,
+                            label="translate_followup",
+                            model=OPENAI_MODEL,
+                            messages=openai_messages,
+                            timeout=15,
+                            temperature=0.3
+                        )
+                    add_usage(usage, final_response)
                     reply = final_response.choices[0].message.content
                 else:
                     reply = message_obj.content
                     
-                break
-                
             except Exception as e:
-                # Retry only on 5xx server errors
-                if attempt == 2 or not (hasattr(e, 'status_code') and str(e.status_code).startswith('5')):
-                    if hasattr(e, 'status_code'):
-                        if str(e.status_code).startswith('4'):
-                            logging.error(f"{req_id} OpenAI client error: {e}")
-                            return jsonify({"error": "Lỗi cấu hình API hoặc quota vượt giới hạn."}), 400
+                error = upstream_error_response(req_id, e)
+                if error is None:
                     raise
-                logging.warning(f"{req_id} Retry attempt {attempt + 1} due to: {e}")
-        else:
-            return jsonify({"error": "Không thể kết nối OpenAI sau 3 lần thử."}), 502
-            
-        # Update conversation history (keep last 10 exchanges = 20 messages)
-        new_history = history + [
-            {"role": "user", "content": safe_message},
-            {"role": "assistant", "content": reply}
-        ]
-        save_conversation_history(user_id, new_history)
+                return jsonify({"error": error[0]}), error[1]
+        
+        with timer.stage("save"):
+            finish_translation(ctx, reply, cache_hit)
+        audio_keys = prefetch_reply_audio(str(reply), target_lang) if TTS_PREFETCH else None
         
         # Log success
         latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
-        logging.info(f"{req_id} {start_time.isoformat()} 200 {latency_ms}ms lang:{detected_lang}->{target_lang}")
+        logging.info(f"{req_id} {start_time.isoformat()} 200 {latency_ms}ms lang:{detected_lang}->{target_lang} prompt_tokens:{ctx['prompt_tokens']}",
+                     extra=log_fields(req_id, status=200, source_lang=detected_lang, target_lang=target_lang,
+                                      prompt_tokens=ctx["prompt_tokens"], cached=cache_hit, latency_ms=latency_ms,
+                                      stages_ms=timer.as_dict(), translation_memory=ctx["memory_result"],
+                                      audio_prefetch=audio_keys is not None, **usage))
         
-        return jsonify({
+        result = {
             "reply": str(reply),
             "detected_lang": detected_lang,
             "target_lang": target_lang,
             "request_id": req_id,
-            "latency_ms": latency_ms
-        })
+            "latency_ms": latency_ms,
+            "cached": cache_hit
+        }
+        if ctx["detect_confidence"] is not None:
+            result["detect_confidence"] = ctx["detect_confidence"]
+        if ctx["memory_exact"] is not None:
+            result["translation_memory"] = True
+        result.update(audio_prefetch_fields(audio_keys))
+        return jsonify(result)
         
     except Exception as ex:
         latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
-        logging.error(f"{req_id} {start_time.isoformat()} ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms")
+        logging.error(f"{req_id} {start_time.isoformat()} ERROR {type(ex).__name__}: {str(ex)} latency:{latency_ms}ms",
+                      extra=log_fields(req_id, status=500, error=type(ex).__name__, latency_ms=latency_ms))
         return jsonify({"error": "Lỗi máy chủ nội bộ."}), 500
 
+def batch_result(item_id, text, translation, source_lang, target_lang, cached=False, memory=False):
+    """Build a successful per-item batch result"""
+    result = {
+        "id": item_id,
+        "original": text,
+        "translation": translation,
+        "source_lang": source_lang,
+        "target_lang": target_lang
+    }
+    if cached:
+        result["cached"] = True
+    if memory:
+        result["translation_memory"] = True
+    return result
+
+def batch_languages(items):
+    """Detected language per batch item in one vectorized pass (None for items without text)"""
+    texts = [item.get("text") if isinstance(item, dict) else None for item in items]
+    valid = [i for i, text in enumerate(texts) if isinstance(text, str) and len(text) <= 1000]
+    languages = [None] * len(items)
+    for i, (language, _) in zip(valid, detect_languages([texts[i] for i in valid])):
+        languages[i] = language
+    return languages
+
+def batch_item_request(item, detected_lang=None):
+    """Validate a batch item and look it up in the translation memory and cache.
+    
+    Returns (result, None) when the item is already answered (error, memory
+    or cache hit), otherwise (None, job) where job carries the prompt for one
+    completion.
+    """
+    item_id = item.get("id")
+    text = item.get("text", "")
+    
+    if len(text) > 1000:
+        return {"id": item_id, "error": "Text quá dài"}, None
+        
+    # Detect language (unless batch_languages already did) and translate
+    detected_lang = detected_lang or detect_language(text)
+    target_lang = "ja" if detected_lang == "vi" else "vi"
+    
+    match = memory_lookup(text, detected_lang, target_lang)
+    if match["exact"] is not None:
+        return batch_result(item_id, text, match["exact"], detected_lang, target_lang, cached=True, memory=True), None
+    hints = memory_hints([match])
+    
+    cache_key = make_cache_key(text, detected_lang, target_lang, OPENAI_MODEL,
+                               memory_prompt_version(BATCH_PROMPT_VERSION, hints))
+    cached = translation_cache.get(cache_key)
+    if cached is not None:
+        return batch_result(item_id, text, cached, detected_lang, target_lang, cached=True), None
+    
+    # Simple translation call (no history for batch)
+    system_prompt = f"Dịch từ {detected_lang} sang {target_lang}. Chỉ trả lời bản dịch."
+    if hints:
+        system_prompt += "\n" + hints
+    return None, {
+        "id": item_id,
+        "text": text,
+        "source_lang": detected_lang,
+        "target_lang": target_lang,
+        "cache_key": cache_key,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+    }
+
+def finish_batch_item(job, translation):
+    """Cache a batch item's translation and build its result"""
+    translation_cache.set(job["cache_key"], translation)
+    return batch_result(job["id"], job["text"], translation, job["source_lang"], job["target_lang"])
+
+def translate_batch_item(item, detected_lang=None):
+    """Translate a single batch item (no history), returning its result dict"""
+    try:
+        result, job = batch_item_request(item, detected_lang)
+        if job is None:
+            return result
+        
+        response = upstream_retry.call(
+            client.chat.completions.create,
+            label="batch",
+            deadline=time.monotonic() + BATCH_ITEM_TIMEOUT,
+            model=OPENAI_MODEL,
+            messages=job["messages"],
+            temperature=0.3
+        )
+        return finish_batch_item(job, response.choices[0].message.content)
+        
+    except (DeadlineExceeded, openai.APITimeoutError):
+        return {"id": item.get("id"), "error": "Quá thời gian xử lý"}
+    except Exception as e:
+        return {"id": item.get("id"), "error": str(e)}
+
+def run_batch_items(items):
+    """Fan out items to the worker pool, collecting results in input order.
+    
+    Each item's deadline starts when a worker picks it up and bounds its
+    retries, so waiting on the futures needs no timeout of its own.
+    """
+    futures = [batch_executor.submit(translate_batch_item, item, language)
+               for item, language in zip(items, batch_languages(items))]
+    return [future.result() for future in futures]
+
+def parse_packed_reply(reply, count):
+    """Parse a packed JSON reply into `count` translations, or None if it does not line up"""
+    try:
+        cleaned = reply.strip()
+        if cleaned.startswith("```"):
+            # Strip markdown code fences some models wrap around JSON
+            cleaned = cleaned.strip("`")
+            if cleaned.startswith("json"):
+                cleaned = cleaned[4:]
+        parsed = json.loads(cleaned)
+        translations = {}
+        for entry in parsed:
+            translations[int(entry["i"])] = str(entry["t"])
+        if sorted(translations) != list(range(count)):
+            return None
+        return [translations[i] for i in range(count)]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+def packed_group_messages(source_lang, target_lang, texts, hints=""):
+    """Prompt translating several same-direction sentences in one chat completion"""
+    packed_input = json.dumps([{"i": i, "t": text} for i, text in enumerate(texts)], ensure_ascii=False)
+    system_prompt = (
+        f"Dịch từng câu từ {source_lang} sang {target_lang}. "
+        'Đầu vào là JSON list [{"i": số thứ tự, "t": câu}]. '
+        'Chỉ trả lời JSON list cùng định dạng [{"i": số thứ tự, "t": bản dịch}], giữ nguyên "i", không giải thích.'
+    )
+    if hints:
+        system_prompt += "\n" + hints
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": packed_input}
+    ]
+
+def translate_packed_group(source_lang, target_lang, texts, hints=""):
+    """Translate several same-direction sentences in one chat completion"""
+    BATCH_SIZE.observe(len(texts), kind="translate_packed")
+    response = upstream_retry.call(
+        client.chat.completions.create,
+        label="batch_packed",
+        deadline=time.monotonic() + BATCH_ITEM_TIMEOUT,
+        model=OPENAI_MODEL,
+        messages=packed_group_messages(source_lang, target_lang, texts, hints),
+        temperature=0.3
+    )
+    return parse_packed_reply(response.choices[0].message.content or "", len(texts))
+
+def plan_packed_batch(items):
+    """Resolve memory and cache hits and split the remaining items into packable chunks.
+    
+    Returns (results, chunks, fallback): results has memory/cache hits filled
+    in, each chunk is (source_lang, target_lang, indices, cache_keys, hints)
+    of at most BATCH_PACK_SIZE items with their cache keys and the memory
+    hints for the chunk prompt, and fallback lists indices that cannot be
+    packed (invalid/too long) and need per-item calls.
+    """
+    results = [None] * len(items)
+    groups = {}
+    matches = {}
+    cache_keys = {}
+    fallback = []
+    languages = batch_languages(items)
+    for index, item in enumerate(items):
+        text = item.get("text", "") if isinstance(item, dict) else None
+        if not isinstance(text, str) or not text or len(text) > 1000:
+            fallback.append(index)
+            continue
+        detected_lang = languages[index]
+        target_lang = "ja" if detected_lang == "vi" else "vi"
+        match = memory_lookup(text, detected_lang, target_lang)
+        if match["exact"] is not None:
+            results[index] = batch_result(item.get("id"), text, match["exact"], detected_lang, target_lang,
+                                          cached=True, memory=True)
+            continue
+        matches[index] = match
+        cache_keys[index] = make_cache_key(text, detected_lang, target_lang, OPENAI_MODEL,
+                                           memory_prompt_version(BATCH_PROMPT_VERSION, memory_hints([match])))
+        cached = translation_cache.get(cache_keys[index])
+        if cached is not None:
+            results[index] = batch_result(item.get("id"), text, cached, detected_lang, target_lang, cached=True)
+            continue
+        groups.setdefault(detected_lang, []).append(index)
+    
+    chunks = []
+    for detected_lang, indices in groups.items():
+        target_lang = "ja" if detected_lang == "vi" else "vi"
+        for start in range(0, len(indices), BATCH_PACK_SIZE):
+            chunk = indices[start:start + BATCH_PACK_SIZE]
+            chunks.append((detected_lang, target_lang, chunk, [cache_keys[i] for i in chunk],
+                           memory_hints([matches[i] for i in chunk])))
+    return results, chunks, fallback
+
+def apply_packed_chunk(items, results, chunk, translations):
+    """Cache and record a chunk's translations in results"""
+    detected_lang, target_lang, indices, keys, _ = chunk
+    for i, key, translation in zip(indices, keys, translations):
+        translation_cache.set(key, translation)
+        results[i] = batch_result(items[i].get("id"), items[i]["text"], translation, detected_lang, target_lang)
+
+def run_packed_batch(items):
+    """Translate items with one chat completion per language direction chunk.
+
+    Items that cannot be packed (invalid/too long) or whose group reply fails
+    to parse fall back to per-item calls.
+    """
+    results, chunks, fallback = plan_packed_batch(items)
+    
+    # Dispatch the chunks concurrently
+    futures = [
+        batch_executor.submit(translate_packed_group, detected_lang, target_lang, [items[i]["text"] for i in indices],
+                              hints)
+        for detected_lang, target_lang, indices, _, hints in chunks
+    ]
+    
+    for chunk, future in zip(chunks, futures):
+        try:
+            translations = future.result()
+        except Exception as e:
+            logging.warning(f"packed batch chunk failed, falling back per item: {type(e).__name__}")
+            translations = None
+        if translations is None:
+            fallback.extend(chunk[2])
+            continue
+        apply_packed_chunk(items, results, chunk, translations)
+    
+    if fallback:
+        fallback.sort()
+        for i, result in zip(fallback, run_batch_items([items[i] for i in fallback])):
+            results[i] = result
+    return results
+
 @app.route("/api/batch", methods=["POST"])
 def batch_translate():
     req_id = str(uuid.uuid4())
@@ -432,54 +1560,47 @@ def batch_translate():
         
         if not isinstance(data, list) or len(data) > 50:
             return jsonify({"error": "Batch tối đa 50 items."}), 400
+        if upstream_breaker.is_open():
+            return jsonify({"error": "Dịch vụ dịch đang quá tải, vui lòng thử lại sau."}), 503
             
-        results = []
-        for item in data:
-            try:
-                item_id = item.get("id")
-                text = item.get("text", "")
-                
-                if len(text) > 1000:
-                    results.append({"id": item_id, "error": "Text quá dài"})
-                    continue
-                    
-                # Detect language and translate
-                detected_lang = detect_language(text)
-                target_lang = "ja" if detected_lang == "vi" else "vi"
-                
-                # Simple translation call (no history for batch)
-                response = client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=[
-                        {"role": "system", "content": f"Dịch từ {detected_lang} sang {target_lang}. Chỉ trả lời bản dịch."},
-                        {"role": "user", "content": text}
-                    ],
-                    timeout=15,
-                    temperature=0.3
-                )
-                
-                translation = response.choices[0].message.content
-                results.append({
-                    "id": item_id,
-                    "original": text,
-                    "translation": translation,
-                    "source_lang": detected_lang,
-                    "target_lang": target_lang
-                })
-                
-            except Exception as e:
-                results.append({"id": item.get("id"), "error": str(e)})
+        mode = request.args.get("mode", "packed" if BATCH_PACKED_DEFAULT else "parallel")
+        BATCH_SIZE.observe(len(data), kind="translate_batch")
+        if mode == "packed":
+            results = run_packed_batch(data)
+        else:
+            results = run_batch_items(data)
                 
-        logging.info(f"{req_id} batch {len(results)} items")
-        return jsonify({"results": results, "request_id": req_id})
+        latency_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
+        logging.info(f"{req_id} batch {len(results)} items mode:{mode} {latency_ms}ms",
+                     extra=log_fields(req_id, status=200, items=len(results), mode=mode, latency_ms=latency_ms,
+                                      cached=sum(1 for r in results if r.get("cached")),
+                                      errors=sum(1 for r in results if "error" in r)))
+        return jsonify({"results": results, "request_id": req_id, "mode": mode})
         
     except Exception as ex:
-        logging.error(f"{req_id} batch ERROR {type(ex).__name__}")
+        logging.error(f"{req_id} batch ERROR {type(ex).__name__}", extra=log_fields(req_id, status=500, error=type(ex).__name__))
         return jsonify({"error": "Lỗi xử lý batch."}), 500
 
+def startup_report():
+    """Seconds spent importing the app, importing torch/transformers and loading each TTS model"""
+    return {
+        "app_import_seconds": APP_IMPORT_SECONDS,
+        "tts_enabled": TTS_ENABLED,
+        "torch_imported": "torch" in sys.modules,
+        "tts_import_seconds": tts_registry.import_seconds,
+        "tts_model_load_seconds": dict(tts_registry.load_seconds)
+    }
+
+def create_app(preload_tts=False):
+    """Return the configured app for WSGI servers; preload_tts loads all TTS models first"""
+    if preload_tts:
+        initialize_tts_models()
+    return app
+
+APP_IMPORT_SECONDS = round(time.perf_counter() - IMPORT_STARTED, 3)
+logging.info(f"App imported in {APP_IMPORT_SECONDS:.2f}s (tts_enabled:{TTS_ENABLED} load_mode:{TTS_LOAD_MODE})",
+             extra={"startup": {"app_import_seconds": APP_IMPORT_SECONDS, "tts_enabled": TTS_ENABLED}})
+
 if __name__ == "__main__":
-    # Initialize TTS models
-    print("Initializing TTS models...")
-    initialize_tts_models()
     print("Starting Flask application...")
     app.run(host="0.0.0.0", port=5000, debug=True)
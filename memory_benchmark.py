@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Translation memory benchmark: index build time and lookup latency at scale.
+
+Fills a throwaway database with synthetic Vietnamese/Japanese segment pairs
+(business-trip words plus generated ones, Zipf-weighted), loads it the way
+the app does at startup and times exact, near-match (one word changed) and
+unrelated lookups in both directions.
+
+Run: python memory_benchmark.py --segments 200000 --lookups 2000 --output memory_bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import unicodedata
+
+import numpy
+
+from translation_memory import TranslationMemory, LANGUAGES
+
+DOMAIN_VI = ("chi phí công tác ngày tiền khách sạn vé máy bay hóa đơn thanh toán tàu xe taxi ăn uống hội nghị "
+             "đối tác hợp đồng báo cáo tuần tháng lịch trình phòng họp nhân viên giám đốc gửi nhận duyệt "
+             "hoàn ứng trước cần xin vui lòng kiểm tra lại bản dự toán tổng cộng mỗi người").split()
+DOMAIN_JA = ("出張 費用 日数 ホテル 航空券 領収書 精算 電車 タクシー 食事 会議 取引先 契約 報告書 週 月 日程 会議室 "
+             "社員 部長 送付 受領 承認 払い戻し 前払い 必要 お願い 確認 見積 合計 一人 当たり").split()
+VI_ONSETS = "b c ch d đ g gi h k kh l m n ng nh p ph qu r s t th tr v x".split() + [""]
+VI_RHYMES = ("a ai am an ang anh ao at ay e em en eo et i ia im in inh it o oi om on ong ot u ui um un ung ut "
+             "ư ưa ương ươi ơ ơi ơn ê ên ênh ô ôi ông ăn ăng âm ân âu ây iên iêu uyên uân oa oan oang").split()
+VI_TONES = ("", "\u0300", "\u0301", "\u0303", "\u0309", "\u0323")
+VOCABULARY_SIZE = 5000
+
+
+def vietnamese_vocabulary(rng, size):
+    """Domain words first (most frequent), then generated one- or two-syllable words"""
+    def syllable():
+        rhyme = rng.choice(VI_RHYMES)
+        return unicodedata.normalize("NFC", rng.choice(VI_ONSETS) + rhyme[0] + rng.choice(VI_TONES) + rhyme[1:])
+    words = list(DOMAIN_VI)
+    while len(words) < size:
+        words.append(" ".join(syllable() for _ in range(rng.randint(1, 2))))
+    return words
+
+
+def japanese_vocabulary(rng, size):
+    kana = [chr(c) for c in range(0x3042, 0x3094)] + [chr(c) for c in range(0x30A2, 0x30F4)]
+    kanji = [chr(0x4E00 + rng.randrange(3000)) for _ in range(2000)]
+    words = list(DOMAIN_JA)
+    while len(words) < size:
+        pool = kanji if rng.random() < 0.6 else kana
+        words.append("".join(rng.choice(pool) for _ in range(rng.randint(2, 4))))
+    return words
+
+
+def make_pairs(count, seed):
+    rng = random.Random(seed)
+    vocabulary = random.Random(0)
+    vi_words = vietnamese_vocabulary(vocabulary, VOCABULARY_SIZE)
+    ja_words = japanese_vocabulary(vocabulary, VOCABULARY_SIZE)
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    pairs = []
+    for _ in range(count):
+        length = rng.randint(5, 16)
+        vi = " ".join(rng.choices(vi_words, weights=weights, k=length)) + "."
+        ja = "".join(rng.choices(ja_words, weights=weights, k=max(3, length * 2 // 3))) + "。"
+        pairs.append({"vi": vi, "ja": ja})
+    return pairs
+
+
+def mutate(rng, text, language):
+    """Change one word (vi) or two characters (ja) to get a near match"""
+    if language == "vi":
+        words = text.split(" ")
+        words[rng.randrange(len(words))] = rng.choice(DOMAIN_VI)
+        return " ".join(words)
+    position = rng.randrange(max(1, len(text) - 2))
+    return text[:position] + rng.choice(DOMAIN_JA)[:2] + text[position + 2:]
+
+
+def time_lookups(memory, queries, source_lang, target_lang):
+    timings = []
+    hits = 0
+    for query in queries:
+        t0 = time.perf_counter()
+        result = memory.lookup(query, source_lang, target_lang)
+        timings.append(time.perf_counter() - t0)
+        hits += bool(result["exact"] or result["matches"])
+    timings.sort()
+    return {
+        "us_p50": round(statistics.median(timings) * 1e6, 1),
+        "us_p99": round(timings[int(len(timings) * 0.99) - 1] * 1e6, 1),
+        "us_max": round(timings[-1] * 1e6, 1),
+        "hit_rate": round(hits / len(queries), 4)
+    }
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Translation memory build and lookup benchmark")
+    parser.add_argument("--segments", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=2000, help="queries per kind and direction")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="write the JSON result here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    pairs = make_pairs(args.segments, args.seed)
+    unrelated = make_pairs(args.lookups, args.seed + 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tm.db")
+        t0 = time.perf_counter()
+        TranslationMemory(path).add_segments(pairs)
+        insert_seconds = time.perf_counter() - t0
+
+        rss_before = current_rss_mb()
+        t0 = time.perf_counter()
+        memory = TranslationMemory(path, refresh_interval=3600)
+        load_seconds = time.perf_counter() - t0
+        rss_after = current_rss_mb()
+
+        lookups = {}
+        for source_lang in LANGUAGES:
+            target_lang = "ja" if source_lang == "vi" else "vi"
+            sample = rng.sample(pairs, min(args.lookups, len(pairs)))
+            lookups[f"{source_lang}->{target_lang}"] = {
+                "exact": time_lookups(memory, [pair[source_lang] for pair in sample], source_lang, target_lang),
+                "near": time_lookups(memory, [mutate(rng, pair[source_lang], source_lang) for pair in sample],
+                                     source_lang, target_lang),
+                "unrelated": time_lookups(memory, [pair[source_lang] + " " + other[source_lang]
+                                                   for pair, other in zip(sample, unrelated)],
+                                          source_lang, target_lang)
+            }
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": numpy.__version__,
+            "machine": platform.machine(),
+            "segments": args.segments,
+            "lookups": args.lookups
+        },
+        "insert_and_index_seconds": round(insert_seconds, 3),
+        "load_seconds": round(load_seconds, 3),
+        "index_rss_mb": round(rss_after - rss_before, 1) if rss_after and rss_before else None,
+        "lookups": lookups
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API, for benchmarks.
+
+Answers POST /v1/chat/completions (plain, streamed, tool calls and the packed
+batch JSON format) after a configurable delay, failing a configurable share
+of requests. Point the app at it with OPENAI_ENDPOINT=http://127.0.0.1:8001/v1
+
+Run: python mock_openai.py --port 8001 --latency-ms 400 --jitter-ms 150 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockSettings:
+    """Latency and error distribution of the mock server"""
+
+    def __init__(self, latency_ms=300, jitter_ms=0, distribution="uniform", error_rate=0.0,
+                 error_statuses=(500,), retry_after=None, stream_chunks=4, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.stream_chunks = max(1, stream_chunks)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "streams": 0}
+
+    def delay_seconds(self):
+        """Sample one response delay"""
+        with self.lock:
+            if self.distribution == "lognormal" and self.latency_ms > 0:
+                # Long right tail with the configured median
+                sigma = self.jitter_ms / self.latency_ms if self.jitter_ms else 0.5
+                delay_ms = self.random.lognormvariate(0, sigma) * self.latency_ms
+            else:
+                delay_ms = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, delay_ms / 1000)
+
+    def pick_error(self):
+        """Return an HTTP status to fail with, or None"""
+        with self.lock:
+            if self.error_rate > 0 and self.random.random() < self.error_rate:
+                return self.random.choice(self.error_statuses)
+        return None
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def translate_text(text):
+    """Deterministic fake translation"""
+    return f"[dịch] {text}"
+
+
+def completion_message(body):
+    """Build the assistant message for a chat completion request"""
+    messages = body.get("messages") or [{"content": ""}]
+    last = messages[-1]
+    content = last.get("content") or ""
+
+    if last.get("role") == "tool":
+        return {"role": "assistant", "content": f"Kết quả: {content}"}
+    if body.get("tools") and "chi phí công tác" in content.lower():
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_mock",
+            "type": "function",
+            "function": {"name": "calculate_reimbursement", "arguments": json.dumps({"amount": 300, "days": 5})}
+        }]}
+
+    # Packed batch prompt: a JSON list of {"i", "t"}
+    try:
+        packed = json.loads(content)
+        if isinstance(packed, list) and all(isinstance(entry, dict) and "i" in entry for entry in packed):
+            return {"role": "assistant", "content": json.dumps(
+                [{"i": entry["i"], "t": translate_text(entry.get("t", ""))} for entry in packed], ensure_ascii=False
+            )}
+    except ValueError:
+        pass
+    return {"role": "assistant", "content": translate_text(content)}
+
+
+def usage_for(body, reply):
+    prompt_chars = sum(len(str(message.get("content") or "")) for message in body.get("messages") or [])
+    completion_chars = len(reply or "")
+    return {
+        "prompt_tokens": prompt_chars // 4 + 1,
+        "completion_tokens": completion_chars // 4 + 1,
+        "total_tokens": (prompt_chars + completion_chars) // 4 + 2
+    }
+
+
+def make_handler(settings):
+    class MockOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                with settings.lock:
+                    counts = dict(settings.counts)
+                self.send_json(200, counts)
+            else:
+                self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self.send_json(400, {"error": {"message": "invalid JSON", "type": "invalid_request_error"}})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_json(404, {"error": {"message": "not found"}})
+                return
+
+            settings.count("requests")
+            delay = settings.delay_seconds()
+            status = settings.pick_error()
+            if status is not None:
+                time.sleep(delay)
+                settings.count("errors")
+                headers = {"Retry-After": str(settings.retry_after)} if settings.retry_after is not None else None
+                self.send_json(status, {"error": {"message": f"mock error {status}", "type": "server_error"}}, headers)
+                return
+
+            message = completion_message(body)
+            model = body.get("model", "mock")
+            if body.get("stream"):
+                settings.count("streams")
+                self.stream_reply(message, model, delay)
+                return
+            time.sleep(delay)
+            self.send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": message,
+                             "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+                "usage": usage_for(body, message.get("content"))
+            })
+
+        def stream_reply(self, message, model, delay):
+            """Send the reply as SSE chunks, spreading the delay over them"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            if message.get("tool_calls"):
+                deltas = [{"tool_calls": [dict(call, index=0) for call in message["tool_calls"]]}]
+            else:
+                content = message["content"]
+                size = max(1, -(-len(content) // settings.stream_chunks))
+                deltas = [{"content": content[i:i + size]} for i in range(0, len(content), size)] or [{"content": ""}]
+            for delta in deltas:
+                time.sleep(delay / len(deltas))
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return MockOpenAIHandler
+
+
+def start_mock_server(settings, host="127.0.0.1", port=0):
+    """Serve in a daemon thread; returns the server (server.server_port is the bound port)"""
+    server = ThreadingHTTPServer((host, port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300, help="median response delay")
+    parser.add_argument("--jitter-ms", type=float, default=0,
+                        help="uniform: +/- spread; lognormal: spread of the tail")
+    parser.add_argument("--distribution", choices=["uniform", "lognormal"], default="uniform")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail (0-1)")
+    parser.add_argument("--error-status", default="500", help="comma-separated statuses to fail with, e.g. 429,500,503")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After header on errors (seconds)")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def settings_from_args(args):
+    return MockSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        distribution=args.distribution,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in str(args.error_status).split(",") if status.strip()],
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(settings_from_args(args)))
+    print(f"Mock OpenAI server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,128 @@
+"""Production launcher: prefork gunicorn workers sharing preloaded TTS models.
+
+Usage: python serve.py --bind 0.0.0.0:5000 --workers 4 --threads 8
+
+The app (and every TTS model) is loaded once in the master process, then
+workers are forked so model weights are shared copy-on-write. Each worker
+limits torch to its share of the CPU cores to avoid oversubscription.
+With --no-preload each worker imports the app itself after the fork and
+loads TTS models on first use.
+Without gunicorn (e.g. on Windows) a single threaded process is served.
+With --text-only (TTS_ENABLED=false) torch is never imported, for small
+translate-only replicas. With several workers the log file is not rotated
+in-process (LOG_MULTIPROCESS); rotate it with logrotate.
+"""
+import argparse
+import gc
+import logging
+import os
+import sys
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the translation chatbot with production settings")
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:5000"), help="host:port to listen on")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")),
+                        help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "8")),
+                        help="request threads per worker")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WEB_TIMEOUT", "120")),
+                        help="seconds before a silent worker is restarted")
+    parser.add_argument("--torch-threads", type=int, default=int(os.getenv("TORCH_NUM_THREADS", "0")),
+                        help="torch intra-op threads per worker (default: CPU cores / workers)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="load TTS models lazily in each worker instead of before forking")
+    parser.add_argument("--text-only", action="store_true",
+                        default=os.getenv("TTS_ENABLED", "true").lower() == "false",
+                        help="disable TTS: translation routes only, torch is never imported")
+    return parser.parse_args(argv)
+
+
+def torch_threads_per_worker(workers, override=0):
+    """Split the CPU cores evenly between workers (at least one thread each)"""
+    if override > 0:
+        return override
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def set_torch_threads(count):
+    # Only if torch is already loaded; a later lazy import reads OMP_NUM_THREADS
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(count)
+
+
+def load_app(preload_tts):
+    """Import the app; with preload_tts, load all TTS models before returning"""
+    # Never start main.py's background preload thread: with a preloaded app
+    # the workers would be forked while it holds the registry locks. Models
+    # are loaded synchronously below, or lazily on first use in each worker.
+    os.environ["TTS_LOAD_MODE"] = "lazy"
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    app = main.create_app(preload_tts=preload_tts)
+    report = main.startup_report()
+    print(f"App import {imported - started:.2f}s, TTS preload {time.perf_counter() - imported:.2f}s "
+          f"(torch import {report['tts_import_seconds'] or 0:.2f}s, models {report['tts_model_load_seconds']})")
+    # Keep the loaded objects out of the GC's reach so collections in the
+    # workers do not touch (and copy) the shared pages
+    gc.freeze()
+    return app
+
+
+def run_gunicorn(args, torch_threads):
+    from gunicorn.app.base import BaseApplication
+
+    class ChatbotApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", [args.bind])
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("threads", args.threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("timeout", args.timeout)
+            # --no-preload imports the app in each worker after the fork
+            self.cfg.set("preload_app", not args.no_preload)
+            self.cfg.set("post_fork", lambda server, worker: set_torch_threads(torch_threads))
+
+        def load(self):
+            return load_app(not args.no_preload)
+
+    if args.workers > 1:
+        # Workers share LOG_FILE: append only, leave rotation to logrotate
+        os.environ["LOG_MULTIPROCESS"] = "true"
+    ChatbotApplication().run()
+
+
+def run_single_process(args, torch_threads):
+    from werkzeug.serving import run_simple
+
+    if args.workers > 1:
+        logging.warning("gunicorn is not installed; serving with a single process")
+    set_torch_threads(torch_threads)
+    host, _, port = args.bind.rpartition(":")
+    run_simple(host or "0.0.0.0", int(port), load_app(not args.no_preload),
+               threaded=True, use_reloader=False)
+
+
+def serve(argv=None):
+    args = parse_args(argv)
+    if args.text_only:
+        os.environ["TTS_ENABLED"] = "false"
+        args.no_preload = True
+    torch_threads = torch_threads_per_worker(args.workers, args.torch_threads)
+    # Size OpenMP pools before torch is first imported
+    os.environ.setdefault("OMP_NUM_THREADS", str(torch_threads))
+    print(f"Starting {args.workers} worker(s) x {args.threads} thread(s) on {args.bind}, "
+          f"torch threads per worker: {'n/a (text-only)' if args.text_only else torch_threads}")
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        run_single_process(args, torch_threads)
+    else:
+        run_gunicorn(args, torch_threads)
+
+
+if __name__ == "__main__":
+    serve()
@@ -11,6 +11,9 @@ const batchResults = document.getElementById('batch-results');
 // Generate user ID for conversation context
 const userId = 'user_' + Math.random().toString(36).substr(2, 9);
 
+// Cached audio chunk URLs by language + text, so replays are plain (HTTP-cached) GETs
+const audioUrls = new Map();
+
 function appendBubble(text, sender, extra = '') {
     const bubble = document.createElement('div');
     bubble.className = 'bubble ' + sender;
@@ -30,41 +33,137 @@ function appendBubble(text, sender, extra = '') {
         </svg>
     `;
     
-    // Determine language for TTS
-    const isVietnamese = /[àáảãạăắằẳẵặâấầẩẫậèéẻẽẹêếềểễệìíỉĩịòóỏõọôốồổỗộơớờởỡợùúủũụưứừửữựỳýỷỹỵđ]/i.test(text);
-    const language = isVietnamese ? 'vi' : 'ja';
-    
-    playButton.onclick = () => playMessage(playButton, text, language);
+    // Determine language for TTS when played (streamed bubbles fill in later)
+    playButton.onclick = () => {
+        const currentText = content.textContent;
+        const isVietnamese = /[àáảãạăắằẳẵặâấầẩẫậèéẻẽẹêếềểễệìíỉĩịòóỏõọôốồổỗộơớờởỡợùúủũụưứừửữựỳýỷỹỵđ]/i.test(currentText);
+        playMessage(playButton, currentText, isVietnamese ? 'vi' : 'ja');
+    };
     
     // Assemble bubble
     bubble.appendChild(content);
     bubble.appendChild(playButton);
     
+    let extraDiv = null;
     if (extra) {
-        const extraDiv = document.createElement('div');
+        extraDiv = document.createElement('div');
         extraDiv.className = 'bubble info';
         extraDiv.innerHTML = extra;
         chatBox.appendChild(extraDiv);
     }
     chatBox.appendChild(bubble);
     chatBox.scrollTop = chatBox.scrollHeight;
+    return { bubble, content, extraDiv };
+}
+
+function formatLangInfo(data) {
+    const latency = data.latency_ms !== undefined ? ` (${data.latency_ms}ms)` : '';
+    return `🔄 ${data.detected_lang === 'vi' ? 'Việt' : 'Nhật'} → ${data.target_lang === 'vi' ? 'Việt' : 'Nhật'}${latency}`;
+}
+
+// Read a Server-Sent Events response body, calling onEvent(event, data) per frame
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+// Play audio URLs back to back; onDone fires once closed and drained
+function createAudioQueue(onDone) {
+    const pending = [];
+    let current = null;
+    let closed = false;
+    let finished = false;
+    
+    const finish = () => {
+        if (!finished) {
+            finished = true;
+            onDone();
+        }
+    };
+    
+    const playNext = () => {
+        if (current) return;
+        if (pending.length === 0) {
+            if (closed) finish();
+            return;
+        }
+        current = pending.shift();
+        current.onended = () => {
+            current = null;
+            playNext();
+        };
+        current.onerror = () => {
+            showError('Lỗi phát âm thanh.');
+            current = null;
+            playNext();
+        };
+        current.play().catch(() => {
+            current = null;
+            finish();
+        });
+    };
+    
+    return {
+        enqueue(url) {
+            // Preload while the previous chunk is still playing
+            const audio = new Audio(url);
+            audio.preload = 'auto';
+            pending.push(audio);
+            playNext();
+        },
+        close() {
+            closed = true;
+            playNext();
+        }
+    };
 }
 
-// TTS functionality
+// TTS functionality: sentence chunks stream in and play as soon as each is ready
 async function playMessage(button, text, language) {
     if (button.classList.contains('playing')) {
         return; // Already playing
     }
     
+    button.classList.add('playing');
+    button.innerHTML = `
+        <svg width="14" height="14" viewBox="0 0 24 24" fill="currentColor">
+            <path d="M6 19h4V5H6v14zm8-14v14h4V5h-4z"/>
+        </svg>
+    `;
+    
+    const player = createAudioQueue(() => resetPlayButton(button));
+    const cacheKey = `${language}:${text}`;
+    const cachedUrls = audioUrls.get(cacheKey);
+    
+    if (cachedUrls) {
+        cachedUrls.forEach(url => player.enqueue(url));
+        player.close();
+        return;
+    }
+    
     try {
-        button.classList.add('playing');
-        button.innerHTML = `
-            <svg width="14" height="14" viewBox="0 0 24 24" fill="currentColor">
-                <path d="M6 19h4V5H6v14zm8-14v14h4V5h-4z"/>
-            </svg>
-        `;
-        
-        const response = await fetch('/api/tts', {
+        const response = await fetch('/api/tts/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -73,31 +172,33 @@ async function playMessage(button, text, language) {
             })
         });
         
-        const data = await response.json();
-        
-        if (response.ok) {
-            // Create audio element and play
-            const audio = new Audio();
-            audio.src = `data:${data.content_type};base64,${data.audio_base64}`;
-            
-            audio.onended = () => {
-                resetPlayButton(button);
-            };
-            
-            audio.onerror = () => {
-                showError('Lỗi phát âm thanh.');
-                resetPlayButton(button);
-            };
-            
-            await audio.play();
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             showError(data.error || 'Lỗi TTS.');
-            resetPlayButton(button);
+            player.close();
+            return;
+        }
+        
+        const urls = [];
+        let failed = false;
+        await readEventStream(response, (event, data) => {
+            if (event === 'chunk') {
+                urls[data.index] = data.audio_url;
+                player.enqueue(data.audio_url);
+            } else if (event === 'error') {
+                failed = true;
+                showError(data.error || 'Lỗi TTS.');
+            }
+        });
+        
+        // Replays fetch the (HTTP-cached) chunk URLs directly
+        if (!failed && urls.length) {
+            audioUrls.set(cacheKey, urls);
         }
     } catch (error) {
         showError('Không thể kết nối TTS.');
-        resetPlayButton(button);
     }
+    player.close();
 }
 
 function resetPlayButton(button) {
@@ -139,20 +240,33 @@ chatForm.addEventListener('submit', async (e) => {
             user_id: userId
         };
         
-        const res = await fetch('/api/translate', {
+        const res = await fetch('/api/translate/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(requestBody)
         });
         
-        const data = await res.json();
-        
-        if (res.ok) {
-            const langInfo = `🔄 ${data.detected_lang === 'vi' ? 'Việt' : 'Nhật'} → ${data.target_lang === 'vi' ? 'Việt' : 'Nhật'} (${data.latency_ms}ms)`;
-            appendBubble(data.reply, 'bot', langInfo);
-        } else {
+        if (!res.ok) {
+            const data = await res.json();
             showError(data.error || 'Lỗi máy chủ.');
+            return;
         }
+        
+        // Render tokens incrementally as they stream in
+        let streamed = null;
+        await readEventStream(res, (event, data) => {
+            if (event === 'meta') {
+                streamed = appendBubble('', 'bot', formatLangInfo(data));
+            } else if (event === 'delta' && streamed) {
+                streamed.content.textContent += data.content;
+                chatBox.scrollTop = chatBox.scrollHeight;
+            } else if (event === 'done' && streamed) {
+                streamed.content.textContent = data.reply;
+                streamed.extraDiv.innerHTML = formatLangInfo(data);
+            } else if (event === 'error') {
+                showError(data.error || 'Lỗi máy chủ.');
+            }
+        });
     } catch (err) {
         showError('Không kết nối được máy chủ.');
     }
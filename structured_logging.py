@@ -0,0 +1,151 @@
+"""JSON log lines written off the request path.
+
+Handlers only put records on an in-memory queue; a background listener
+thread formats them and writes the (rotating) log file, so a slow disk
+never stalls a request. Structured fields are passed with `extra=`:
+
+    logging.info("translate ok", extra={"request_id": req_id, "stages_ms": timer.as_dict()})
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, message and the extra fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the extra fields instead of pre-formatting the line"""
+
+    def prepare(self, record):
+        # Resolve args and tracebacks in the calling thread (they may not be
+        # picklable or stay valid), leave the final formatting to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class StageTimer:
+    """Collect named stage durations of one request for its log line"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = round(self.stages.get(name, 0) + seconds * 1000, 1)
+
+    def as_dict(self):
+        """Stage durations in ms, plus the total since the timer was created"""
+        return dict(self.stages, total=round((time.perf_counter() - self.started) * 1000, 1))
+
+
+def create_file_handler(path, max_bytes=0, backup_count=5, when=""):
+    """Size-based rotation (max_bytes), time-based rotation (when, e.g. "midnight"),
+    or neither: a WatchedFileHandler that reopens the file after external logrotate"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                         encoding="utf-8", utc=True)
+    if max_bytes > 0:
+        return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                    encoding="utf-8")
+    return logging.handlers.WatchedFileHandler(path, encoding="utf-8")
+
+
+def setup_logging(path="chatbot.log", level="INFO", json_format=True, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, when="", multiprocess=False):
+    """Route the root logger through a queue to a background file writer.
+
+    Several processes rotating one file would rename it under each other, so
+    with `multiprocess` (and in any forked child) the file is written with a
+    WatchedFileHandler and rotation is left to an external logrotate.
+    """
+    rotate = bool(when or max_bytes > 0)
+    if multiprocess:
+        file_handler = create_file_handler(path)
+    else:
+        file_handler = create_file_handler(path, max_bytes, backup_count, when)
+    if json_format:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+    queue_handler = StructuredQueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    state = {"listener": None, "handler": file_handler}
+
+    def start_listener():
+        listener = logging.handlers.QueueListener(queue_handler.queue, state["handler"], respect_handler_level=True)
+        listener.start()
+        state["listener"] = listener
+
+    def restart_in_child():
+        # The writer thread does not survive fork (gunicorn workers); give the
+        # child a fresh queue and its own writer, appending to the file the
+        # parent may still rotate
+        if isinstance(state["handler"], logging.handlers.BaseRotatingHandler):
+            watched = create_file_handler(path)
+            watched.setFormatter(state["handler"].formatter)
+            state["handler"] = watched
+        queue_handler.queue = queue.SimpleQueue()
+        start_listener()
+
+    def stop_listener():
+        if state["listener"] is not None:
+            state["listener"].stop()  # drains queued records before returning
+            state["listener"] = None
+
+    start_listener()
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=restart_in_child)
+    atexit.register(stop_listener)
+    if multiprocess and rotate:
+        logging.warning("Log rotation is disabled with several worker processes; rotate the log file with logrotate")
+    return queue_handler
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the conversation context stores (idle TTL, entry/byte caps, redis counting)
+
+Run: python -m pytest test_context_store.py  (or python test_context_store.py)
+"""
+
+import unittest
+from unittest import mock
+
+from context_store import MemoryContextStore, RedisContextStore, _message_bytes
+
+
+def messages(text):
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": text.upper()}]
+
+
+class FakeRedis:
+    """Just enough of the redis client for RedisContextStore; fails loudly on SCAN"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+        self.expiry = {}
+        self.zsets = {}
+
+    def _live(self, key):
+        if key in self.expiry and self.expiry[key] <= self.clock():
+            self.values.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.values
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def get(self, key):
+        return self.values[key] if self._live(key) else None
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expiry[key] = self.clock() + ex
+
+    def expire(self, key, seconds):
+        if self._live(key):
+            self.expiry[key] = self.clock() + seconds
+
+    def delete(self, key):
+        self.values.pop(key, None)
+        self.expiry.pop(key, None)
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.get(key, {})
+        for member in [m for m, score in zset.items() if score <= high]:
+            del zset[member]
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def scan_iter(self, *args, **kwargs):
+        raise AssertionError("count() must not scan the keyspace")
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        return lambda *args, **kwargs: self.calls.append((method, args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class MemoryContextStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("context_store.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip_returns_copy(self):
+        store = MemoryContextStore()
+        store.save("u1", messages("xin chào"))
+        history = store.get("u1")
+        history.append({"role": "user", "content": "extra"})
+        self.assertEqual(store.get("u1"), messages("xin chào"))
+        self.assertEqual(store.get("missing"), [])
+
+    def test_idle_ttl_expires_entry(self):
+        store = MemoryContextStore(idle_ttl=60)
+        store.save("u1", messages("a"))
+        self.now += 60
+        self.assertEqual(store.get("u1"), messages("a"))
+        self.now += 61
+        self.assertEqual(store.get("u1"), [])
+        self.assertEqual(store.stats()["bytes"], 0)
+
+    def test_reads_refresh_idle_ttl(self):
+        store = MemoryContextStore(idle_ttl=60)
+        store.save("u1", messages("a"))
+        store.save("u2", messages("b"))
+        self.now += 40
+        store.get("u1")
+        self.now += 40
+        self.assertEqual(store.count(), 1)
+        self.assertEqual(store.get("u1"), messages("a"))
+        self.assertEqual(store.get("u2"), [])
+
+    def test_entry_cap_evicts_least_recently_used(self):
+        store = MemoryContextStore(max_entries=2)
+        store.save("u1", messages("a"))
+        store.save("u2", messages("b"))
+        store.get("u1")
+        store.save("u3", messages("c"))
+        self.assertEqual(store.get("u2"), [])
+        self.assertEqual(store.get("u1"), messages("a"))
+        self.assertEqual(store.get("u3"), messages("c"))
+        self.assertEqual(store.evictions, 1)
+
+    def test_byte_cap_evicts_until_under_budget(self):
+        size = _message_bytes(messages("x" * 100))
+        store = MemoryContextStore(max_bytes=int(size * 2.5))
+        for user_id in ("u1", "u2", "u3"):
+            store.save(user_id, messages("x" * 100))
+        self.assertEqual(store.count(), 2)
+        self.assertEqual(store.stats()["bytes"], 2 * size)
+        self.assertEqual(store.get("u1"), [])
+
+    def test_overwrite_and_delete_keep_byte_count(self):
+        store = MemoryContextStore()
+        store.save("u1", messages("short"))
+        store.save("u1", messages("a much longer message"))
+        self.assertEqual(store.stats()["bytes"], _message_bytes(messages("a much longer message")))
+        store.delete("u1")
+        self.assertEqual(store.stats(), {"backend": "memory", "entries": 0, "bytes": 0, "evictions": 0})
+
+
+class RedisContextStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("context_store.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = RedisContextStore(FakeRedis(lambda: self.now), idle_ttl=60)
+
+    def test_count_tracks_save_delete_and_idle_expiry(self):
+        self.store.save("u1", messages("a"))
+        self.store.save("u2", messages("b"))
+        self.store.save("u1", messages("c"))
+        self.assertEqual(self.store.count(), 2)
+        self.store.delete("u2")
+        self.assertEqual(self.store.count(), 1)
+        self.now += 40
+        self.store.save("u3", messages("d"))
+        self.now += 40
+        self.assertEqual(self.store.count(), 1)
+        self.assertEqual(self.store.get("u1"), [])
+        self.assertEqual(self.store.stats(), {"backend": "redis", "entries": 1})
+
+    def test_reads_refresh_idle_ttl(self):
+        self.store.save("u1", messages("a"))
+        self.now += 40
+        self.assertEqual(self.store.get("u1"), messages("a"))
+        self.now += 40
+        self.assertEqual(self.store.count(), 1)
+        self.assertEqual(self.store.get("u1"), messages("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Unit tests for token-budgeted history windowing
+
+Run: python -m pytest test_history_window.py  (or python test_history_window.py)
+"""
+
+import unittest
+
+from history_window import (window_history, history_budget_for_model, message_tokens, SUMMARY_PREFIX,
+                            DEFAULT_HISTORY_BUDGET)
+
+
+def turns(count):
+    """Alternating user/assistant messages, oldest first"""
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"tin nhắn số {i} " * 5}
+            for i in range(count)]
+
+
+def tokens(messages):
+    return sum(message_tokens(message) for message in messages)
+
+
+class WindowHistoryTest(unittest.TestCase):
+    def test_everything_fits(self):
+        history = turns(6)
+        kept, dropped = window_history(history, budget=tokens(history))
+        self.assertEqual((kept, dropped), (history, []))
+
+    def test_keeps_newest_messages_within_budget(self):
+        history = turns(10)
+        budget = tokens(history[-4:]) + message_tokens(history[-5]) - 1
+        kept, dropped = window_history(history, budget)
+        self.assertEqual(kept, history[-4:])
+        self.assertEqual(dropped, history[:-4])
+        self.assertLessEqual(tokens(kept), budget)
+
+    def test_window_never_starts_with_assistant_reply(self):
+        history = turns(10)
+        kept, dropped = window_history(history, budget=tokens(history[-3:]))
+        self.assertEqual(kept, history[-2:])
+        self.assertEqual(kept[0]["role"], "user")
+        self.assertEqual(dropped + kept, history)
+
+    def test_message_cap(self):
+        history = turns(30)
+        kept, dropped = window_history(history, budget=10 ** 6, max_messages=20)
+        self.assertEqual(kept, history[-20:])
+        self.assertEqual(len(dropped), 10)
+
+    def test_summary_is_kept_and_counted(self):
+        summary = {"role": "system", "content": SUMMARY_PREFIX + "đã hỏi về chi phí công tác"}
+        history = turns(8)
+        budget = message_tokens(summary) + tokens(history[-2:])
+        kept, dropped = window_history([summary] + history, budget, max_messages=20)
+        self.assertEqual(kept, [summary] + history[-2:])
+        self.assertEqual(dropped, history[:-2])
+        kept, _ = window_history([summary] + history, budget=10 ** 6, max_messages=5)
+        self.assertEqual(kept, [summary] + history[-4:])
+
+    def test_tiny_budget_keeps_nothing(self):
+        kept, dropped = window_history(turns(4), budget=1)
+        self.assertEqual(kept, [])
+        self.assertEqual(len(dropped), 4)
+
+
+class HistoryBudgetTest(unittest.TestCase):
+    def test_longest_model_prefix_wins(self):
+        self.assertEqual(history_budget_for_model("gpt-4o-mini-2024-07-18"), 3000)
+        self.assertEqual(history_budget_for_model("gpt-3.5-turbo-0125"), 1500)
+        self.assertEqual(history_budget_for_model("local-model"), DEFAULT_HISTORY_BUDGET)
+
+    def test_override_wins(self):
+        self.assertEqual(history_budget_for_model("gpt-4o", override=800), 800)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Unit tests for packed batch replies (several sentences in one chat completion)
+
+Run: python -m pytest test_packed_batch.py  (or python test_packed_batch.py)
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+# Import the app without TTS, translation memory files or real credentials
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TTS_ENABLED", "false")
+os.environ.setdefault("TRANSLATION_MEMORY", "false")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "chatbot_test.log"))
+
+from main import parse_packed_reply, packed_group_messages  # noqa: E402
+
+
+def packed(translations):
+    return json.dumps([{"i": i, "t": text} for i, text in enumerate(translations)], ensure_ascii=False)
+
+
+class ParsePackedReplyTest(unittest.TestCase):
+    def test_well_formed_reply(self):
+        self.assertEqual(parse_packed_reply(packed(["こんにちは", "ありがとう"]), 2), ["こんにちは", "ありがとう"])
+
+    def test_entries_out_of_order_are_reordered(self):
+        reply = json.dumps([{"i": 1, "t": "b"}, {"i": "0", "t": "a"}])
+        self.assertEqual(parse_packed_reply(reply, 2), ["a", "b"])
+
+    def test_markdown_fence_is_stripped(self):
+        for reply in (f"```json\n{packed(['a'])}\n```", f"```\n{packed(['a'])}\n```", f"  {packed(['a'])}\n"):
+            with self.subTest(reply=reply):
+                self.assertEqual(parse_packed_reply(reply, 1), ["a"])
+
+    def test_non_string_translation_is_stringified(self):
+        self.assertEqual(parse_packed_reply('[{"i": 0, "t": 42}]', 1), ["42"])
+
+    def test_truncated_or_invalid_json(self):
+        full = packed(["một", "hai", "ba"])
+        for reply in (full[:len(full) // 2], full[:-1], "", "not json", "```json", "{"):
+            with self.subTest(reply=reply):
+                self.assertIsNone(parse_packed_reply(reply, 3))
+
+    def test_missing_extra_or_duplicate_entries(self):
+        for reply in (packed(["a", "b"]), packed(["a", "b", "c", "d"]),
+                      json.dumps([{"i": 0, "t": "a"}, {"i": 0, "t": "a"}, {"i": 2, "t": "c"}]),
+                      json.dumps([{"i": 0, "t": "a"}, {"i": 1, "t": "b"}, {"i": 3, "t": "d"}])):
+            with self.subTest(reply=reply):
+                self.assertIsNone(parse_packed_reply(reply, 3))
+
+    def test_wrong_shapes(self):
+        for reply in ('{"i": 0, "t": "a"}', '[["a"]]', '[{"t": "a"}]', '[{"i": 0}]', '[{"i": "x", "t": "a"}]',
+                      '["a"]', "null", "3"):
+            with self.subTest(reply=reply):
+                self.assertIsNone(parse_packed_reply(reply, 1))
+
+
+class PackedGroupMessagesTest(unittest.TestCase):
+    def test_input_is_indexed_json(self):
+        system, user = packed_group_messages("vi", "ja", ["Xin chào", "Cảm ơn"], hints="- khách sạn => ホテル")
+        self.assertEqual(json.loads(user["content"]), [{"i": 0, "t": "Xin chào"}, {"i": 1, "t": "Cảm ơn"}])
+        self.assertIn("từ vi sang ja", system["content"])
+        self.assertTrue(system["content"].endswith("- khách sạn => ホテル"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Unit tests for translation memory fuzzy lookup (NgramIndex against a brute-force Dice scan)
+
+Run: python -m pytest test_translation_memory.py  (or python test_translation_memory.py)
+"""
+
+import random
+import unittest
+
+from translation_memory import NgramIndex, INDEX_FEATURES, ngram_keys, normalize_segment
+
+VI_WORDS = ("chi phí công tác ngày khách sạn ở đâu bao nhiêu tôi muốn đặt phòng cho hai người "
+            "hôm nay trời đẹp quá xin cảm ơn bạn rất nhiều").split()
+JA_CHARS = "出張費はいくらですかホテルどこ部屋予約二人今日天気ありがとうございます日間の"
+
+
+def make_texts(language, count, seed):
+    rng = random.Random(seed)
+    if language == "vi":
+        return [" ".join(rng.choice(VI_WORDS) for _ in range(rng.randint(3, 12))) for _ in range(count)]
+    return ["".join(rng.choice(JA_CHARS) for _ in range(rng.randint(4, 20))) for _ in range(count)]
+
+
+def mutate(rng, text, language):
+    """Near-duplicate of `text`: one token replaced, dropped or appended"""
+    tokens = text.split() if language == "vi" else list(text)
+    position = rng.randrange(len(tokens))
+    edit = rng.randrange(3)
+    if edit == 0:
+        tokens[position] = rng.choice(VI_WORDS if language == "vi" else JA_CHARS)
+    elif edit == 1 and len(tokens) > 2:
+        del tokens[position]
+    else:
+        tokens.append(rng.choice(VI_WORDS if language == "vi" else JA_CHARS))
+    return (" " if language == "vi" else "").join(tokens)
+
+
+def brute_force(index, texts, query, min_score, limit):
+    """Dice coefficient of n-gram sets against every text, best first (ties by id)"""
+    query_keys = ngram_keys(index.tokens(query), index.n)
+    scores = []
+    for segment_id, text in enumerate(texts):
+        keys = ngram_keys(index.tokens(text), index.n)
+        score = round(2 * len(query_keys & keys) / (len(query_keys) + len(keys)), 4)
+        if score >= min_score:
+            scores.append((score, segment_id))
+    scores.sort(key=lambda match: (-match[0], match[1]))
+    return scores[:limit]
+
+
+class NgramIndexTest(unittest.TestCase):
+    def check_language(self, language):
+        texts = [normalize_segment(text) for text in make_texts(language, 600, seed=1)]
+        index = NgramIndex(**INDEX_FEATURES[language])
+        # Most texts in the numpy-built main index, the rest in the delta
+        index.texts = texts[:500]
+        index.rebuild()
+        for text in texts[500:]:
+            index.add(text)
+
+        rng = random.Random(2)
+        for min_score in (0.5, 0.7, 0.9):
+            for _ in range(60):
+                query = normalize_segment(mutate(rng, rng.choice(texts), language))
+                with self.subTest(language=language, query=query, min_score=min_score):
+                    self.assertEqual(index.search(query, min_score, limit=5),
+                                     brute_force(index, texts, query, min_score, 5))
+
+    def test_vietnamese_word_bigrams(self):
+        self.check_language("vi")
+
+    def test_japanese_char_trigrams(self):
+        self.check_language("ja")
+
+    def test_exact_text_scores_one(self):
+        index = NgramIndex(**INDEX_FEATURES["ja"])
+        for text in ("出張費はいくらですか", "ホテルはどこですか"):
+            index.add(text)
+        self.assertEqual(index.search("ホテルはどこですか")[0], (1.0, 1))
+
+    def test_empty_index_and_unknown_words(self):
+        index = NgramIndex(**INDEX_FEATURES["vi"])
+        self.assertEqual(index.search("xin chào"), [])
+        index.texts = ["xin chào bạn"]
+        index.rebuild()
+        self.assertEqual(index.search("hoàn toàn khác"), [])
+        self.assertEqual(index.search(""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
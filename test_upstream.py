@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the upstream call policy: circuit breaker, adaptive limiter, retries
+
+Run: python -m pytest test_upstream.py  (or python test_upstream.py)
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+import openai
+
+from upstream import CircuitBreaker, AdaptiveLimiter, RetryPolicy, UpstreamUnavailable, DeadlineExceeded
+
+
+ERRORS = {400: openai.BadRequestError, 429: openai.RateLimitError}
+
+
+def api_error(status, headers=None):
+    """The openai.APIStatusError the SDK raises for `status`"""
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return ERRORS.get(status, openai.InternalServerError)("error", response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("upstream.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.rejected, 1)
+        self.assertEqual(self.breaker.times_opened, 1)
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_half_open_lets_one_probe_through(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 5
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 5
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertFalse(self.breaker.allow())
+
+    def test_probe_success_closes(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertTrue(self.breaker.allow())
+
+    def test_probe_failure_reopens(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.times_opened, 2)
+        self.assertEqual(self.breaker.retry_in(), 10)
+
+    def test_released_probe_allows_another(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release_probe()
+        self.assertTrue(self.breaker.allow())
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def test_fast_successes_raise_limit(self):
+        limiter = AdaptiveLimiter(initial=4, min_limit=2, max_limit=6, latency_target_ms=100)
+        for _ in range(4):
+            self.assertTrue(limiter.try_acquire())
+            limiter.release(latency_ms=10)
+        # +1/limit per success: about one slot per round trip
+        self.assertAlmostEqual(limiter.limit, 5.0, delta=0.1)
+        for _ in range(100):
+            self.assertTrue(limiter.try_acquire())
+            limiter.release(latency_ms=10)
+        self.assertEqual(limiter.limit, 6)
+
+    def test_failure_and_slow_calls_back_off_once_per_second(self):
+        clock = FakeClock()
+        with mock.patch("upstream.time.monotonic", clock):
+            limiter = AdaptiveLimiter(initial=10, min_limit=4, latency_target_ms=100, backoff=0.5)
+            limiter.try_acquire()
+            limiter.release(latency_ms=10, failed=True)
+            self.assertEqual(limiter.limit, 5)
+            limiter.try_acquire()
+            limiter.release(latency_ms=500)
+            self.assertEqual(limiter.limit, 5)
+            clock.now += 1
+            limiter.try_acquire()
+            limiter.release(latency_ms=500)
+            self.assertEqual(limiter.limit, 4)
+
+    def test_release_without_latency_does_not_adapt(self):
+        limiter = AdaptiveLimiter(initial=4)
+        limiter.try_acquire()
+        limiter.release()
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_sheds_when_saturated(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, queue_timeout=0.05)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.try_acquire())
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.rejected, 1)
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+
+
+class AsyncAcquireTest(unittest.TestCase):
+    def test_waiter_is_woken_by_release_from_a_thread(self):
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, queue_timeout=5)
+
+        async def run():
+            self.assertTrue(await limiter.acquire_async())
+            threading.Timer(0.05, limiter.release).start()
+            started = time.monotonic()
+            acquired = await limiter.acquire_async()
+            return acquired, time.monotonic() - started
+
+        acquired, waited = asyncio.run(run())
+        self.assertTrue(acquired)
+        self.assertLess(waited, 1)
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_times_out_when_no_slot_frees_up(self):
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, queue_timeout=0.05)
+
+        async def run():
+            await limiter.acquire_async()
+            return await limiter.acquire_async()
+
+        self.assertFalse(asyncio.run(run()))
+        self.assertEqual(limiter.rejected, 1)
+        self.assertEqual(limiter._async_waiters, [])
+
+    def test_cancelled_waiter_passes_the_slot_on(self):
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, queue_timeout=5)
+
+        async def run():
+            await limiter.acquire_async()
+            first = asyncio.create_task(limiter.acquire_async())
+            second = asyncio.create_task(limiter.acquire_async())
+            await asyncio.sleep(0.01)
+            # release() picks the first waiter, which is cancelled before it runs
+            limiter.release()
+            first.cancel()
+            return await asyncio.wait_for(second, 1)
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(limiter.in_flight, 1)
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        patcher = mock.patch("upstream.time.sleep", self.sleeps.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def failing(self, *errors, result="ok"):
+        """fn raising `errors` in turn, then returning `result`; calls are recorded"""
+        calls = []
+
+        def fn(**kwargs):
+            calls.append(kwargs)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return result
+        return fn, calls
+
+    def test_stops_at_attempt_cap(self):
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+        fn, calls = self.failing(*[api_error(500)] * 5)
+        with self.assertRaises(openai.InternalServerError):
+            policy.call(fn)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_does_not_retry_client_errors(self):
+        policy = RetryPolicy(max_attempts=3)
+        fn, calls = self.failing(api_error(400))
+        with self.assertRaises(openai.BadRequestError):
+            policy.call(fn)
+        self.assertEqual(len(calls), 1)
+
+    def test_honors_retry_after(self):
+        policy = RetryPolicy(max_attempts=3, max_delay=8)
+        fn, calls = self.failing(api_error(429, {"retry-after": "2"}), api_error(503, {"retry-after-ms": "250"}))
+        self.assertEqual(policy.call(fn), "ok")
+        self.assertEqual(self.sleeps, [2.0, 0.25])
+
+    def test_retry_after_beyond_max_delay_gives_up(self):
+        policy = RetryPolicy(max_attempts=3, max_delay=8)
+        fn, calls = self.failing(api_error(429, {"retry-after": "30"}))
+        with self.assertRaises(openai.RateLimitError):
+            policy.call(fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=1, max_delay=2)
+        fn, _ = self.failing(*[api_error(502)] * 4)
+        policy.call(fn)
+        self.assertEqual(len(self.sleeps), 4)
+        self.assertTrue(all(0 <= delay <= 2 for delay in self.sleeps))
+
+    def test_deadline_caps_attempt_timeout_and_retries(self):
+        clock = FakeClock()
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            clock.now += seconds
+
+        policy = RetryPolicy(max_attempts=5)
+        fn, calls = self.failing(*[api_error(429, {"retry-after": "3"})] * 5)
+        with mock.patch("upstream.time.monotonic", clock), mock.patch("upstream.time.sleep", sleep):
+            with self.assertRaises(openai.RateLimitError):
+                policy.call(fn, deadline=clock.now + 5, timeout=15)
+        # The first attempt gets the 5s left; a 3s wait still fits, a second one would not
+        self.assertEqual(calls[0]["timeout"], 5)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.sleeps, [3.0])
+
+    def test_past_deadline_starts_no_attempt(self):
+        fn, calls = self.failing()
+        with self.assertRaises(DeadlineExceeded):
+            RetryPolicy().call(fn, deadline=time.monotonic() - 1)
+        self.assertEqual(calls, [])
+
+    def test_breaker_refusal_releases_limiter_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        limiter = AdaptiveLimiter(initial=4)
+        policy = RetryPolicy(max_attempts=1, breaker=breaker, limiter=limiter)
+        fn, _ = self.failing(api_error(500))
+        with self.assertRaises(openai.InternalServerError):
+            policy.call(fn)
+        with self.assertRaises(UpstreamUnavailable):
+            policy.call(fn)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_open_breaker_refuses_without_waiting_for_a_slot(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, queue_timeout=5)
+        limiter.try_acquire()
+        policy = RetryPolicy(breaker=breaker, limiter=limiter)
+        fn, calls = self.failing()
+        started = time.monotonic()
+        with self.assertRaises(UpstreamUnavailable):
+            policy.call(fn)
+
+        async def create(**kwargs):
+            return "ok"
+
+        with self.assertRaises(UpstreamUnavailable):
+            asyncio.run(policy.acall(create))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((calls, limiter.in_flight), ([], 1))
+
+    def test_probe_is_released_when_limiter_sheds(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, queue_timeout=0.01)
+        limiter.try_acquire()
+        policy = RetryPolicy(breaker=breaker, limiter=limiter)
+        fn, _ = self.failing()
+        with self.assertRaises(UpstreamUnavailable):
+            policy.call(fn)
+        limiter.release()
+        self.assertEqual(policy.call(fn), "ok")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_stream_holds_limiter_slot_until_exhausted(self):
+        limiter = AdaptiveLimiter(initial=4)
+        policy = RetryPolicy(limiter=limiter)
+        stream = policy.call(lambda **kwargs: iter_stream(["a", "b"]), stream=True)
+        self.assertEqual(limiter.in_flight, 1)
+        self.assertEqual(list(stream), ["a", "b"])
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_closed_stream_releases_limiter_slot(self):
+        limiter = AdaptiveLimiter(initial=4)
+        policy = RetryPolicy(limiter=limiter)
+        stream = policy.call(lambda **kwargs: iter_stream(["a", "b"]), stream=True)
+        self.assertEqual(next(stream), "a")
+        stream.close()
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_async_retries_and_stream(self):
+        limiter = AdaptiveLimiter(initial=4)
+        policy = RetryPolicy(max_attempts=2, base_delay=0, limiter=limiter)
+        attempts = []
+
+        async def create(**kwargs):
+            attempts.append(kwargs)
+            if len(attempts) == 1:
+                raise api_error(503)
+            return AsyncStream(["a", "b"])
+
+        async def run():
+            stream = await policy.acall(create, stream=True)
+            held = limiter.in_flight
+            return held, [chunk async for chunk in stream]
+
+        held, chunks = asyncio.run(run())
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual((held, chunks), (1, ["a", "b"]))
+        self.assertEqual(limiter.in_flight, 0)
+
+
+def iter_stream(chunks):
+    # A generator has close() like openai.Stream
+    yield from chunks
+
+
+class AsyncStream:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
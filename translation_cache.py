@@ -0,0 +1,173 @@
+"""Translation result cache (in-memory LRU with TTL, optional SQLite backend)"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Normalize source text so trivially different inputs share a cache entry"""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def make_cache_key(text, source_lang, target_lang, model, prompt_version):
+    """Build a cache key from normalized text, language pair, model and prompt version"""
+    raw = "\x1f".join([prompt_version, model, source_lang, target_lang, normalize_text(text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class BaseTranslationCache:
+    """Common hit/miss accounting; subclasses implement _get/_set/_size"""
+    backend = "base"
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        value = self._get(key) if self.max_entries > 0 else None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.max_entries > 0 and value:
+            self._set(key, value)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": self._size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class MemoryTranslationCache(BaseTranslationCache):
+    """Thread-safe in-process LRU cache with per-entry TTL"""
+    backend = "memory"
+
+    def __init__(self, max_entries=2000, ttl=86400):
+        super().__init__(max_entries, ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _size(self):
+        return len(self._entries)
+
+
+class SQLiteTranslationCache(BaseTranslationCache):
+    """On-disk cache shared across processes and restarts (SQLite in WAL mode)"""
+    backend = "sqlite"
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries=100000, ttl=86400 * 30):
+        super().__init__(max_entries, ttl)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._writes = 0
+        self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_accessed ON translations(accessed_at)")
+        self._conn.commit()
+        # A SQLite connection must not be used across fork(); prefork servers
+        # (serve.py) import the app once and fork workers, so reopen in each child
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE translations SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def _set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            self._conn.commit()
+
+    def _prune(self, now):
+        """Drop expired rows, then least recently used rows beyond max_entries"""
+        self._conn.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM translations WHERE key IN ("
+            "SELECT key FROM translations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def _size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+
+def create_translation_cache(backend="memory", max_entries=2000, ttl=86400, path="cache/translations.db"):
+    """Create the configured cache backend ("memory", "sqlite" or "none")"""
+    if backend == "sqlite":
+        return SQLiteTranslationCache(path, max_entries=max_entries, ttl=ttl)
+    if backend == "none":
+        cache = MemoryTranslationCache(max_entries=0, ttl=ttl)
+        cache.backend = "none"
+        return cache
+    return MemoryTranslationCache(max_entries=max_entries, ttl=ttl)
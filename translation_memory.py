@@ -0,0 +1,495 @@
+"""Translation memory: approved vi<->ja segment pairs and glossary terms with fuzzy lookup.
+
+Pairs live in SQLite and are indexed in memory per language: a dict for
+exact matches on normalized text and an n-gram inverted index for fuzzy
+matches (word bigrams for Vietnamese, character trigrams for Japanese).
+The bulk of the index is built with one numpy sort into sorted posting
+lists; pairs added later go to a small delta index that is folded in by a
+rebuild every REBUILD_EVERY additions.
+
+Fuzzy lookup scores candidates by the Dice coefficient of n-gram sets. A
+segment reaching `min_score` must share one of the query's rarest n-grams
+(prefix filtering), so only those posting lists are scanned; the remaining
+n-grams are checked for the surviving candidates by binary search.
+
+Import pairs: python translation_memory.py import pairs.tsv [--glossary] [--path cache/translation_memory.db]
+(one "vietnamese<TAB>japanese" pair per line)
+"""
+import argparse
+import itertools
+import logging
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy
+
+from translation_cache import normalize_text
+
+LANGUAGES = ("vi", "ja")
+REBUILD_EVERY = 5000
+# Fuzzy match features: word bigrams for Vietnamese (its syllables are short
+# and space-separated, so character trigrams are few and common, with very
+# long posting lists), character trigrams for Japanese
+INDEX_FEATURES = {"vi": {"n": 2, "words": True}, "ja": {"n": 3, "words": False}}
+TOKEN_BITS = 21
+BEGIN, END = 2, 3
+FIRST_WORD_ID = 4
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize_segment(text):
+    """Normalization used for exact matches and n-grams (NFC, case, whitespace)"""
+    return normalize_text(text).casefold()
+
+
+def ngram_keys(tokens, n):
+    """Set of n-gram keys (n 21-bit token ids packed in an int; n is 2 or 3) of a padded token list"""
+    if n == 2:
+        return {(a << 21) | b for a, b in zip(tokens, tokens[1:])}
+    return {(a << 42) | (b << 21) | c for a, b, c in zip(tokens, tokens[1:], tokens[2:])}
+
+
+def build_postings(codes, lengths, n):
+    """n-gram postings of texts given as concatenated padded token ids and their lengths.
+
+    Returns (sorted keys, CSR indptr, segment ids, n-gram count per text).
+    Tokens are replaced by their rank in the corpus alphabet, which keeps the
+    n-gram order but packs (n-gram, text) into one uint64, so a single plain
+    sort groups the postings by n-gram with ascending, unique ids.
+    """
+    count = len(lengths)
+    alphabet = numpy.unique(codes)
+    rank = numpy.zeros(int(alphabet[-1]) + 1, dtype=numpy.uint64)
+    rank[alphabet] = numpy.arange(len(alphabet), dtype=numpy.uint64)
+    ranks = rank[codes]
+    size = numpy.uint64(len(alphabet))
+    total = len(ranks) - n + 1
+    grams = ranks[:total]
+    for j in range(1, n):
+        grams = grams * size + ranks[j:total + j]
+    owner = numpy.repeat(numpy.arange(count, dtype=numpy.uint64), lengths)[:total]
+    # Drop n-grams that span two texts
+    valid = numpy.arange(total, dtype=numpy.int64) + n - 1 < numpy.cumsum(lengths)[owner]
+    grams, owner = grams[valid], owner[valid]
+    if len(alphabet) ** n * count < 2 ** 64:
+        packed = grams * numpy.uint64(count) + owner
+        packed.sort()
+        grams, owner = numpy.divmod(packed, numpy.uint64(count))
+    else:
+        order = numpy.lexsort((owner, grams))
+        grams, owner = grams[order], owner[order]
+    new_gram = numpy.ones(len(grams), dtype=bool)
+    new_gram[1:] = grams[1:] != grams[:-1]
+    new_pair = new_gram.copy()
+    new_pair[1:] |= owner[1:] != owner[:-1]
+    first = numpy.flatnonzero(new_gram[new_pair])
+    grams, ids = grams[new_pair][first], owner[new_pair].astype(numpy.int32)
+    keys = numpy.zeros(len(grams), dtype=numpy.uint64)
+    alphabet = alphabet.astype(numpy.uint64)
+    for j in range(n):
+        grams, digit = numpy.divmod(grams, size)
+        keys |= alphabet[digit] << numpy.uint64(TOKEN_BITS * j)
+    return keys, numpy.append(first, len(ids)), ids, numpy.bincount(ids, minlength=count)
+
+
+class NgramIndex:
+    """Inverted index of token n-grams over the normalized texts of one language.
+
+    Tokens are characters, or with `words` the words of the text mapped to
+    ids in a vocabulary that grows as texts are indexed.
+    """
+
+    def __init__(self, n=3, words=False):
+        self.n = n
+        self.words = words
+        self.texts = []
+        self._vocabulary = {}
+        self._keys = numpy.zeros(0, dtype=numpy.uint64)
+        self._indptr = numpy.zeros(1, dtype=numpy.int64)
+        self._ids = numpy.zeros(0, dtype=numpy.int32)
+        self._sizes = numpy.zeros(1024, dtype=numpy.int32)
+        self._delta = {}
+        self.delta_segments = 0
+
+    def __len__(self):
+        return len(self.texts)
+
+    def tokens(self, normalized, learn=False):
+        """Padded token ids of a text; unknown words get ids no indexed word has unless `learn`"""
+        if not self.words:
+            return [BEGIN, *map(ord, normalized), END]
+        tokens = [BEGIN]
+        unknown = FIRST_WORD_ID + len(self._vocabulary)
+        for word in WORD_PATTERN.findall(normalized):
+            token = self._vocabulary.get(word)
+            if token is None:
+                if learn:
+                    token = self._vocabulary[word] = FIRST_WORD_ID + len(self._vocabulary)
+                else:
+                    token = unknown
+                    unknown += 1
+            tokens.append(token)
+        tokens.append(END)
+        return tokens
+
+    def rebuild(self):
+        """Index every text with numpy (one sort over all n-grams), emptying the delta"""
+        count = len(self.texts)
+        self._delta = {}
+        self.delta_segments = 0
+        self._sizes = numpy.zeros(max(1024, 2 * count), dtype=numpy.int32)
+        if not count:
+            self._keys = numpy.zeros(0, dtype=numpy.uint64)
+            self._indptr = numpy.zeros(1, dtype=numpy.int64)
+            self._ids = numpy.zeros(0, dtype=numpy.int32)
+            return
+        if self.words:
+            words = [WORD_PATTERN.findall(text) for text in self.texts]
+            lengths = numpy.fromiter(map(len, words), dtype=numpy.int64, count=count) + 2
+            words = list(itertools.chain.from_iterable(words))
+            for word in dict.fromkeys(words).keys() - self._vocabulary.keys():
+                self._vocabulary[word] = FIRST_WORD_ID + len(self._vocabulary)
+            ends = numpy.cumsum(lengths)
+            codes = numpy.full(int(ends[-1]), BEGIN, dtype=numpy.uint32)
+            codes[ends - 1] = END
+            inner = numpy.ones(len(codes), dtype=bool)
+            inner[ends - lengths] = inner[ends - 1] = False
+            codes[inner] = numpy.fromiter(map(self._vocabulary.__getitem__, words), dtype=numpy.uint32,
+                                          count=len(words))
+        else:
+            padded = [f"{chr(BEGIN)}{text}{chr(END)}" for text in self.texts]
+            lengths = numpy.fromiter(map(len, padded), dtype=numpy.int64, count=count)
+            codes = numpy.frombuffer("".join(padded).encode("utf-32-le", "surrogatepass"), dtype=numpy.uint32)
+        self._keys, self._indptr, self._ids, sizes = build_postings(codes, lengths, self.n)
+        self._sizes[:count] = sizes
+
+    def add(self, normalized):
+        """Append one text to the delta index; returns its segment id"""
+        segment_id = len(self.texts)
+        self.texts.append(normalized)
+        keys = ngram_keys(self.tokens(normalized, learn=True), self.n)
+        for key in keys:
+            self._delta.setdefault(key, []).append(segment_id)
+        if segment_id >= len(self._sizes):
+            self._sizes = numpy.concatenate([self._sizes, numpy.zeros(len(self._sizes), dtype=numpy.int32)])
+        self._sizes[segment_id] = len(keys)
+        self.delta_segments += 1
+        return segment_id
+
+    def _posting_bounds(self, keys):
+        """Main-index (start, end) and delta id list of each query key"""
+        query = numpy.fromiter(keys, dtype=numpy.uint64, count=len(keys))
+        if len(self._keys):
+            positions = numpy.minimum(numpy.searchsorted(self._keys, query), len(self._keys) - 1)
+            found = self._keys[positions] == query
+            starts = numpy.where(found, self._indptr[positions], 0)
+            ends = numpy.where(found, self._indptr[positions + 1], 0)
+        else:
+            starts = ends = numpy.zeros(len(keys), dtype=numpy.int64)
+        deltas = [self._delta.get(key) for key in keys] if self._delta else [None] * len(keys)
+        lengths = ends - starts
+        if self._delta:
+            lengths = lengths + numpy.fromiter((len(d) if d else 0 for d in deltas), dtype=numpy.int64,
+                                               count=len(keys))
+        return starts.tolist(), ends.tolist(), deltas, lengths
+
+    def _posting(self, start, end, delta):
+        posting = self._ids[start:end]
+        if delta:
+            # Delta ids are all larger than indexed ones, so this stays sorted
+            posting = numpy.concatenate([posting, numpy.array(delta, dtype=numpy.int32)])
+        return posting
+
+    def search(self, normalized, min_score=0.7, limit=3):
+        """Return [(score, segment_id)] with Dice(n-grams) >= min_score, best first"""
+        keys = list(ngram_keys(self.tokens(normalized), self.n))
+        n = len(keys)
+        if not n or not self.texts:
+            return []
+        starts, ends, deltas, lengths = self._posting_bounds(keys)
+        # Dice >= t needs an overlap of at least t*n/(2-t) n-grams, so a match
+        # shares at least one of the n - overlap + 1 rarest query n-grams
+        min_overlap = max(1, math.ceil(min_score * n / (2 - min_score) - 1e-9))
+        order = numpy.argsort(lengths, kind="stable").tolist()
+        prefix = n - min_overlap + 1
+        head = [self._posting(starts[i], ends[i], deltas[i]) for i in order[:prefix] if lengths[i]]
+        if not head:
+            return []
+        candidates, counts = numpy.unique(numpy.concatenate(head), return_counts=True)
+        sizes = self._sizes[candidates]
+        # Length filter: Dice >= t needs t*n/(2-t) <= size <= n*(2-t)/t
+        keep = (sizes >= min_score * n / (2 - min_score)) & (sizes <= n * (2 - min_score) / min_score)
+        # Candidates also need enough overlap with the rest of the query to reach min_score
+        tail = order[prefix:]
+        keep &= 2 * (counts + len(tail)) >= min_score * (n + sizes)
+        candidates, counts, sizes = candidates[keep], counts[keep], sizes[keep]
+
+        for checked, i in enumerate(tail, 1):
+            if not candidates.size:
+                return []
+            if lengths[i]:
+                posting = self._posting(starts[i], ends[i], deltas[i])
+                found = numpy.searchsorted(posting, candidates)
+                counts = counts + (posting[numpy.minimum(found, posting.size - 1)] == candidates)
+            # Drop candidates that cannot reach min_score even if every remaining n-gram matches
+            alive = 2 * (counts + len(tail) - checked) >= min_score * (n + sizes)
+            if not alive.all():
+                candidates, counts, sizes = candidates[alive], counts[alive], sizes[alive]
+
+        scores = 2 * counts / (n + sizes)
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+        best = numpy.argsort(-scores, kind="stable")[:limit]
+        return [(round(float(scores[i]), 4), int(candidates[i])) for i in best]
+
+
+class Glossary:
+    """Term pairs found in a text by substring scan (word boundaries for Vietnamese)"""
+
+    def __init__(self):
+        self._buckets = {language: {} for language in LANGUAGES}
+        self._pairs = set()
+        self.size = 0
+
+    def __contains__(self, terms):
+        return (normalize_segment(terms["vi"]), normalize_segment(terms["ja"])) in self._pairs
+
+    def add(self, terms):
+        """terms: {"vi": ..., "ja": ...}; a pair that is already known is ignored"""
+        normalized = {language: normalize_segment(terms[language]) for language in LANGUAGES}
+        if (normalized["vi"], normalized["ja"]) in self._pairs:
+            return
+        self._pairs.add((normalized["vi"], normalized["ja"]))
+        for language in LANGUAGES:
+            if normalized[language]:
+                self._buckets[language].setdefault(normalized[language][:2], []).append((normalized[language], terms))
+        self.size += 1
+
+    def find(self, normalized, source_lang, limit=10):
+        """Glossary entries whose source_lang term occurs in the normalized text"""
+        buckets = self._buckets.get(source_lang)
+        if not buckets:
+            return []
+        found = []
+        seen = set()
+        for i in range(len(normalized)):
+            for key in (normalized[i:i + 2], normalized[i]):
+                for term, terms in buckets.get(key, ()):
+                    if id(terms) in seen or not normalized.startswith(term, i):
+                        continue
+                    end = i + len(term)
+                    if source_lang == "vi" and ((i and normalized[i - 1].isalnum()) or
+                                                (end < len(normalized) and normalized[end].isalnum())):
+                        continue
+                    seen.add(id(terms))
+                    found.append(terms)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+
+class TranslationMemory:
+    """Approved segment pairs and glossary terms in SQLite, indexed in memory for lookup.
+
+    Each process polls the database at most every `refresh_interval` seconds
+    for rows added by other processes (or the import command).
+    """
+
+    def __init__(self, path="cache/translation_memory.db", refresh_interval=5.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._connect()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "id INTEGER PRIMARY KEY, vi TEXT NOT NULL, ja TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS glossary ("
+            "id INTEGER PRIMARY KEY, vi TEXT NOT NULL, ja TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._indexes = {language: NgramIndex(**INDEX_FEATURES[language]) for language in LANGUAGES}
+        self._exact = {language: {} for language in LANGUAGES}
+        self._pairs = []
+        self._glossary = Glossary()
+        self._last_ids = {"segments": 0, "glossary": 0}
+        self._checked_at = 0.0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        started = time.perf_counter()
+        self.refresh()
+        self.load_seconds = round(time.perf_counter() - started, 3)
+        if self._pairs:
+            logging.info(f"Translation memory loaded: {len(self._pairs)} segments, "
+                         f"{self._glossary.size} terms in {self.load_seconds:.2f}s")
+        # A SQLite connection must not be used across fork(); see SQLiteTranslationCache
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def refresh(self):
+        """Index rows added to the database since the last refresh"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            segments = self._conn.execute(
+                "SELECT id, vi, ja FROM segments WHERE id > ? ORDER BY id", (self._last_ids["segments"],)
+            ).fetchall()
+            terms = self._conn.execute(
+                "SELECT id, vi, ja FROM glossary WHERE id > ? ORDER BY id", (self._last_ids["glossary"],)
+            ).fetchall()
+            if segments:
+                self._last_ids["segments"] = segments[-1][0]
+                self._index_segments([{"vi": vi, "ja": ja} for _, vi, ja in segments])
+            for row_id, vi, ja in terms:
+                self._glossary.add({"vi": vi, "ja": ja})
+                self._last_ids["glossary"] = row_id
+            return len(segments) + len(terms)
+
+    def _index_segments(self, pairs):
+        rebuild = self._indexes["vi"].delta_segments + len(pairs) > REBUILD_EVERY
+        for pair in pairs:
+            pair_id = len(self._pairs)
+            self._pairs.append(pair)
+            for language in LANGUAGES:
+                normalized = normalize_segment(pair[language])
+                index = self._indexes[language]
+                if rebuild:
+                    index.texts.append(normalized)
+                else:
+                    index.add(normalized)
+                # Later approvals of the same source text win
+                self._exact[language][normalized] = pair_id
+        if rebuild:
+            for index in self._indexes.values():
+                index.rebuild()
+
+    def _known(self, table, pair):
+        """True if the pair is already stored (segments: same translation of the same vi text)"""
+        if table == "glossary":
+            return pair in self._glossary
+        pair_id = self._exact["vi"].get(normalize_segment(pair["vi"]))
+        return pair_id is not None and normalize_segment(self._pairs[pair_id]["ja"]) == normalize_segment(pair["ja"])
+
+    def _insert(self, table, pairs):
+        with self._lock:
+            self.refresh()
+            rows = []
+            seen = set()
+            for pair in pairs:
+                pair = {"vi": str(pair.get("vi") or "").strip(), "ja": str(pair.get("ja") or "").strip()}
+                key = (normalize_segment(pair["vi"]), normalize_segment(pair["ja"]))
+                if pair["vi"] and pair["ja"] and key not in seen and not self._known(table, pair):
+                    seen.add(key)
+                    rows.append((pair["vi"], pair["ja"], time.time()))
+            if rows:
+                self._conn.executemany(f"INSERT INTO {table} (vi, ja, created_at) VALUES (?, ?, ?)", rows)
+                self._conn.commit()
+                self.refresh()
+        return len(rows)
+
+    def add_segments(self, pairs):
+        """Store approved {"vi", "ja"} segment pairs; returns how many were new and added"""
+        return self._insert("segments", pairs)
+
+    def add_terms(self, pairs):
+        """Store {"vi", "ja"} glossary term pairs; returns how many were new and added"""
+        return self._insert("glossary", pairs)
+
+    def lookup(self, text, source_lang, target_lang, min_score=0.7, limit=3, max_terms=10):
+        """Exact match, close matches and glossary terms for translating `text`.
+
+        Returns {"exact": translation or None, "matches": [{"source", "target",
+        "score"}], "terms": [{"source", "target"}]}.
+        """
+        result = {"exact": None, "matches": [], "terms": []}
+        if source_lang not in LANGUAGES or target_lang not in LANGUAGES or source_lang == target_lang:
+            return result
+        started = time.perf_counter()
+        if time.monotonic() - self._checked_at > self.refresh_interval:
+            self.refresh()
+        normalized = normalize_segment(text)
+        with self._lock:
+            pair_id = self._exact[source_lang].get(normalized)
+            if pair_id is not None:
+                result["exact"] = self._pairs[pair_id][target_lang]
+            else:
+                seen = set()
+                for score, segment_id in self._indexes[source_lang].search(normalized, min_score, limit * 2):
+                    pair = self._pairs[segment_id]
+                    if pair[target_lang] in seen:
+                        continue
+                    seen.add(pair[target_lang])
+                    result["matches"].append({"source": pair[source_lang], "target": pair[target_lang],
+                                              "score": score})
+                    if len(result["matches"]) >= limit:
+                        break
+                result["terms"] = [{"source": terms[source_lang], "target": terms[target_lang]}
+                                   for terms in self._glossary.find(normalized, source_lang, max_terms)]
+            self.lookup_seconds += time.perf_counter() - started
+            if result["exact"] is not None:
+                self.exact_hits += 1
+            elif result["matches"]:
+                self.fuzzy_hits += 1
+            else:
+                self.misses += 1
+        return result
+
+    def stats(self):
+        lookups = self.exact_hits + self.fuzzy_hits + self.misses
+        return {
+            "segments": len(self._pairs),
+            "glossary_terms": self._glossary.size,
+            "exact_hits": self.exact_hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "avg_lookup_us": round(self.lookup_seconds / lookups * 1e6, 1) if lookups else 0.0,
+            "load_seconds": self.load_seconds
+        }
+
+
+def read_pairs(path):
+    """Read "vietnamese<TAB>japanese" lines (blank lines and # comments are skipped)"""
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            vi, _, ja = line.partition("\t")
+            pairs.append({"vi": vi, "ja": ja})
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the translation memory")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    importer = subcommands.add_parser("import", help="import vi<TAB>ja pairs from a TSV file")
+    importer.add_argument("file")
+    importer.add_argument("--glossary", action="store_true", help="import as glossary terms instead of segments")
+    importer.add_argument("--path", default=os.getenv("TRANSLATION_MEMORY_PATH", "cache/translation_memory.db"))
+    args = parser.parse_args(argv)
+
+    memory = TranslationMemory(args.path)
+    pairs = read_pairs(args.file)
+    added = memory.add_terms(pairs) if args.glossary else memory.add_segments(pairs)
+    print(f"Imported {added} of {len(pairs)} {'terms' if args.glossary else 'segments'} into {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
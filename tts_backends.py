@@ -0,0 +1,157 @@
+"""Optional optimized CPU inference backends for the VITS TTS models.
+
+- eager:       the Hugging Face model as loaded (default)
+- quantized:   dynamic int8 quantization of the Linear layers
+- torchscript: traced TorchScript module, cached on disk
+- onnx:        ONNX Runtime session, exported once and cached on disk
+               (needs `pip install onnx onnxruntime`)
+
+Every backend is called like the original model (`model(**inputs)`) and
+returns an object with `waveform` and `sequence_lengths`, so synthesis code
+does not care which one is in use. A backend that cannot be built falls
+back to eager with a warning.
+"""
+import logging
+import os
+import re
+import types
+
+TTS_BACKENDS = ("eager", "quantized", "torchscript", "onnx")
+
+
+def traceable_vits(model):
+    """Torch module returning (waveform, sequence_lengths), the traceable subset of VitsModel"""
+    import torch
+
+    class TraceableVits(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            output = self.model(input_ids=input_ids, attention_mask=attention_mask)
+            return output.waveform, output.sequence_lengths
+
+    return TraceableVits(model).eval()
+
+
+class CompiledVits:
+    """Wrap a TorchScript module or ONNX Runtime session behind the VitsModel call interface"""
+
+    def __init__(self, run, config, backend):
+        self._run = run
+        self.config = config
+        self.backend = backend
+
+    def __call__(self, input_ids, attention_mask=None, **kwargs):
+        import torch
+
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        waveform, sequence_lengths = self._run(input_ids, attention_mask)
+        return types.SimpleNamespace(waveform=waveform, sequence_lengths=sequence_lengths)
+
+
+def artifact_path(artifact_dir, model_name, backend, suffix):
+    """Cache file for a compiled model; versions are part of the name so upgrades re-export"""
+    import torch
+    import transformers
+
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name.strip("/"))
+    return os.path.join(artifact_dir, f"{safe_name}-{backend}-torch{torch.__version__}"
+                                      f"-tf{transformers.__version__}{suffix}")
+
+
+def example_inputs(tokenizer):
+    """A padded two-item batch so the trace covers the attention-mask path"""
+    return tokenizer(["xin chào các bạn", "a"], return_tensors="pt", padding=True)
+
+
+def build_quantized(model):
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def build_torchscript(model, tokenizer, model_name, artifact_dir):
+    import torch
+
+    path = artifact_path(artifact_dir, model_name, "torchscript", ".pt")
+    if os.path.exists(path):
+        module = torch.jit.load(path)
+        logging.info(f"TTS TorchScript artifact loaded: {path}")
+    else:
+        inputs = example_inputs(tokenizer)
+        with torch.inference_mode():
+            module = torch.jit.trace(traceable_vits(model), (inputs["input_ids"], inputs["attention_mask"]),
+                                     check_trace=False)
+        os.makedirs(artifact_dir, exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial file
+        torch.jit.save(module, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        logging.info(f"TTS TorchScript artifact saved: {path}")
+    module.eval()
+    # The profiling executor specializes the graph over the first calls; do
+    # them here instead of on the first requests
+    inputs = example_inputs(tokenizer)
+    with torch.inference_mode():
+        for _ in range(2):
+            module(inputs["input_ids"], inputs["attention_mask"])
+    return CompiledVits(lambda input_ids, attention_mask: module(input_ids, attention_mask),
+                        model.config, "torchscript")
+
+
+def build_onnx(model, tokenizer, model_name, artifact_dir):
+    import numpy
+    import onnxruntime
+    import torch
+
+    path = artifact_path(artifact_dir, model_name, "onnx", ".onnx")
+    if not os.path.exists(path):
+        inputs = example_inputs(tokenizer)
+        os.makedirs(artifact_dir, exist_ok=True)
+        torch.onnx.export(
+            traceable_vits(model), (inputs["input_ids"], inputs["attention_mask"]), path + ".tmp",
+            input_names=["input_ids", "attention_mask"],
+            output_names=["waveform", "sequence_lengths"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "tokens"},
+                "attention_mask": {0: "batch", 1: "tokens"},
+                "waveform": {0: "batch", 1: "samples"},
+                "sequence_lengths": {0: "batch"}
+            },
+            opset_version=17,
+            dynamo=False
+        )
+        os.replace(path + ".tmp", path)
+        logging.info(f"TTS ONNX artifact saved: {path}")
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def run(input_ids, attention_mask):
+        waveform, sequence_lengths = session.run(None, {
+            "input_ids": input_ids.numpy().astype(numpy.int64),
+            "attention_mask": attention_mask.numpy().astype(numpy.int64)
+        })
+        return torch.from_numpy(waveform), torch.from_numpy(sequence_lengths)
+
+    return CompiledVits(run, model.config, "onnx")
+
+
+def build_backend(model, tokenizer, model_name, backend="eager", artifact_dir="cache/tts_artifacts"):
+    """Return (model_for_inference, backend_in_use); unknown or failing backends fall back to eager"""
+    if backend == "eager":
+        return model, "eager"
+    try:
+        if backend == "quantized":
+            return build_quantized(model), "quantized"
+        if backend == "torchscript":
+            return build_torchscript(model, tokenizer, model_name, artifact_dir), "torchscript"
+        if backend == "onnx":
+            return build_onnx(model, tokenizer, model_name, artifact_dir), "onnx"
+        logging.warning(f"Unknown TTS backend {backend!r}, using eager")
+    except Exception as e:
+        logging.warning(f"TTS backend {backend} unavailable for {model_name} ({type(e).__name__}: {e}), using eager")
+    return model, "eager"
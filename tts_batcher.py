@@ -0,0 +1,91 @@
+"""Micro-batching scheduler that coalesces concurrent TTS requests per language"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from tts_synthesis import synthesize_batch
+
+
+class TTSMicroBatcher:
+    """Collect requests arriving within a short window and synthesize them together.
+
+    Each language has one worker thread. It blocks for the first pending
+    request, then keeps collecting until `max_batch_size` requests are queued
+    or `max_wait_ms` has passed, and runs them as a single batched forward
+    pass. Callers get a Future resolving to (waveform, model_name).
+    """
+
+    def __init__(self, registry, max_batch_size=8, max_wait_ms=10):
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, language, text):
+        """Queue a text for synthesis and return a Future for its result"""
+        future = Future()
+        self._queue_for(language).put((text, future))
+        return future
+
+    def _queue_for(self, language):
+        pending = self._queues.get(language)
+        if pending is None:
+            with self._lock:
+                pending = self._queues.get(language)
+                if pending is None:
+                    pending = queue.Queue()
+                    worker = threading.Thread(
+                        target=self._run, args=(language, pending),
+                        name=f"tts-batcher-{language}", daemon=True
+                    )
+                    worker.start()
+                    self._queues[language] = pending
+        return pending
+
+    def _collect(self, pending):
+        """Block for one request, then gather more until the window closes"""
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, language, pending):
+        while True:
+            batch = self._collect(pending)
+            # Skip requests whose callers already gave up
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                model, tokenizer, model_name = self.registry.get(language)
+                waveforms = synthesize_batch(model, tokenizer, [text for text, _ in batch], language)
+            except Exception as e:
+                logging.error(f"TTS micro-batch {language} failed ({len(batch)} requests): {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, future), waveform in zip(batch, waveforms):
+                future.set_result((waveform, model_name))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": int(self.max_wait * 1000)
+        }
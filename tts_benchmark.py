@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+TTS inference backend benchmark: real-time factor, latency and memory
+
+Each (language, backend) pair runs in a fresh subprocess so load time and
+resident memory are not skewed by models loaded earlier. RTF is synthesis
+time divided by the duration of the produced audio (lower is better,
+< 1 means faster than real time).
+
+Run: python tts_benchmark.py --languages vi,ja --backends eager,quantized,torchscript --output tts_bench.json
+     python tts_benchmark.py --model vi=/path/to/local/mms-tts-vie --threads 2
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+SAMPLE_TEXTS = {
+    "vi": [
+        "Xin chào.",
+        "Hôm nay trời đẹp quá, chúng ta đi dạo nhé.",
+        "Cuộc họp sẽ bắt đầu lúc ba giờ chiều tại phòng số hai, xin mọi người chuẩn bị tài liệu "
+        "và đến đúng giờ để chúng ta có thể kết thúc sớm."
+    ],
+    "ja": [
+        "こんにちは。",
+        "今日は会議が長引いてしまいました。",
+        "来週の出張の準備はできていますか。資料は金曜日までに共有してください。よろしくお願いします。"
+    ]
+}
+
+
+def current_rss_mb():
+    """Resident memory of this process in MB (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(language, backend, model_name, runs, threads, artifact_dir):
+    """Load one model with one backend and time synthesis of the sample texts"""
+    import torch
+    import transformers  # noqa: F401  (counted in the baseline memory)
+    from tts_registry import TTSModelRegistry, TTS_MODEL_CANDIDATES
+    from tts_synthesis import synthesize_batch
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    rss_baseline = current_rss_mb()
+    candidates = {language: [model_name] if model_name else TTS_MODEL_CANDIDATES[language]}
+    registry = TTSModelRegistry(candidates=candidates, backends={language: backend}, artifact_dir=artifact_dir)
+    started = time.perf_counter()
+    model, tokenizer, loaded_name = registry.get(language)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = current_rss_mb()
+    sampling_rate = getattr(model.config, "sampling_rate", 16000)
+
+    texts = SAMPLE_TEXTS[language]
+    for _ in range(2):  # warm-up
+        synthesize_batch(model, tokenizer, texts[:1], language)
+    per_text = []
+    total_seconds = 0.0
+    total_audio = 0.0
+    for text in texts:
+        latencies = []
+        audio_seconds = 0.0
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            waveform = synthesize_batch(model, tokenizer, [text], language)[0]
+            latencies.append(time.perf_counter() - t0)
+            audio_seconds = len(waveform) / sampling_rate
+        median = statistics.median(latencies)
+        total_seconds += sum(latencies)
+        total_audio += audio_seconds * runs
+        per_text.append({
+            "chars": len(text),
+            "audio_seconds": round(audio_seconds, 3),
+            "latency_ms_p50": round(median * 1000, 1),
+            "rtf": round(median / audio_seconds, 4) if audio_seconds else None
+        })
+
+    t0 = time.perf_counter()
+    waveforms = synthesize_batch(model, tokenizer, texts, language)
+    batch_seconds = time.perf_counter() - t0
+    batch_audio = sum(len(w) for w in waveforms) / sampling_rate
+
+    return {
+        "language": language,
+        "backend": backend,
+        "backend_in_use": registry.backend_in_use.get(language),
+        "model": loaded_name,
+        "torch_threads": torch.get_num_threads(),
+        "load_seconds": round(load_seconds, 3),
+        "rss_mb_baseline": rss_baseline,
+        "rss_mb_loaded": rss_loaded,
+        "model_rss_mb": round(rss_loaded - rss_baseline, 1) if rss_loaded and rss_baseline else None,
+        "rss_mb_peak": peak_rss_mb(),
+        "rtf": round(total_seconds / total_audio, 4) if total_audio else None,
+        "batch_rtf": round(batch_seconds / batch_audio, 4) if batch_audio else None,
+        "texts": per_text
+    }
+
+
+def run_child(args, language, backend):
+    command = [sys.executable, os.path.abspath(__file__), "--child", language, backend,
+               "--runs", str(args.runs), "--threads", str(args.threads), "--artifact-dir", args.artifact_dir]
+    if args.models.get(language):
+        command += ["--model", f"{language}={args.models[language]}"]
+    completed = subprocess.run(command, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+        return {"language": language, "backend": backend, "error": error}
+    return json.loads(lines[-1])
+
+
+def print_row(result):
+    if "error" in result:
+        print(f"{result['language']:<4} {result['backend']:<12} ERROR {result['error']}", file=sys.stderr)
+        return
+    print(f"{result['language']:<4} {result['backend']:<12} {result['backend_in_use']:<12} "
+          f"{result['load_seconds']:>7.2f} {result['rtf']:>8.4f} {result['batch_rtf']:>9.4f} "
+          f"{result['model_rss_mb'] if result['model_rss_mb'] is not None else '-':>9} "
+          f"{result['rss_mb_peak'] if result['rss_mb_peak'] is not None else '-':>9}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare TTS inference backends (RTF, latency, memory)")
+    parser.add_argument("--languages", default="vi,ja")
+    parser.add_argument("--backends", default="eager,quantized,torchscript,onnx")
+    parser.add_argument("--runs", type=int, default=3, help="repetitions per sample text")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (0 = torch default)")
+    parser.add_argument("--model", action="append", default=[], metavar="LANG=NAME",
+                        help="model name or local path for a language (default: the app's candidates)")
+    parser.add_argument("--artifact-dir", default=os.getenv("TTS_ARTIFACT_DIR", "cache/tts_artifacts"))
+    parser.add_argument("--output", default=None, help="write the JSON result here (default: stdout)")
+    parser.add_argument("--child", nargs=2, metavar=("LANG", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.models = dict(item.split("=", 1) for item in args.model)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        language, backend = args.child
+        print(json.dumps(measure(language, backend, args.models.get(language), args.runs, args.threads,
+                                 args.artifact_dir), ensure_ascii=False))
+        return 0
+
+    print(f"{'lang':<4} {'backend':<12} {'in use':<12} {'load_s':>7} {'rtf':>8} {'batch_rtf':>9} "
+          f"{'model_mb':>9} {'peak_mb':>9}", file=sys.stderr)
+    results = []
+    for language in [l.strip() for l in args.languages.split(",") if l.strip()]:
+        for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            result = run_child(args, language, backend)
+            results.append(result)
+            print_row(result)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "runs": args.runs
+        },
+        "results": results
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Speculative background synthesis of translation replies"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class TTSPrefetcher:
+    """Synthesize audio that is likely to be played next on a bounded background queue.
+
+    `submit` never blocks the caller: a job is dropped when `max_pending`
+    jobs are already waiting, and a job that waited longer than `max_age`
+    seconds is skipped, so speculative work gives way under load instead of
+    slowing translations down. Each job has a Future resolving to the WAV
+    bytes (None if skipped) that real TTS requests for the same key can wait
+    on instead of synthesizing twice.
+    """
+
+    def __init__(self, synthesize, max_pending=16, workers=1, max_age=30.0):
+        self.synthesize = synthesize
+        self.max_age = max_age
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self.counts = {"queued": 0, "duplicate": 0, "dropped_full": 0, "dropped_stale": 0,
+                       "completed": 0, "failed": 0}
+
+    def submit(self, key, language, text):
+        """Queue synthesis of `text` under `key`; returns False if the job was dropped"""
+        with self._lock:
+            if key in self._pending:
+                self.counts["duplicate"] += 1
+                return True
+            future = Future()
+            try:
+                self._queue.put_nowait((key, language, text, future, time.monotonic()))
+            except queue.Full:
+                self.counts["dropped_full"] += 1
+                return False
+            self._pending[key] = future
+            self.counts["queued"] += 1
+            if not self._started:
+                # Threads start on first use so a preforking server creates them per worker
+                for i in range(self.workers):
+                    threading.Thread(target=self._run, name=f"tts-prefetch-{i}", daemon=True).start()
+                self._started = True
+        return True
+
+    def pending(self, key):
+        """Future of a queued or running job for `key`, or None"""
+        return self._pending.get(key)
+
+    def _run(self):
+        while True:
+            key, language, text, future, queued_at = self._queue.get()
+            try:
+                if time.monotonic() - queued_at > self.max_age:
+                    self._count("dropped_stale")
+                    future.set_result(None)
+                    continue
+                future.set_running_or_notify_cancel()
+                try:
+                    future.set_result(self.synthesize(language, text))
+                    self._count("completed")
+                except Exception as e:
+                    logging.warning(f"TTS prefetch {language} failed: {e}")
+                    self._count("failed")
+                    future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats.update({"pending": self._queue.qsize(), "max_pending": self._queue.maxsize,
+                      "workers": self.workers, "max_age_s": self.max_age})
+        return stats
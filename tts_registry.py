@@ -0,0 +1,128 @@
+"""Thread-safe registry of local VITS text-to-speech models, loaded once per language.
+
+torch/transformers are imported on the first model load, so processes that
+never synthesize speech (text-only workers, tools) do not pay for them.
+"""
+import logging
+import threading
+import time
+
+from metrics import TTS_MODEL_LOAD_SECONDS
+from tts_backends import build_backend
+
+# Candidate models per language, tried in order until one loads
+TTS_MODEL_CANDIDATES = {
+    "vi": ["facebook/mms-tts-vie"],
+    "ja": ["facebook/mms-tts-jpn", "espnet/kan-bayashi_ljspeech_vits"]
+}
+
+
+class TTSModelUnavailable(Exception):
+    """Raised when no model could be loaded for a language"""
+
+
+class TTSModelRegistry:
+    """Load each language's model at most once and share it across requests.
+
+    Loading is guarded by a per-language lock so concurrent first requests
+    wait for a single load instead of each reading the weights from disk.
+    A failed load is remembered for `retry_after` seconds before retrying.
+    `backends` maps a language to an inference backend (see tts_backends);
+    languages not listed use `default_backend`.
+    """
+
+    def __init__(self, candidates=None, retry_after=300, backends=None, default_backend="eager",
+                 artifact_dir="cache/tts_artifacts"):
+        self.candidates = candidates or TTS_MODEL_CANDIDATES
+        self.retry_after = retry_after
+        self.backends = backends or {}
+        self.default_backend = default_backend
+        self.artifact_dir = artifact_dir
+        self.backend_in_use = {}
+        self._entries = {}
+        self._failures = {}
+        self._locks = {language: threading.Lock() for language in self.candidates}
+        self._import_lock = threading.Lock()
+        self.import_seconds = None
+        self.load_seconds = {}
+
+    def get(self, language):
+        """Return (model, tokenizer, model_name) for a language, loading it on first use"""
+        entry = self._entries.get(language)
+        if entry is not None:
+            return entry
+        if language not in self._locks:
+            raise TTSModelUnavailable(f"Unsupported TTS language: {language}")
+
+        with self._locks[language]:
+            # Another thread may have finished loading while we waited
+            entry = self._entries.get(language)
+            if entry is not None:
+                return entry
+            failed_at = self._failures.get(language)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_after:
+                raise TTSModelUnavailable(f"TTS model for {language} failed to load recently")
+
+            entry = self._load(language)
+            if entry is None:
+                self._failures[language] = time.monotonic()
+                raise TTSModelUnavailable(f"No TTS model could be loaded for {language}")
+            self._failures.pop(language, None)
+            self._entries[language] = entry
+            return entry
+
+    def peek(self, language):
+        """Return the loaded (model, tokenizer, model_name) for a language, or None; never loads"""
+        return self._entries.get(language)
+
+    def _import_transformers(self):
+        """Import transformers (and torch) once, timing the import separately from model loads"""
+        with self._import_lock:
+            started = time.monotonic()
+            from transformers import VitsModel, AutoTokenizer
+            if self.import_seconds is None:
+                self.import_seconds = round(time.monotonic() - started, 3)
+                logging.info(f"torch/transformers imported in {self.import_seconds:.1f}s")
+        return VitsModel, AutoTokenizer
+
+    def _load(self, language):
+        VitsModel, AutoTokenizer = self._import_transformers()
+        for model_name in self.candidates[language]:
+            try:
+                started = time.monotonic()
+                logging.info(f"Loading TTS model {language}: {model_name}")
+                model = VitsModel.from_pretrained(model_name)
+                model.eval()
+                tokenizer = AutoTokenizer.from_pretrained(model_name)
+                model, backend = build_backend(model, tokenizer, model_name,
+                                               self.backends.get(language, self.default_backend), self.artifact_dir)
+                elapsed = time.monotonic() - started
+                self.load_seconds[language] = round(elapsed, 3)
+                self.backend_in_use[language] = backend
+                TTS_MODEL_LOAD_SECONDS.set(round(elapsed, 3), language=language, model=model_name)
+                logging.info(f"TTS model {model_name} ({backend}) loaded in {elapsed:.1f}s")
+                return model, tokenizer, model_name
+            except Exception as e:
+                logging.error(f"TTS model {model_name} failed to load: {e}")
+        return None
+
+    def preload(self, languages=None):
+        """Eagerly load models (all languages by default), ignoring failures"""
+        for language in languages or list(self.candidates):
+            try:
+                self.get(language)
+            except TTSModelUnavailable as e:
+                logging.warning(str(e))
+
+    def preload_in_background(self, languages=None):
+        """Start preloading on a daemon thread so startup is not blocked"""
+        thread = threading.Thread(target=self.preload, args=(languages,), name="tts-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Loaded model name per language (None if not loaded)"""
+        return {
+            language: (self._entries[language][2] if language in self._entries else None)
+            for language in self.candidates
+        }
@@ -0,0 +1,80 @@
+"""VITS inference and text chunking helpers shared by the TTS endpoints.
+
+torch is imported inside synthesize_batch so importing this module (and the
+app) stays cheap for text-only workers. Encoding lives in audio_encoding.
+"""
+import re
+
+from metrics import TTS_STAGE_SECONDS, BATCH_SIZE
+
+DEFAULT_SAMPLE_RATE = 16000  # MMS VITS models; used only if a model config has no sampling_rate
+
+# Split points keep the punctuation with the preceding chunk. Latin/Vietnamese
+# punctuation needs trailing whitespace (so "3.5" stays intact); Japanese does not.
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…])(?=\s)|(?<=[。！？])')
+_CLAUSE_SPLIT_RE = re.compile(r'(?<=[,;:])(?=\s)|(?<=[、，；])')
+
+
+def synthesize_batch(model, tokenizer, texts, language="unknown"):
+    """Synthesize several texts in one padded forward pass.
+
+    Returns one float waveform (numpy array) per text, trimmed to that
+    item's own length using the model's predicted sequence lengths.
+    `language` only labels the stage metrics.
+    """
+    import torch
+
+    BATCH_SIZE.observe(len(texts), kind="tts_forward")
+    with TTS_STAGE_SECONDS.time(stage="tokenize", language=language):
+        inputs = tokenizer(texts, return_tensors="pt", padding=True)
+    with TTS_STAGE_SECONDS.time(stage="inference", language=language), torch.inference_mode():
+        output = model(**inputs)
+    waveforms = output.waveform.cpu().numpy()
+    lengths = output.sequence_lengths.tolist()
+    return [waveforms[i, :int(lengths[i])] for i in range(len(texts))]
+
+
+def model_sample_rate(model):
+    """Sample rate of the waveforms a model produces"""
+    return int(getattr(getattr(model, "config", None), "sampling_rate", None) or DEFAULT_SAMPLE_RATE)
+
+
+def split_sentences(text, max_chars=120):
+    """Split text into sentence-sized chunks for progressive synthesis.
+
+    Sentences longer than `max_chars` are split further at clause
+    punctuation (commas, 、) and, as a last resort, at whitespace.
+    """
+    chunks = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text):
+        if not sentence.strip():
+            continue
+        if len(sentence.strip()) <= max_chars:
+            chunks.append(sentence.strip())
+            continue
+
+        # Greedily pack clauses back together up to max_chars
+        current = ""
+        for clause in _CLAUSE_SPLIT_RE.split(sentence):
+            if current.strip() and len(current.strip()) + len(clause) > max_chars:
+                chunks.extend(_hard_wrap(current.strip(), max_chars))
+                current = clause
+            else:
+                current += clause
+        if current.strip():
+            chunks.extend(_hard_wrap(current.strip(), max_chars))
+    return chunks
+
+
+def _hard_wrap(piece, max_chars):
+    """Cut a piece without usable punctuation at whitespace (or mid-text for Japanese)"""
+    pieces = []
+    while len(piece) > max_chars:
+        cut = piece.rfind(" ", 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(piece[:cut].strip())
+        piece = piece[cut:].strip()
+    if piece:
+        pieces.append(piece)
+    return pieces
@@ -0,0 +1,503 @@
+"""OpenAI client on a tuned httpx pool, plus the retry/breaker/limiter policy shared by every upstream call"""
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+from metrics import LLM_SECONDS
+
+# Status codes worth retrying; other 4xx are caller/config errors
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+def create_openai_client(base_url, api_key, max_connections=64, max_keepalive=32, keepalive_expiry=60.0,
+                         connect_timeout=5.0, http2=False, async_client=False):
+    """OpenAI (or AsyncOpenAI) client with an explicitly sized connection pool.
+
+    The SDK's own retries are disabled; callers go through RetryPolicy so
+    every attempt is visible and counted once.
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logging.warning("OPENAI_HTTP2 requires `pip install httpx[http2]`; using HTTP/1.1")
+            http2 = False
+    options = {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        "timeout": httpx.Timeout(60.0, connect=connect_timeout),
+        "http2": http2
+    }
+    if async_client:
+        return openai.AsyncOpenAI(base_url=base_url, api_key=api_key, max_retries=0,
+                                  http_client=httpx.AsyncClient(**options))
+    return openai.OpenAI(base_url=base_url, api_key=api_key, max_retries=0,
+                         http_client=httpx.Client(**options))
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling upstream when the breaker is open or the limiter is saturated"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised instead of starting another attempt once a call's overall deadline has passed"""
+
+
+def retry_after_seconds(error):
+    """Server-requested delay from retry-after-ms / Retry-After headers, or None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """429/5xx (except exhausted quota) and failed connections; not timeouts"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        if getattr(error, "code", None) == "insufficient_quota":
+            return False
+        return status >= 500 or status in RETRYABLE_STATUS
+    return isinstance(error, openai.APIConnectionError) and not isinstance(error, openai.APITimeoutError)
+
+
+def is_upstream_failure(error):
+    """Errors that mean the upstream is unhealthy (as opposed to a bad request)"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(error, openai.APIConnectionError)
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive upstream failures.
+
+    While open every call is refused for `reset_timeout` seconds; then one
+    probe call is let through (half-open) and its outcome closes or reopens
+    the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        """True while calls are being refused (not yet due for a probe)"""
+        return self.retry_in() > 0
+
+    def retry_in(self):
+        """Seconds until the breaker lets a probe through (0 when not open)"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def release_probe(self):
+        """Let another probe through after one ended without an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            tripped = self.state == "closed" and self.consecutive_failures >= self.failure_threshold
+            if self.state == "half_open" or tripped:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                logging.warning(f"Upstream circuit breaker opened after {self.consecutive_failures} failures")
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_in_s": round(self.retry_in(), 1)
+        }
+
+
+class AdaptiveLimiter:
+    """AIMD limit on concurrent upstream calls.
+
+    Each fast success raises the limit by 1/limit (about +1 per round trip);
+    an upstream failure or a call slower than `latency_target_ms` multiplies
+    it by `backoff` (at most once per second, so one burst of failures does
+    not collapse it to the minimum). Callers wait up to `queue_timeout`
+    seconds for a slot before being shed.
+    """
+
+    def __init__(self, initial=32, min_limit=4, max_limit=64, latency_target_ms=8000, backoff=0.7,
+                 queue_timeout=2.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_ms = latency_target_ms
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._async_waiters = []
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block up to queue_timeout for a slot; False if none freed up"""
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self):
+        """acquire() for the event loop: waits on an Event that release() sets"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        while True:
+            waiter = (loop, asyncio.Event())
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return True
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._async_waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+                    else:
+                        # Cancelled after release() picked us: pass the freed slot on
+                        self._wake_async_waiter()
+                raise
+            with self._cond:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+
+    def _wake_async_waiter(self):
+        """Signal the longest-waiting acquire_async() (caller holds the lock)"""
+        while self._async_waiters:
+            loop, event = self._async_waiters.pop(0)
+            try:
+                # release() may run on a worker thread, not the waiter's loop
+                loop.call_soon_threadsafe(event.set)
+                return
+            except RuntimeError:
+                continue  # that loop is closed
+
+    def release(self, latency_ms=None, failed=False):
+        """Free a slot and adapt the limit (no adaptation when latency_ms is None)"""
+        with self._cond:
+            self.in_flight -= 1
+            if latency_ms is not None:
+                if failed or latency_ms > self.latency_target_ms:
+                    now = time.monotonic()
+                    if now - self._last_decrease >= 1.0:
+                        self.limit = max(self.min_limit, self.limit * self.backoff)
+                        self._last_decrease = now
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify()
+            self._wake_async_waiter()
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "min": self.min_limit,
+            "max": self.max_limit
+        }
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honoring Retry-After when the server sends it.
+
+    A Retry-After longer than `max_delay` ends the retries instead of
+    holding the request. Every attempt passes the circuit breaker first (an
+    open breaker refuses at once, without queueing for the limiter) and then
+    takes a limiter slot (UpstreamUnavailable when refused); its latency and
+    outcome go to `stats`.
+
+    With `deadline` (a time.monotonic() value) the whole call, retries
+    included, fits in one budget: each attempt's `timeout` is capped at the
+    time left and no retry is slept for or started past the deadline.
+
+    With stream=True only opening the stream is retried. The result is
+    wrapped so the limiter slot is held, and latency measured, until the
+    stream is exhausted, fails or is closed.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, stats=None, breaker=None, limiter=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = stats
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def next_delay(self, attempt, error):
+        """Seconds to wait before retrying after `attempt` (0-based) failed, or None to give up"""
+        if attempt + 1 >= self.max_attempts or not is_retryable(error):
+            return None
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, label="upstream", deadline=None, **kwargs):
+        """Call fn(**kwargs), retrying retryable errors"""
+        attempt = 0
+        while True:
+            self._budget(deadline, kwargs)
+            self._admit_breaker()
+            self._admit(self.limiter.acquire() if self.limiter else True)
+            start = time.monotonic()
+            try:
+                result = fn(**kwargs)
+            except Exception as e:
+                delay = self._failed(label, attempt, start, e, deadline)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                self._abandoned()
+                raise
+            if kwargs.get("stream"):
+                return self._held_stream(result, label, start)
+            self._succeeded(label, start)
+            return result
+
+    async def acall(self, fn, label="upstream", deadline=None, **kwargs):
+        """Async counterpart of call() for AsyncOpenAI methods"""
+        attempt = 0
+        while True:
+            self._budget(deadline, kwargs)
+            self._admit_breaker()
+            try:
+                acquired = await self.limiter.acquire_async() if self.limiter else True
+            except BaseException:
+                self._release_probe()
+                raise
+            self._admit(acquired)
+            start = time.monotonic()
+            try:
+                result = await fn(**kwargs)
+            except Exception as e:
+                delay = self._failed(label, attempt, start, e, deadline)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (e.g. a batch item timeout): free the slot, learn nothing
+                self._abandoned()
+                raise
+            if kwargs.get("stream"):
+                return self._held_async_stream(result, label, start)
+            self._succeeded(label, start)
+            return result
+
+    def _held_stream(self, stream, label, start):
+        """Yield the chunks of `stream`, settling its attempt once it ends"""
+        try:
+            for chunk in stream:
+                yield chunk
+        except Exception as e:
+            self._record_failure(label, start, e)
+            raise
+        except BaseException:
+            # Closed early (e.g. the client went away): free the slot, learn nothing
+            self._abandoned()
+            raise
+        else:
+            self._succeeded(label, start)
+        finally:
+            stream.close()
+
+    async def _held_async_stream(self, stream, label, start):
+        """Async counterpart of _held_stream()"""
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            self._record_failure(label, start, e)
+            raise
+        except BaseException:
+            self._abandoned()
+            raise
+        else:
+            self._succeeded(label, start)
+        finally:
+            await stream.close()
+
+    @staticmethod
+    def _budget(deadline, kwargs):
+        """Cap the next attempt's timeout at the time left before `deadline`"""
+        if deadline is None:
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Upstream call deadline exceeded")
+        if kwargs.get("timeout") is None or kwargs["timeout"] > remaining:
+            kwargs["timeout"] = remaining
+
+    def _admit_breaker(self):
+        """Refuse the attempt while the breaker is open, before waiting for a limiter slot"""
+        if self.breaker is not None and not self.breaker.allow():
+            raise UpstreamUnavailable("Upstream circuit breaker is open")
+
+    def _admit(self, acquired):
+        """Check the limiter slot outcome of an attempt the breaker let through"""
+        if not acquired:
+            self._release_probe()
+            raise UpstreamUnavailable("Upstream concurrency limit reached")
+
+    def _release_probe(self):
+        if self.breaker is not None:
+            self.breaker.release_probe()
+
+    def _abandoned(self):
+        if self.limiter is not None:
+            self.limiter.release()
+        self._release_probe()
+
+    def _succeeded(self, label, start):
+        latency_ms = (time.monotonic() - start) * 1000
+        if self.limiter is not None:
+            self.limiter.release(latency_ms)
+        if self.breaker is not None:
+            self.breaker.record_success()
+        if self.stats is not None:
+            self.stats.record(label, latency_ms, "ok")
+
+    def _failed(self, label, attempt, start, error, deadline=None):
+        """Record a failed attempt; re-raise it unless another attempt should follow"""
+        self._record_failure(label, start, error)
+        delay = self.next_delay(attempt, error)
+        if delay is None or (deadline is not None and time.monotonic() + delay >= deadline):
+            raise error
+        if self.stats is not None:
+            self.stats.record_retry(label)
+        logging.warning(f"{label} retry attempt {attempt + 1} in {delay:.2f}s due to: {error}")
+        return delay
+
+    def _record_failure(self, label, start, error):
+        latency_ms = (time.monotonic() - start) * 1000
+        failed = is_upstream_failure(error)
+        if self.limiter is not None:
+            self.limiter.release(latency_ms, failed)
+        if self.breaker is not None:
+            # A rejected request (4xx) still proves the upstream is answering
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        if self.stats is not None:
+            self.stats.record(label, latency_ms, type(error).__name__)
+
+
+class UpstreamStats:
+    """Per-call-type attempt counts and latencies (ms) of upstream requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _entry(self, label):
+        return self._calls.setdefault(label, {
+            "attempts": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0
+        })
+
+    def record(self, label, latency_ms, outcome):
+        LLM_SECONDS.observe(latency_ms / 1000, call=label, outcome=outcome)
+        with self._lock:
+            entry = self._entry(label)
+            entry["attempts"] += 1
+            if outcome != "ok":
+                entry["errors"] += 1
+            entry["total_ms"] += latency_ms
+            entry["max_ms"] = max(entry["max_ms"], latency_ms)
+            entry["last_ms"] = latency_ms
+
+    def record_retry(self, label):
+        with self._lock:
+            self._entry(label)["retries"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                label: {
+                    "attempts": entry["attempts"],
+                    "errors": entry["errors"],
+                    "retries": entry["retries"],
+                    "avg_ms": round(entry["total_ms"] / entry["attempts"], 1) if entry["attempts"] else 0.0,
+                    "max_ms": round(entry["max_ms"], 1),
+                    "last_ms": round(entry["last_ms"], 1)
+                }
+                for label, entry in self._calls.items()
+            }